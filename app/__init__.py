@@ -19,13 +19,21 @@ def create_app(config_name='development'):
     
     with app.app_context():
         try:
+            # SQLite PRAGMAs on every connection, registered before the first one is opened
+            from app.sqlite import init_sqlite
+            init_sqlite(app)
+            
             # Import models
             from app.models import (User, Worker, WorkShift, ProductType, Production, 
                                     Sales, FuelLog, Medicine, Fertilizer, Consumption, Report,
-                                    Attendance, Accounting, Role)
+                                    Attendance, Accounting, Role, WorkerLedger,
+                                    DailyRollup, MonthlyRollup, SyncTombstone, SyncReceipt,
+                                    SchemaVersion)
             
-            # Create tables
-            db.create_all()
+            # Create tables and missing columns only when the recorded schema version differs
+            if app.config.get('SCHEMA_AUTO_MIGRATE', True):
+                from app.services import ensure_schema
+                ensure_schema()
             
             # Register blueprints
             from app.routes import (main_bp, auth_bp, workers_bp, production_bp, 
@@ -45,8 +53,23 @@ def create_app(config_name='development'):
             app.register_blueprint(attendance_bp)
             app.register_blueprint(accounting_bp)
             
+            from app.exports import exports_bp
+            app.register_blueprint(exports_bp)
+            from app.imports import imports_bp
+            app.register_blueprint(imports_bp)
+            from app.api import api_bp
+            app.register_blueprint(api_bp)
+            from app.report_jobs import report_jobs_bp
+            app.register_blueprint(report_jobs_bp)
+            
             # Inject context
             app.context_processor(inject_now)
+            
+            # Query count assertion for tests, request timing and metrics for production
+            from app.instrumentation import init_query_guard, init_request_timing, init_metrics
+            init_query_guard(app)
+            init_request_timing(app)
+            init_metrics(app)
         except Exception as e:
             print(f"Error initializing app: {e}")
     
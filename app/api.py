@@ -0,0 +1,251 @@
+"""
+واجهة JSON للأجهزة اللوحية والعملاء الآليين
+Versioned read-only JSON API (``/api/v1``) over the farm models.
+
+    GET /api/v1/                        available resources and their fields
+    GET /api/v1/<resource>              keyset-paginated list
+    GET /api/v1/<resource>/<id>         single record
+    GET /api/v1/sync?token=...          rows changed/deleted since the token
+    POST /api/v1/sync                   queued device writes (idempotent)
+
+List parameters: ``fields=id,date,hours`` (sparse fieldset, selected in SQL),
+``cursor``/``per_page`` (keyset pagination), any filter declared for the
+resource (``worker_id=3``, ``location=جبل``) and the report period parameters
+(``period``, ``year``, ``month``, ``start_date``, ``end_date``) on the date
+column. Responses carry a weak ETag (``If-None-Match`` → 304) and are gzip or
+brotli compressed when the client accepts it.
+"""
+import gzip
+import json
+from datetime import date, datetime, time
+from flask import Blueprint, Response, abort, current_app, request, url_for
+from flask_login import current_user
+from sqlalchemy import Date, Integer
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import (Worker, WorkShift, Production, Sales, FuelLog, Medicine, Fertilizer,
+                        Consumption, Attendance, Accounting)
+from app.pagination import keyset_paginate
+from app.periods import period_from_request
+from app.routes import require_permission
+from app.sync import decode_token, encode_token, pull_changes, push_changes
+
+# brotli اختياري: بدونه يُستخدم gzip فقط
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# لا فائدة من ضغط الردود الصغيرة
+COMPRESS_MIN_BYTES = 512
+
+# الموارد التي يمكن للأجهزة إرسالها -> الصلاحية المطلوبة
+PUSH_PERMISSIONS = {
+    'shifts': 'add_workers',
+    'attendance': 'add_attendance',
+    'consumption': 'add_consumption'
+}
+
+_resources = {}
+
+class Resource:
+    """A model exposed through the API: its permission, sort key and allowed filters."""
+
+    def __init__(self, name, model, permission, sort='date', filters=()):
+        self.name = name
+        self.model = model
+        self.permission = permission
+        self.columns = {column.key: getattr(model, column.key) for column in model.__table__.columns}
+        self.sort = self.columns[sort]
+        self.filters = {key: self.columns[key] for key in filters}
+        self.date_column = self.columns.get('date')
+
+    def select(self, fields):
+        """الأعمدة المطلوبة فقط، مع المعرف ومفتاح الترتيب دائماً (لازمين للمؤشر)"""
+        keys = ['id'] + [key for key in fields if key != 'id']
+        if self.sort.key not in keys:
+            keys.append(self.sort.key)
+        return db.session.query(*(self.columns[key] for key in keys))
+
+def resource(name, model, permission, **kwargs):
+    _resources[name] = Resource(name, model, permission, **kwargs)
+
+resource('workers', Worker, 'view_workers', sort='id', filters=('phone',))
+resource('shifts', WorkShift, 'view_workers',
+         filters=('worker_id', 'shift_type', 'location', 'product_type_id', 'work_type', 'date'))
+resource('attendance', Attendance, 'view_attendance', filters=('worker_id', 'status', 'date'))
+resource('production', Production, 'view_production', filters=('product_type_id', 'location', 'date'))
+resource('sales', Sales, 'view_sales', filters=('product_type_id', 'date'))
+resource('fuel', FuelLog, 'view_fuel', filters=('fuel_type', 'date'))
+resource('medicines', Medicine, 'view_medicines', filters=('name', 'date'))
+resource('fertilizers', Fertilizer, 'view_consumption', filters=('name', 'date'))
+resource('consumption', Consumption, 'view_consumption',
+         filters=('consumption_type', 'fuel_id', 'medicine_id', 'fertilizer_id', 'date'))
+resource('accounting', Accounting, 'view_accounting',
+         filters=('transaction_type', 'category', 'worker_id', 'date'))
+
+# ==================== Serialization ====================
+def _value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, time):
+        return value.strftime('%H:%M')
+    return value
+
+def _record(row, fields):
+    mapping = row._mapping
+    return {key: _value(mapping[key]) for key in fields}
+
+def _error(status, message):
+    return json_response({'error': message}, status=status)
+
+def json_response(payload, status=200):
+    """JSON مضغوط بدون مسافات + ETag ضعيف، ويعيد 304 إذا لم يتغير المحتوى"""
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+    response = Response(body, status=status, mimetype='application/json')
+    if status == 200:
+        response.add_etag(weak=True)
+        response.make_conditional(request)
+    return response
+
+def _parse_filter(column, raw):
+    if isinstance(column.type, Integer):
+        return int(raw)
+    if isinstance(column.type, Date):
+        return date.fromisoformat(raw)
+    return raw
+
+def _requested_fields(res):
+    raw = request.args.get('fields', '')
+    if not raw:
+        return list(res.columns)
+    fields = list(dict.fromkeys(field.strip() for field in raw.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in res.columns]
+    if unknown:
+        abort(_error(400, f'unknown fields: {", ".join(unknown)}'))
+    return ['id'] + [field for field in fields if field != 'id']
+
+def _get_resource(name):
+    res = _resources.get(name)
+    if res is None:
+        abort(_error(404, f'unknown resource: {name}'))
+    return res
+
+# ==================== Routes ====================
+@api_bp.before_request
+def authenticate():
+    # جلسة تسجيل الدخول نفسها، لكن 401 بدلاً من التحويل إلى صفحة الدخول
+    if not current_user.is_authenticated:
+        return _error(401, 'authentication required')
+
+@api_bp.route('/')
+def index():
+    return json_response({
+        'version': 1,
+        'resources': {name: {'url': url_for('api.list_records', name=name),
+                             'fields': list(res.columns), 'filters': list(res.filters)}
+                      for name, res in _resources.items()}
+    })
+
+@api_bp.route('/<name>')
+def list_records(name):
+    res = _get_resource(name)
+
+    @require_permission(res.permission)
+    def view():
+        fields = _requested_fields(res)
+        query = res.select(fields)
+        for key, column in res.filters.items():
+            if key in request.args:
+                try:
+                    query = query.filter(column == _parse_filter(column, request.args[key]))
+                except ValueError:
+                    return _error(400, f'invalid value for {key}')
+        if res.date_column is not None:
+            query = period_from_request().apply(query, res.date_column)
+
+        page = keyset_paginate(query, res.sort, res.columns['id'])
+        return json_response({
+            'data': [_record(row, fields) for row in page.items],
+            'next_cursor': page.next_cursor,
+            'prev_cursor': page.prev_cursor,
+            'per_page': page.per_page
+        })
+    return view()
+
+@api_bp.route('/<name>/<int:record_id>')
+def get_record(name, record_id):
+    res = _get_resource(name)
+
+    @require_permission(res.permission)
+    def view():
+        fields = _requested_fields(res)
+        row = res.select(fields).filter(res.columns['id'] == record_id).first()
+        if row is None:
+            return _error(404, 'not found')
+        return json_response({'data': _record(row, fields)})
+    return view()
+
+@api_bp.route('/sync')
+def sync_pull():
+    """Changes since ``token`` for ``resources`` (default: every resource the user may view)."""
+    readable = {name: res for name, res in _resources.items() if current_user.has_permission(res.permission)}
+    requested = [name.strip() for name in request.args.get('resources', '').split(',') if name.strip()]
+    for name in requested:
+        _get_resource(name)
+        if name not in readable:
+            return _error(403, f'permission required: {_resources[name].permission}')
+    if requested:
+        readable = {name: readable[name] for name in requested}
+    try:
+        marks = decode_token(request.args.get('token', ''))
+    except ValueError as e:
+        return _error(400, str(e))
+    page_size = current_app.config.get('SYNC_PAGE_SIZE', 1000)
+    limit = max(1, min(request.args.get('limit', page_size, type=int), page_size))
+
+    changes, deleted, marks, has_more = pull_changes(readable, marks, limit)
+    return json_response({
+        'changes': {name: [_record(row, readable[name].columns) for row in rows] for name, rows in changes.items()},
+        'deleted': deleted,
+        'token': encode_token(marks),
+        'has_more': has_more
+    })
+
+@api_bp.route('/sync', methods=['POST'])
+def sync_push():
+    """``{"changes": [{"client_id", "resource", "data"}, ...]}`` → one result per change."""
+    payload = request.get_json(silent=True) or {}
+    changes = payload.get('changes')
+    if not isinstance(changes, list) or not all(isinstance(change, dict) for change in changes):
+        return _error(400, 'expected {"changes": [...]}')
+    if len(changes) > current_app.config.get('SYNC_MAX_PUSH', 500):
+        return _error(413, 'too many changes in one request')
+    allowed = {name for name, permission in PUSH_PERMISSIONS.items() if current_user.has_permission(permission)}
+    try:
+        results = push_changes(changes, current_user, allowed)
+        db.session.commit()
+    except IntegrityError:
+        # كاتب متزامن سبق هذه الدفعة؛ إعادة الإرسال آمنة
+        db.session.rollback()
+        return _error(409, 'conflicting concurrent write, resend the same batch')
+    return json_response({'results': results})
+
+@api_bp.after_request
+def compress(response):
+    """ضغط br أو gzip حسب Accept-Encoding"""
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.content_length is None or response.content_length < COMPRESS_MIN_BYTES):
+        return response
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        response.set_data(brotli.compress(response.get_data(), quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(response.get_data(), compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
@@ -0,0 +1,263 @@
+"""
+تصدير القوائم إلى CSV و XLSX بشكل متدفق
+Streaming CSV/XLSX exports: rows are read with ``yield_per`` and written out
+as they arrive, so memory use does not grow with the number of rows. Report
+datasets are already grouped (one row per worker or per period and product)
+and are passed as lists.
+"""
+import csv
+import io
+import os
+import tempfile
+from datetime import date, datetime, time
+from flask import Blueprint, Response, abort, flash, redirect, request, stream_with_context, url_for
+from flask_login import login_required
+from sqlalchemy import func
+from app import db
+from app.models import (Worker, WorkShift, ProductType, Production, Sales, FuelLog, Medicine, Fertilizer,
+                        Consumption, Attendance, Accounting)
+from app.periods import period_from_request
+from app.routes import require_permission, workers_report_context
+from app.services import get_worker_balances, get_rollups, GRANULARITIES, PRODUCTION, SALES
+
+# XlsxWriter اختياري: بدونه يبقى التصدير بصيغة CSV فقط
+try:
+    import xlsxwriter
+except ImportError:  # pragma: no cover
+    xlsxwriter = None
+
+exports_bp = Blueprint('exports', __name__, url_prefix='/export')
+
+YIELD_PER = 1000
+CSV_FLUSH_BYTES = 64 * 1024
+FILE_CHUNK = 64 * 1024
+# نص يبدأ بهذه الأحرف ينفذه Excel كصيغة (CSV injection)
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+_datasets = {}
+
+def dataset(name, permission):
+    """تسجيل مصدر تصدير: دالة تعيد (العناوين، الاستعلام)"""
+    def decorator(build):
+        _datasets[name] = (permission, build)
+        return build
+    return decorator
+
+# ==================== Datasets ====================
+def _granularity():
+    granularity = request.args.get('granularity', 'month')
+    return granularity if granularity in GRANULARITIES else 'month'
+
+# نفس عناوين الاستيراد (الاسم، الهاتف، سعر الساعة) ليُعاد استيراد الملف كما هو
+ACCOUNT_HEADERS = ['#', 'الاسم', 'الهاتف', 'سعر الساعة ($)', 'سعر الساعة (ل.ل)', 'الساعات', 'الأرباح ($)',
+                   'الأرباح (ل.ل)', 'السلفات ($)', 'السلفات (ل.ل)', 'الرصيد ($)', 'الرصيد (ل.ل)']
+
+def _account_rows(accounts):
+    return [[a['worker'].id, a['worker'].name, a['worker'].phone, a['hourly_rate_usd'], a['hourly_rate_lbp'],
+             a['total_hours'], a['total_earnings_usd'], a['total_earnings_lbp'], a['total_advances_usd'],
+             a['total_advances_lbp'], a['balance_usd'], a['balance_lbp']] for a in accounts]
+
+@dataset('workers', 'view_workers')
+def _workers(period):
+    accounts, _ = get_worker_balances()
+    return ACCOUNT_HEADERS, _account_rows(accounts)
+
+@dataset('workers_report', 'view_reports')
+def _workers_report(period):
+    return ACCOUNT_HEADERS, _account_rows(workers_report_context(period, _granularity())['workers_accounts'])
+
+@dataset('production_report', 'view_reports')
+def _production_report(period):
+    rows = [[row['period'], row['product_name'], row['category'], row['location'], row['quantity'],
+             row['record_count']] for row in get_rollups(PRODUCTION, period.start, period.end, _granularity())]
+    return ['الفترة', 'المنتج', 'التصنيف', 'الموقع', 'الكمية', 'عدد السجلات'], rows
+
+@dataset('sales_report', 'view_reports')
+def _sales_report(period):
+    rows = [[row['period'], row['product_name'], row['category'], row['quantity'], row['revenue_usd'],
+             row['revenue_lbp'], row['record_count']]
+            for row in get_rollups(SALES, period.start, period.end, _granularity())]
+    return ['الفترة', 'المنتج', 'التصنيف', 'الكمية', 'الإيراد ($)', 'الإيراد (ل.ل)', 'عدد السجلات'], rows
+
+@dataset('accounting', 'view_accounting')
+def _accounting(period):
+    query = db.session.query(
+        Accounting.id, Accounting.date, Accounting.transaction_type, Accounting.category, Worker.name,
+        Accounting.description, Accounting.amount_usd, Accounting.amount_lbp, Accounting.notes
+    ).outerjoin(Worker, Worker.id == Accounting.worker_id)
+    if request.args.get('type'):
+        query = query.filter(Accounting.transaction_type == request.args['type'])
+    if request.args.get('category'):
+        query = query.filter(Accounting.category == request.args['category'])
+    headers = ['#', 'التاريخ', 'النوع', 'الفئة', 'العامل', 'الوصف', 'المبلغ ($)', 'المبلغ (ل.ل)', 'ملاحظات']
+    return headers, period.apply(query, Accounting.date).order_by(Accounting.date, Accounting.id)
+
+@dataset('attendance', 'view_attendance')
+def _attendance(period):
+    query = db.session.query(
+        Attendance.id, Attendance.date, Worker.name, Attendance.status, Attendance.check_in_time,
+        Attendance.check_out_time, Attendance.hours_worked, Attendance.notes
+    ).join(Worker, Worker.id == Attendance.worker_id)
+    if request.args.get('worker'):
+        query = query.filter(Worker.name.ilike(f"%{request.args['worker']}%"))
+    if request.args.get('date'):
+        try:
+            query = query.filter(Attendance.date == datetime.strptime(request.args['date'], '%Y-%m-%d').date())
+        except ValueError:
+            pass
+    headers = ['#', 'التاريخ', 'العامل', 'الحالة', 'وقت الحضور', 'وقت المغادرة', 'الساعات', 'ملاحظات']
+    return headers, period.apply(query, Attendance.date).order_by(Attendance.date, Attendance.id)
+
+@dataset('shifts', 'view_workers')
+def _shifts(period):
+    query = db.session.query(
+        WorkShift.id, WorkShift.date, Worker.name, WorkShift.shift_type, WorkShift.location,
+        ProductType.name, WorkShift.work_type, WorkShift.hours, WorkShift.notes
+    ).join(Worker, Worker.id == WorkShift.worker_id).outerjoin(
+        ProductType, ProductType.id == WorkShift.product_type_id)
+    worker_id = request.args.get('worker_id', type=int)
+    if worker_id:
+        query = query.filter(WorkShift.worker_id == worker_id)
+    headers = ['#', 'التاريخ', 'العامل', 'النوبة', 'الموقع', 'المنتج', 'نوع العمل', 'الساعات', 'ملاحظات']
+    return headers, period.apply(query, WorkShift.date).order_by(WorkShift.date, WorkShift.id)
+
+@dataset('production', 'view_production')
+def _production(period):
+    query = db.session.query(
+        Production.id, Production.date, ProductType.name, ProductType.category, Production.location,
+        Production.quantity, Production.unit, Production.notes
+    ).join(ProductType, ProductType.id == Production.product_type_id)
+    headers = ['#', 'التاريخ', 'المنتج', 'التصنيف', 'الموقع', 'الكمية', 'الوحدة', 'ملاحظات']
+    return headers, period.apply(query, Production.date).order_by(Production.date, Production.id)
+
+@dataset('sales', 'view_sales')
+def _sales(period):
+    query = db.session.query(
+        Sales.id, Sales.date, ProductType.name, Sales.quantity, Sales.unit, Sales.price_per_unit_usd,
+        Sales.price_per_unit_lbp, Sales.total_usd, Sales.total_lbp, Sales.notes
+    ).join(ProductType, ProductType.id == Sales.product_type_id)
+    headers = ['#', 'التاريخ', 'المنتج', 'الكمية', 'الوحدة', 'السعر ($)', 'السعر (ل.ل)',
+               'الإجمالي ($)', 'الإجمالي (ل.ل)', 'ملاحظات']
+    return headers, period.apply(query, Sales.date).order_by(Sales.date, Sales.id)
+
+@dataset('fuel', 'view_fuel')
+def _fuel(period):
+    query = db.session.query(
+        FuelLog.id, FuelLog.date, FuelLog.fuel_type, FuelLog.liters, FuelLog.quantity_on_hand,
+        FuelLog.price_per_liter_usd, FuelLog.price_per_liter_lbp, FuelLog.total_usd, FuelLog.total_lbp,
+        FuelLog.notes
+    )
+    headers = ['#', 'التاريخ', 'نوع الوقود', 'الكمية (لتر)', 'المتبقي (لتر)', 'السعر/لتر ($)',
+               'السعر/لتر (ل.ل)', 'الإجمالي ($)', 'الإجمالي (ل.ل)', 'ملاحظات']
+    return headers, period.apply(query, FuelLog.date).order_by(FuelLog.date, FuelLog.id)
+
+@dataset('medicines', 'view_medicines')
+def _medicines(period):
+    query = db.session.query(
+        Medicine.id, Medicine.date, Medicine.name, Medicine.quantity, Medicine.quantity_on_hand,
+        Medicine.unit, Medicine.price_usd, Medicine.price_lbp, Medicine.notes
+    )
+    headers = ['#', 'التاريخ', 'الاسم', 'الكمية', 'المتبقي', 'الوحدة', 'السعر ($)', 'السعر (ل.ل)', 'ملاحظات']
+    return headers, period.apply(query, Medicine.date).order_by(Medicine.date, Medicine.id)
+
+@dataset('consumption', 'view_consumption')
+def _consumption(period):
+    query = db.session.query(
+        Consumption.id, Consumption.date, Consumption.consumption_type,
+        func.coalesce(Medicine.name, Fertilizer.name, FuelLog.fuel_type),
+        Consumption.quantity_consumed, Consumption.unit, Consumption.notes
+    ).outerjoin(FuelLog, FuelLog.id == Consumption.fuel_id).outerjoin(
+        Medicine, Medicine.id == Consumption.medicine_id).outerjoin(
+        Fertilizer, Fertilizer.id == Consumption.fertilizer_id)
+    if request.args.get('type'):
+        query = query.filter(Consumption.consumption_type == request.args['type'])
+    headers = ['#', 'التاريخ', 'النوع', 'الصنف', 'الكمية', 'الوحدة', 'ملاحظات']
+    return headers, period.apply(query, Consumption.date).order_by(Consumption.date, Consumption.id)
+
+# ==================== Writers ====================
+def _stream_rows(query):
+    """الصفوف على دفعات (server-side cursor على PostgreSQL)؛ صفوف التقارير قائمة جاهزة"""
+    if isinstance(query, list):
+        return query
+    return query.execution_options(yield_per=YIELD_PER)
+
+def _csv_cell(value):
+    if isinstance(value, float):
+        return round(value, 6)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return '' if value is None else value
+
+def generate_csv(headers, query):
+    """CSV متدفق مع BOM ليفتحه Excel بالترميز الصحيح"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(headers)
+    for row in _stream_rows(query):
+        writer.writerow([_csv_cell(value) for value in row])
+        if buffer.tell() >= CSV_FLUSH_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def generate_xlsx(headers, query, title):
+    """XLSX written row by row (``constant_memory``) to a temp file, then streamed in chunks."""
+    handle, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(handle)
+    try:
+        workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+        sheet = workbook.add_worksheet(title[:31])
+        sheet.right_to_left()
+        bold = workbook.add_format({'bold': True})
+        date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+        sheet.write_row(0, 0, headers, bold)
+        for row_index, row in enumerate(_stream_rows(query), start=1):
+            for column, value in enumerate(row):
+                if isinstance(value, date):
+                    if not isinstance(value, datetime):
+                        value = datetime.combine(value, time())
+                    sheet.write_datetime(row_index, column, value, date_format)
+                elif isinstance(value, (int, float)):
+                    sheet.write_number(row_index, column, value)
+                elif value is not None:
+                    # write_string وليس write: نص يبدأ بـ = يُكتب نصاً لا صيغة
+                    sheet.write_string(row_index, column, str(value))
+        workbook.close()
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(FILE_CHUNK)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+# ==================== Routes ====================
+@exports_bp.route('/<name>.<fmt>')
+@login_required
+def export_data(name, fmt):
+    """تنزيل قائمة كاملة بنفس فلاتر صفحة العرض وفلتر الفترة"""
+    if name not in _datasets or fmt not in ('csv', 'xlsx'):
+        abort(404)
+    permission, build = _datasets[name]
+
+    @require_permission(permission)
+    def export():
+        if fmt == 'xlsx' and xlsxwriter is None:
+            flash('تصدير XLSX غير متاح (مكتبة XlsxWriter غير مثبتة)، استخدم CSV', 'warning')
+            return redirect(request.referrer or url_for('main.index'))
+        headers, query = build(period_from_request())
+        filename = f'{name}-{date.today().isoformat()}.{fmt}'
+        if fmt == 'csv':
+            body, mimetype = generate_csv(headers, query), 'text/csv; charset=utf-8'
+        else:
+            body = generate_xlsx(headers, query, name)
+            mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        return Response(stream_with_context(body), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                                 'X-Accel-Buffering': 'no'})
+    return export()
@@ -0,0 +1,357 @@
+"""
+استيراد العمال والنوبات والحضور من ملفات CSV
+Bulk CSV import: the file is parsed as a stream, validated row by row and
+written with executemany INSERTs in batches, all inside one transaction.
+"""
+import csv
+import io
+from datetime import datetime
+from itertools import chain
+from flask import Blueprint, current_app, flash, redirect, render_template, request, url_for
+from flask_login import current_user, login_required
+from sqlalchemy import and_, insert, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Worker, WorkShift, ProductType, Attendance, WorkerLedger
+from app.services import add_worker_hours
+
+imports_bp = Blueprint('imports', __name__, url_prefix='/import')
+
+MAX_REPORTED_ERRORS = 1000
+ATTENDANCE_STATUSES = ('حاضر', 'غائب', 'نصف يوم')
+
+# أسماء الأعمدة المقبولة بالعربية (نفس عناوين ملفات التصدير)
+HEADER_ALIASES = {
+    'الاسم': 'name', 'العامل': 'worker', 'الهاتف': 'phone',
+    'سعر الساعة ($)': 'hourly_rate_usd', 'سعر الساعة (ل.ل)': 'hourly_rate_lbp',
+    'التاريخ': 'date', 'النوبة': 'shift_type', 'الموقع': 'location', 'المنتج': 'product',
+    'نوع العمل': 'work_type', 'الساعات': 'hours', 'ملاحظات': 'notes', 'الحالة': 'status',
+    'وقت الحضور': 'check_in_time', 'وقت المغادرة': 'check_out_time',
+    'worker_name': 'worker', 'hours_worked': 'hours', '#': 'id'
+}
+
+class RowError(ValueError):
+    """خطأ في صف واحد من الملف"""
+
+# ==================== Field Parsers ====================
+def _text(row, key, required=False, max_length=None):
+    value = (row.get(key) or '').strip()
+    if required and not value:
+        raise RowError(f'العمود {key} مطلوب')
+    if max_length and len(value) > max_length:
+        raise RowError(f'{key}: أطول من {max_length} حرفاً')
+    return value or None
+
+def _number(row, key, default=0, minimum=None, maximum=None):
+    value = (row.get(key) or '').strip().replace(',', '')
+    if not value:
+        return default
+    try:
+        number = float(value)
+    except ValueError:
+        raise RowError(f'{key}: "{value}" ليس رقماً')
+    if (minimum is not None and number < minimum) or (maximum is not None and number > maximum):
+        raise RowError(f'{key}: {number:g} خارج النطاق المسموح')
+    return number
+
+def _date(row, key='date'):
+    value = (row.get(key) or '').strip()
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise RowError(f'{key}: "{value}" ليس تاريخاً صالحاً (YYYY-MM-DD)')
+
+def _time(row, key):
+    value = (row.get(key) or '').strip()
+    if not value:
+        return None
+    for fmt in ('%H:%M', '%H:%M:%S'):
+        try:
+            return datetime.strptime(value, fmt).time()
+        except ValueError:
+            continue
+    raise RowError(f'{key}: "{value}" ليس وقتاً صالحاً (HH:MM)')
+
+# ==================== Importers ====================
+class Importer:
+    """Base class: ``parse`` turns one CSV row into an insert mapping."""
+    model = None
+    columns = ()
+
+    def __init__(self):
+        self.new_ids = []
+
+    def prepare(self):
+        pass
+
+    def parse(self, row):
+        raise NotImplementedError
+
+    def check_batch(self, batch):
+        """Batch-level checks (one query per batch); returns ``[(line, message)]``."""
+        return []
+
+    def insert(self, mappings):
+        """INSERT واحد (executemany) للدفعة، مع حفظ معرفات الصفوف المضافة"""
+        self.new_ids.extend(db.session.scalars(
+            insert(self.model).returning(self.model.id, sort_by_parameter_order=True), mappings).all())
+
+    def finish(self, inserted):
+        pass
+
+    def stamp_updated_at(self, chunk_size=500):
+        """``updated_at`` = وقت الحفظ بدل وقت إدخال كل دفعة.
+
+        ملف كبير قد يستغرق أكثر من SYNC_SETTLE_SECONDS بين أول دفعة والحفظ، فتفوت
+        صفوفه الأولى الأجهزة التي زامنت خلال ذلك (انظر sync.pull_changes).
+        """
+        now = datetime.utcnow()
+        for start in range(0, len(self.new_ids), chunk_size):
+            db.session.execute(update(self.model).where(
+                self.model.id.in_(self.new_ids[start:start + chunk_size])).values(updated_at=now))
+
+class _WorkerLookup:
+    """تحديد العامل بالرقم أو بالاسم (يُحمّل مرة واحدة)"""
+
+    def prepare_workers(self):
+        self.worker_ids = set()
+        self.worker_names = {}
+        for worker_id, name in db.session.query(Worker.id, Worker.name):
+            self.worker_ids.add(worker_id)
+            self.worker_names.setdefault(name.strip(), []).append(worker_id)
+
+    def worker_id(self, row):
+        raw_id = (row.get('worker_id') or '').strip()
+        if raw_id:
+            if not raw_id.isdigit() or int(raw_id) not in self.worker_ids:
+                raise RowError(f'worker_id: العامل رقم {raw_id} غير موجود')
+            return int(raw_id)
+        name = _text(row, 'worker', required=True)
+        matches = self.worker_names.get(name, [])
+        if not matches:
+            raise RowError(f'العامل "{name}" غير موجود')
+        if len(matches) > 1:
+            raise RowError(f'يوجد أكثر من عامل باسم "{name}"، استخدم worker_id')
+        return matches[0]
+
+class WorkerImporter(Importer):
+    model = Worker
+    columns = ('name', 'phone', 'hourly_rate_usd', 'hourly_rate_lbp')
+
+    def parse(self, row):
+        return {
+            'name': _text(row, 'name', required=True, max_length=100),
+            'phone': _text(row, 'phone', max_length=20),
+            'hourly_rate_usd': _number(row, 'hourly_rate_usd', minimum=0),
+            'hourly_rate_lbp': _number(row, 'hourly_rate_lbp', minimum=0)
+        }
+
+    def finish(self, inserted):
+        # دفتر للعمال المضافين فقط (new_ids) دون المس بدفاتر العمال الموجودين؛
+        # عامل جديد بلا ورديات ولا سلف: دفتره أصفار (INSERT واحد executemany)
+        if self.new_ids:
+            db.session.execute(insert(WorkerLedger), [
+                {'worker_id': worker_id, 'total_hours': 0.0, 'earnings_usd': 0.0, 'earnings_lbp': 0.0,
+                 'advances_usd': 0.0, 'advances_lbp': 0.0, 'balance_usd': 0.0, 'balance_lbp': 0.0}
+                for worker_id in self.new_ids])
+
+class ShiftImporter(_WorkerLookup, Importer):
+    model = WorkShift
+    columns = ('worker_id | worker', 'date', 'shift_type', 'location', 'hours', 'product', 'work_type', 'notes')
+
+    def prepare(self):
+        self.prepare_workers()
+        self.products = {name.strip(): product_id
+                         for product_id, name in db.session.query(ProductType.id, ProductType.name)}
+        self.hours_by_worker = {}
+
+    def parse(self, row):
+        worker_id = self.worker_id(row)
+        product = _text(row, 'product')
+        if product and product not in self.products:
+            raise RowError(f'المنتج "{product}" غير موجود')
+        return {
+            'worker_id': worker_id,
+            'date': _date(row),
+            'shift_type': _text(row, 'shift_type', required=True, max_length=20),
+            'location': _text(row, 'location', required=True, max_length=50),
+            'hours': _number(row, 'hours', minimum=0, maximum=24),
+            'product_type_id': self.products.get(product),
+            'work_type': _text(row, 'work_type', max_length=50),
+            'notes': _text(row, 'notes')
+        }
+
+    def check_batch(self, batch):
+        for _, mapping in batch:
+            self.hours_by_worker[mapping['worker_id']] = \
+                self.hours_by_worker.get(mapping['worker_id'], 0) + mapping['hours']
+        return []
+
+    def finish(self, inserted):
+        # total_hours = total_hours + مجموع ساعات الملف، UPDATE واحد لكل عامل (executemany)
+        add_worker_hours(self.hours_by_worker)
+
+class AttendanceImporter(_WorkerLookup, Importer):
+    model = Attendance
+    columns = ('worker_id | worker', 'date', 'status', 'check_in_time', 'check_out_time', 'hours', 'notes')
+
+    def prepare(self):
+        self.prepare_workers()
+        self.seen = set()
+
+    def parse(self, row):
+        status = _text(row, 'status') or 'حاضر'
+        if status not in ATTENDANCE_STATUSES:
+            raise RowError(f'status: "{status}" غير معروف ({"، ".join(ATTENDANCE_STATUSES)})')
+        mapping = {
+            'worker_id': self.worker_id(row),
+            'date': _date(row),
+            'status': status,
+            'check_in_time': _time(row, 'check_in_time'),
+            'check_out_time': _time(row, 'check_out_time'),
+            'hours_worked': _number(row, 'hours', minimum=0, maximum=24),
+            'notes': _text(row, 'notes')
+        }
+        key = (mapping['worker_id'], mapping['date'])
+        if key in self.seen:
+            raise RowError('حضور مكرر لنفس العامل في نفس التاريخ داخل الملف')
+        self.seen.add(key)
+        return mapping
+
+    def check_batch(self, batch):
+        # استعلام واحد للدفعة بدل استعلام لكل صف
+        worker_ids = {mapping['worker_id'] for _, mapping in batch}
+        dates = [mapping['date'] for _, mapping in batch]
+        existing = set(db.session.query(Attendance.worker_id, Attendance.date).filter(
+            Attendance.worker_id.in_(worker_ids),
+            and_(Attendance.date >= min(dates), Attendance.date <= max(dates))
+        ))
+        return [(line, 'الحضور مسجل مسبقاً لهذا العامل في هذا التاريخ')
+                for line, mapping in batch if (mapping['worker_id'], mapping['date']) in existing]
+
+IMPORTERS = {
+    'workers': WorkerImporter,
+    'shifts': ShiftImporter,
+    'attendance': AttendanceImporter
+}
+
+# الصلاحية المطلوبة لكل نوع، مثل صفحات الإدخال اليدوي (ومثل PUSH_PERMISSIONS في api.py)
+IMPORT_PERMISSIONS = {
+    'workers': 'add_workers',
+    'shifts': 'add_workers',
+    'attendance': 'add_attendance'
+}
+
+# ==================== Pipeline ====================
+def _csv_rows(stream):
+    """قراءة الملف سطراً بسطر مع اكتشاف الفاصل (, أو ; أو Tab)"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    first = text.readline()
+    try:
+        dialect = csv.Sniffer().sniff(first, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(chain([first], text), dialect)
+    header = next(reader, None)
+    if not header:
+        raise RowError('الملف فارغ')
+    keys = [HEADER_ALIASES.get(name.strip(), name.strip().lower()) for name in header]
+    for values in reader:
+        if any(value.strip() for value in values):
+            yield reader.line_num, dict(zip(keys, values))
+
+def import_csv(kind, stream, batch_size=None, skip_invalid=False):
+    """Import a CSV stream of ``kind`` (workers, shifts or attendance).
+
+    Rows are validated as they are read and inserted ``batch_size`` at a time
+    with one executemany INSERT per batch. Everything runs in one transaction:
+    unless ``skip_invalid`` is set, any invalid row rolls the whole file back.
+    Returns a dict with rows, inserted, error_count, errors (``(line,
+    message)``, capped at MAX_REPORTED_ERRORS) and committed.
+    """
+    importer = IMPORTERS[kind]()
+    batch_size = batch_size or current_app.config.get('IMPORT_BATCH_SIZE', 1000)
+    result = {'rows': 0, 'inserted': 0, 'error_count': 0, 'errors': [], 'committed': False}
+
+    def add_errors(errors):
+        result['error_count'] += len(errors)
+        room = MAX_REPORTED_ERRORS - len(result['errors'])
+        result['errors'].extend(errors[:max(room, 0)])
+
+    def flush(batch):
+        errors = importer.check_batch(batch)
+        if errors:
+            add_errors(errors)
+            bad = {line for line, _ in errors}
+            batch = [item for item in batch if item[0] not in bad]
+        if batch and (skip_invalid or not result['error_count']):
+            importer.insert([mapping for _, mapping in batch])
+            result['inserted'] += len(batch)
+
+    try:
+        importer.prepare()
+        batch = []
+        for line, row in _csv_rows(stream):
+            result['rows'] += 1
+            try:
+                batch.append((line, importer.parse(row)))
+            except RowError as e:
+                add_errors([(line, str(e))])
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    except RowError as e:
+        db.session.rollback()
+        add_errors([(0, str(e))])
+        return result
+    except UnicodeDecodeError:
+        db.session.rollback()
+        add_errors([(0, 'الملف ليس بترميز UTF-8')])
+        return result
+    except IntegrityError:
+        # سجل متزامن أُضيف أثناء الاستيراد (مثلاً حضور لنفس العامل واليوم)
+        db.session.rollback()
+        add_errors([(0, 'تعارض مع بيانات أُضيفت أثناء الاستيراد، أعد المحاولة')])
+        result['inserted'] = 0
+        return result
+
+    if result['error_count'] and not skip_invalid:
+        db.session.rollback()
+        result['inserted'] = 0
+        return result
+
+    importer.finish(result['inserted'])
+    importer.stamp_updated_at()
+    db.session.commit()
+    result['committed'] = True
+    return result
+
+# ==================== Routes ====================
+@imports_bp.route('/', methods=['GET', 'POST'])
+@login_required
+def import_data():
+    """رفع ملف CSV واستيراده دفعة واحدة"""
+    result = None
+    allowed = [name for name in IMPORTERS if current_user.has_permission(IMPORT_PERMISSIONS[name])]
+    kind = request.values.get('kind') or (allowed[0] if allowed else 'workers')
+    if kind not in IMPORTERS:
+        kind = 'workers'
+    if kind not in allowed:
+        flash('ليس لديك صلاحية للقيام بهذا الإجراء', 'danger')
+        return redirect(url_for('main.index'))
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('يرجى اختيار ملف CSV', 'warning')
+            return redirect(url_for('imports.import_data', kind=kind))
+        result = import_csv(kind, upload.stream, skip_invalid=bool(request.form.get('skip_invalid')))
+        if result['committed']:
+            flash(f"تم استيراد {result['inserted']} صف بنجاح", 'success')
+        else:
+            flash(f"لم يتم استيراد أي صف: {result['error_count']} خطأ", 'danger')
+    importers = {name: IMPORTERS[name].columns for name in allowed}
+    return render_template('imports/upload.html', kind=kind, importers=importers, result=result)
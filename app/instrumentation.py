@@ -0,0 +1,260 @@
+import heapq
+import hmac
+import os
+import time
+from flask import (Blueprint, Response, abort, current_app, g, request, has_request_context,
+                   request_started, before_render_template, template_rendered)
+from flask_login import current_user
+from sqlalchemy import event
+from app import db
+
+# ==================== SQL Statement Guard ====================
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.sql_statement_count = g.get('sql_statement_count', 0) + 1
+
+def init_query_guard(app):
+    """Fail a request that issues more SQL statements than allowed (testing only).
+
+    Enabled when ``app.testing`` is true and ``SQL_STATEMENT_LIMIT`` is set.
+    ``SQL_STATEMENT_LIMITS`` may override the limit per endpoint, e.g.
+    ``{'reports.production_report': 10}``. Catches N+1 regressions such as a
+    template touching a lazy relationship on every row.
+    """
+    default_limit = app.config.get('SQL_STATEMENT_LIMIT')
+    limits = app.config.get('SQL_STATEMENT_LIMITS') or {}
+    if not app.testing or not (default_limit or limits):
+        return
+
+    event.listen(db.engine, 'before_cursor_execute', _count_statement)
+
+    @app.after_request
+    def check_statement_count(response):
+        limit = limits.get(request.endpoint, default_limit)
+        count = g.get('sql_statement_count', 0)
+        if limit and count > limit:
+            raise AssertionError(
+                f'{request.endpoint} issued {count} SQL statements (limit {limit})'
+            )
+        return response
+
+# ==================== Request Timing ====================
+class RequestTiming:
+    """Per-request counters, kept on ``g.request_timing``."""
+    __slots__ = ('start', 'statements', 'db_time', 'template_time', 'template_start', 'slowest', 'keep')
+
+    def __init__(self, keep):
+        self.start = time.perf_counter()
+        self.statements = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_start = None
+        self.slowest = []  # min-heap من (المدة، نص الاستعلام)
+        self.keep = keep
+
+    def add_statement(self, elapsed, statement):
+        self.statements += 1
+        self.db_time += elapsed
+        if not self.keep:
+            return
+        item = (elapsed, statement)
+        if len(self.slowest) < self.keep:
+            heapq.heappush(self.slowest, item)
+        elif elapsed > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, item)
+
+    @property
+    def wall_time(self):
+        return time.perf_counter() - self.start
+
+def _current_timing():
+    if has_request_context():
+        return g.get('request_timing')
+    return None
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # على سياق التنفيذ وليس على الاتصال، فلا يبقى شيء إذا فشلت العبارة
+    context._query_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = context._query_start
+    timing = _current_timing()
+    if timing is not None:
+        timing.add_statement(time.perf_counter() - started, statement)
+
+def init_request_timing(app):
+    """Record SQL, template and wall time per request (opt-in, ``REQUEST_TIMING``).
+
+    Adds a ``Server-Timing`` header (db, tpl, app, total) to every response and
+    logs requests slower than ``SLOW_REQUEST_MS`` together with their
+    ``SLOW_REQUEST_STATEMENTS`` slowest statements. The per-statement cost is
+    two ``perf_counter()`` calls and a bounded heap push.
+    """
+    if not app.config.get('REQUEST_TIMING'):
+        return
+
+    threshold = app.config.get('SLOW_REQUEST_MS', 500) / 1000.0
+    keep = app.config.get('SLOW_REQUEST_STATEMENTS', 5)
+
+    event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(db.engine, 'after_cursor_execute', _after_cursor_execute)
+
+    def on_request_started(sender, **extra):
+        g.request_timing = RequestTiming(keep)
+
+    def on_before_render(sender, template, context, **extra):
+        timing = _current_timing()
+        if timing is not None:
+            timing.template_start = time.perf_counter()
+
+    def on_rendered(sender, template, context, **extra):
+        timing = _current_timing()
+        if timing is not None and timing.template_start is not None:
+            timing.template_time += time.perf_counter() - timing.template_start
+            timing.template_start = None
+
+    request_started.connect(on_request_started, app, weak=False)
+    before_render_template.connect(on_before_render, app, weak=False)
+    template_rendered.connect(on_rendered, app, weak=False)
+
+    @app.after_request
+    def add_server_timing(response):
+        timing = _current_timing()
+        if timing is None:
+            return response
+        wall = timing.wall_time
+        app_time = max(wall - timing.db_time - timing.template_time, 0)
+        response.headers['Server-Timing'] = ', '.join([
+            f'db;dur={timing.db_time * 1000:.1f};desc="{timing.statements} queries"',
+            f'tpl;dur={timing.template_time * 1000:.1f}',
+            f'app;dur={app_time * 1000:.1f}',
+            f'total;dur={wall * 1000:.1f}'
+        ])
+        if wall >= threshold:
+            slowest = sorted(timing.slowest, reverse=True)
+            app.logger.warning(
+                'Slow request %s %s (%s): %.0fms total, %d queries in %.0fms, templates %.0fms%s',
+                request.method, request.path, request.endpoint, wall * 1000, timing.statements,
+                timing.db_time * 1000, timing.template_time * 1000,
+                ''.join(f'\n    {elapsed * 1000:.1f}ms  {" ".join(statement.split())[:300]}'
+                        for elapsed, statement in slowest)
+            )
+        return response
+
+# ==================== Prometheus Metrics ====================
+# prometheus_client اختياري: بدونه تبقى نقطة /metrics معطلة
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:  # pragma: no cover
+    prometheus_client = None
+
+metrics_bp = Blueprint('metrics', __name__)
+
+_metrics = {}
+
+def _get_metrics():
+    """Create the metric objects once per process."""
+    if not _metrics:
+        _metrics['request_latency'] = prometheus_client.Histogram(
+            'farm_request_duration_seconds', 'Request latency by blueprint',
+            ['blueprint', 'method'],
+            buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+        _metrics['sql_statements'] = prometheus_client.Histogram(
+            'farm_request_sql_statements', 'SQL statements per request by blueprint',
+            ['blueprint'], buckets=(1, 2, 5, 10, 20, 50, 100, 250, 1000))
+        _metrics['sql_total'] = prometheus_client.Counter(
+            'farm_sql_statements', 'SQL statements executed by blueprint', ['blueprint'])
+        _metrics['pool_wait'] = prometheus_client.Histogram(
+            'farm_db_pool_checkout_seconds', 'Time spent waiting for a pooled connection',
+            buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30))
+        _metrics['report_duration'] = prometheus_client.Histogram(
+            'farm_report_duration_seconds', 'Report generation time by report',
+            ['report'], buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300))
+    return _metrics
+
+def observe_report_duration(report, seconds):
+    """تسجيل مدة توليد لقطة تقرير في الخلفية (report_jobs.<النوع>)؛ العرض المباشر يُسجل في after_request"""
+    if prometheus_client is not None and _metrics:
+        _metrics['report_duration'].labels(report=report).observe(seconds)
+
+def _count_metrics_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.metrics_statements = g.get('metrics_statements', 0) + 1
+
+def _instrument_pool(pool):
+    """Wrap ``pool.connect`` to time checkouts, including time blocked on a full pool."""
+    if getattr(pool, '_farm_metrics', False):
+        return
+    connect = pool.connect
+    histogram = _get_metrics()['pool_wait']
+
+    def timed_connect(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return connect(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+
+    pool.connect = timed_connect
+    pool._farm_metrics = True
+
+def init_metrics(app):
+    """Expose Prometheus metrics on ``/metrics`` (opt-in, ``METRICS_ENABLED``).
+
+    Under gunicorn set ``PROMETHEUS_MULTIPROC_DIR`` to an empty directory so
+    every worker writes its samples there and the endpoint aggregates them;
+    ``gunicorn.conf.py`` cleans up after exited workers. Access requires an
+    admin session or ``Authorization: Bearer <METRICS_TOKEN>``.
+    """
+    if not app.config.get('METRICS_ENABLED'):
+        return
+    if prometheus_client is None:
+        app.logger.warning('METRICS_ENABLED is set but prometheus_client is not installed')
+        return
+
+    metrics = _get_metrics()
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _count_metrics_statement)
+    _instrument_pool(engine.pool)
+    # يتم إنشاء pool جديد بعد dispose() (مثلاً بعد fork في gunicorn)
+    event.listen(engine, 'engine_disposed', lambda e: _instrument_pool(e.pool))
+
+    @app.before_request
+    def start_metrics_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_metrics(response):
+        started = g.get('metrics_start')
+        if started is None or request.endpoint == 'metrics.metrics':
+            return response
+        elapsed = time.perf_counter() - started
+        blueprint = request.blueprint or 'app'
+        statements = g.get('metrics_statements', 0)
+        metrics['request_latency'].labels(blueprint=blueprint, method=request.method).observe(elapsed)
+        metrics['sql_statements'].labels(blueprint=blueprint).observe(statements)
+        metrics['sql_total'].labels(blueprint=blueprint).inc(statements)
+        if blueprint == 'reports':
+            metrics['report_duration'].labels(report=request.endpoint).observe(elapsed)
+        return response
+
+    app.register_blueprint(metrics_bp)
+
+def _metrics_authorized():
+    token = current_app.config.get('METRICS_TOKEN')
+    header = request.headers.get('Authorization', '')
+    if token and header.startswith('Bearer ') and hmac.compare_digest(header[7:], token):
+        return True
+    return current_user.is_authenticated and current_user.is_admin
+
+@metrics_bp.route('/metrics')
+def metrics():
+    if not _metrics_authorized():
+        abort(403)
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return Response(prometheus_client.generate_latest(registry), mimetype=prometheus_client.CONTENT_TYPE_LATEST)
@@ -1,11 +1,25 @@
+import time
 from datetime import datetime
-from flask_login import UserMixin
+from functools import lru_cache
+from flask import current_app, has_app_context, session
+from flask_login import UserMixin, user_logged_out
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Mapper, joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db, login_manager
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    if current_app.config.get('AUTH_SESSION_SNAPSHOT'):
+        return load_snapshot_user(int(user_id))
+    return load_cached_user(int(user_id))
+
+def _initial_on_hand(column):
+    """المخزون الابتدائي = الكمية المسجلة عند إضافة الدفعة"""
+    def default(context):
+        return context.get_current_parameters().get(column)
+    return default
 
 class Role(db.Model):
     """Role model for user permissions"""
@@ -17,6 +31,11 @@ class Role(db.Model):
     
     users = db.relationship('User', backref='role', lazy=True)
     
+    @property
+    def permission_set(self):
+        """الصلاحيات كمجموعة (frozenset) بدلاً من تقسيم النص في كل فحص"""
+        return compile_permissions(self.permissions)
+    
     def __repr__(self):
         return f'<Role {self.name}>'
 
@@ -31,6 +50,7 @@ class User(UserMixin, db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'))  # من أنشأ هذا المستخدم
+    auth_version = db.Column(db.Integer, default=0)  # يزيد عند تغيير الدور أو الصلاحيات أو التفعيل
     
     created_users = db.relationship('User', remote_side=[id], backref='created_by_user', lazy=True)
     
@@ -40,13 +60,19 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
     
+    def bump_auth_version(self):
+        """إبطال لقطات الجلسة المخزنة لهذا المستخدم"""
+        self.auth_version = (self.auth_version or 0) + 1
+    
     def has_permission(self, permission):
         """التحقق من وجود صلاحية معينة"""
-        if self.is_admin:
-            return True
-        if self.role and permission in (self.role.permissions or '').split(','):
-            return True
-        return False
+        # تُحسب مرة واحدة لكل كائن (أي لكل طلب)، فلا يعيد الفحص تحميل الدور بعد commit
+        compiled = self.__dict__.get('_compiled_permissions')
+        if compiled is None:
+            compiled = (bool(self.is_admin), self.role.permission_set if self.role else frozenset())
+            self._compiled_permissions = compiled
+        is_admin, permissions = compiled
+        return is_admin or permission in permissions
     
     def __repr__(self):
         return f'<User {self.username}>'
@@ -61,6 +87,7 @@ class Worker(db.Model):
     advance = db.Column(db.Float, default=0)  # السلفة
     total_hours = db.Column(db.Float, default=0)  # إجمالي ساعات العمل
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # للمزامنة التفاضلية
     
     shifts = db.relationship('WorkShift', backref='worker', lazy=True, cascade='all, delete-orphan')
     
@@ -104,14 +131,15 @@ class Worker(db.Model):
 class WorkShift(db.Model):
     """Work shift model"""
     id = db.Column(db.Integer, primary_key=True)
-    worker_id = db.Column(db.Integer, db.ForeignKey('worker.id'), nullable=False)
+    worker_id = db.Column(db.Integer, db.ForeignKey('worker.id'), nullable=False, index=True)
     shift_type = db.Column(db.String(20), nullable=False)  # صباحي، بعد ظهر
     location = db.Column(db.String(50), nullable=False)  # جبل، سهل
     product_type_id = db.Column(db.Integer, db.ForeignKey('product_type.id'))
     work_type = db.Column(db.String(50))  # تنظيف، تقليم، تشحيل
     hours = db.Column(db.Float, default=0)
-    date = db.Column(db.Date, default=datetime.utcnow)
+    date = db.Column(db.Date, default=datetime.utcnow, index=True)
     notes = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     product_type = db.relationship('ProductType', backref='shifts')
     
@@ -137,9 +165,10 @@ class Production(db.Model):
     location = db.Column(db.String(50))  # جبل، سهل
     quantity = db.Column(db.Float, default=0)  # كمية
     unit = db.Column(db.String(20), default='كجم')  # وحدة قياس
-    date = db.Column(db.Date, default=datetime.utcnow)
+    date = db.Column(db.Date, default=datetime.utcnow, index=True)
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     def __repr__(self):
         return f'<Production {self.product_type.name} - {self.quantity}>'
@@ -154,9 +183,10 @@ class Sales(db.Model):
     price_per_unit_lbp = db.Column(db.Float, default=0)
     total_usd = db.Column(db.Float, default=0)
     total_lbp = db.Column(db.Float, default=0)
-    date = db.Column(db.Date, default=datetime.utcnow)
+    date = db.Column(db.Date, default=datetime.utcnow, index=True)
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     def __repr__(self):
         return f'<Sales {self.product_type.name}>'
@@ -166,6 +196,7 @@ class FuelLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     fuel_type = db.Column(db.String(50), nullable=False)  # مازوت، بنزين
     liters = db.Column(db.Float, nullable=False)
+    quantity_on_hand = db.Column(db.Float, default=_initial_on_hand('liters'))  # الكمية المتبقية في المخزون
     price_per_liter_usd = db.Column(db.Float, default=0)
     price_per_liter_lbp = db.Column(db.Float, default=0)
     total_usd = db.Column(db.Float, default=0)
@@ -173,11 +204,14 @@ class FuelLog(db.Model):
     date = db.Column(db.Date, default=datetime.utcnow)
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     def get_remaining_quantity(self):
         """حساب الكمية المتبقية (الكمية الأصلية - المستهلكة)"""
-        total_consumed = sum(c.quantity_consumed for c in self.consumptions if c.consumption_type == 'وقود')
-        return self.liters - total_consumed
+        from app.services import get_stock_levels
+        if self.id is None:
+            return self.liters
+        return get_stock_levels('وقود', [self.id]).get(self.id, self.liters)
     
     def __repr__(self):
         return f'<FuelLog {self.fuel_type}>'
@@ -187,12 +221,14 @@ class Medicine(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     quantity = db.Column(db.Float, default=0)
+    quantity_on_hand = db.Column(db.Float, default=_initial_on_hand('quantity'))  # الكمية المتبقية في المخزون
     unit = db.Column(db.String(20), default='لتر')
     price_usd = db.Column(db.Float, default=0)
     price_lbp = db.Column(db.Float, default=0)
     date = db.Column(db.Date, default=datetime.utcnow)
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     def get_total_value_usd(self):
         """حساب القيمة الإجمالية بالدولار"""
@@ -204,8 +240,10 @@ class Medicine(db.Model):
     
     def get_remaining_quantity(self):
         """حساب الكمية المتبقية (الكمية الأصلية - المستهلكة)"""
-        total_consumed = sum(c.quantity_consumed for c in self.consumptions if c.consumption_type == 'دواء')
-        return self.quantity - total_consumed
+        from app.services import get_stock_levels
+        if self.id is None:
+            return self.quantity
+        return get_stock_levels('دواء', [self.id]).get(self.id, self.quantity)
     
     def __repr__(self):
         return f'<Medicine {self.name}>'
@@ -215,12 +253,14 @@ class Fertilizer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     quantity = db.Column(db.Float, default=0)
+    quantity_on_hand = db.Column(db.Float, default=_initial_on_hand('quantity'))  # الكمية المتبقية في المخزون
     unit = db.Column(db.String(20), default='كجم')
     price_usd = db.Column(db.Float, default=0)
     price_lbp = db.Column(db.Float, default=0)
     date = db.Column(db.Date, default=datetime.utcnow)
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     def get_total_value_usd(self):
         """حساب القيمة الإجمالية بالدولار"""
@@ -232,8 +272,10 @@ class Fertilizer(db.Model):
     
     def get_remaining_quantity(self):
         """حساب الكمية المتبقية (الكمية الأصلية - المستهلكة)"""
-        total_consumed = sum(c.quantity_consumed for c in self.consumptions if c.consumption_type == 'سماد')
-        return self.quantity - total_consumed
+        from app.services import get_stock_levels
+        if self.id is None:
+            return self.quantity
+        return get_stock_levels('سماد', [self.id]).get(self.id, self.quantity)
     
     def __repr__(self):
         return f'<Fertilizer {self.name}>'
@@ -243,9 +285,9 @@ class Consumption(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     
     # Link to fuel, medicine, or fertilizer
-    fuel_id = db.Column(db.Integer, db.ForeignKey('fuel_log.id'))
-    medicine_id = db.Column(db.Integer, db.ForeignKey('medicine.id'))
-    fertilizer_id = db.Column(db.Integer, db.ForeignKey('fertilizer.id'))
+    fuel_id = db.Column(db.Integer, db.ForeignKey('fuel_log.id'), index=True)
+    medicine_id = db.Column(db.Integer, db.ForeignKey('medicine.id'), index=True)
+    fertilizer_id = db.Column(db.Integer, db.ForeignKey('fertilizer.id'), index=True)
     
     # Consumption details
     consumption_type = db.Column(db.String(50), nullable=False)  # وقود، دواء، سماد
@@ -254,6 +296,7 @@ class Consumption(db.Model):
     date = db.Column(db.Date, default=datetime.utcnow)
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relationships
     fuel = db.relationship('FuelLog', backref='consumptions')
@@ -265,12 +308,22 @@ class Consumption(db.Model):
 
 class Report(db.Model):
     """Report model for storing generated reports"""
+    __table_args__ = (
+        db.Index('ix_report_status', 'status'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     report_type = db.Column(db.String(50), nullable=False)  # عمال، إنتاج، مبيعات
     content = db.Column(db.Text)
     generated_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # حالة مهمة التوليد في الخلفية: queued، running، done، failed
+    status = db.Column(db.String(20), default='done')
+    params = db.Column(db.Text)  # معاملات التقرير (JSON)
+    error = db.Column(db.Text)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
     
     user = db.relationship('User', backref='reports')
     
@@ -279,15 +332,21 @@ class Report(db.Model):
 
 class Attendance(db.Model):
     """Daily attendance tracking for workers"""
+    __table_args__ = (
+        # سجل حضور واحد لكل عامل في اليوم
+        db.Index('uq_attendance_worker_date', 'worker_id', 'date', unique=True),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     worker_id = db.Column(db.Integer, db.ForeignKey('worker.id'), nullable=False)
-    date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
+    date = db.Column(db.Date, nullable=False, default=datetime.utcnow, index=True)
     status = db.Column(db.String(20), nullable=False, default='حاضر')  # حاضر، غائب، نصف يوم
     check_in_time = db.Column(db.Time)  # وقت الحضور
     check_out_time = db.Column(db.Time)  # وقت المغادرة
     hours_worked = db.Column(db.Float, default=0)  # عدد ساعات العمل
     notes = db.Column(db.Text)  # ملاحظات
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     worker = db.relationship('Worker', backref='attendance_records')
     
@@ -296,10 +355,14 @@ class Attendance(db.Model):
 
 class Accounting(db.Model):
     """Accounting and financial tracking linked to all departments"""
+    __table_args__ = (
+        db.Index('ix_accounting_type_category', 'transaction_type', 'category'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     
     # Link to different departments
-    worker_id = db.Column(db.Integer, db.ForeignKey('worker.id'))  # قسم العمال
+    worker_id = db.Column(db.Integer, db.ForeignKey('worker.id'), index=True)  # قسم العمال
     production_id = db.Column(db.Integer, db.ForeignKey('production.id'))  # قسم الإنتاج
     sales_id = db.Column(db.Integer, db.ForeignKey('sales.id'))  # قسم المبيعات
     fuel_id = db.Column(db.Integer, db.ForeignKey('fuel_log.id'))  # قسم الوقود
@@ -313,9 +376,10 @@ class Accounting(db.Model):
     amount_usd = db.Column(db.Float, default=0)  # المبلغ بالدولار
     amount_lbp = db.Column(db.Float, default=0)  # المبلغ بالليرة اللبنانية
     description = db.Column(db.Text)  # الوصف
-    date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
+    date = db.Column(db.Date, nullable=False, default=datetime.utcnow, index=True)
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'))  # من أضاف المعاملة
     
     # Relationships
@@ -330,3 +394,213 @@ class Accounting(db.Model):
     
     def __repr__(self):
         return f'<Accounting {self.transaction_type} - {self.amount_usd}>'
+
+class WorkerLedger(db.Model):
+    """Materialized per-worker balance, kept in sync on every shift/accounting write"""
+    id = db.Column(db.Integer, primary_key=True)
+    worker_id = db.Column(db.Integer, db.ForeignKey('worker.id'), nullable=False, unique=True)
+    total_hours = db.Column(db.Float, default=0)  # إجمالي ساعات العمل
+    earnings_usd = db.Column(db.Float, default=0)  # إجمالي الحساب بالدولار
+    earnings_lbp = db.Column(db.Float, default=0)  # إجمالي الحساب بالليرة
+    advances_usd = db.Column(db.Float, default=0)  # إجمالي السلفات بالدولار
+    advances_lbp = db.Column(db.Float, default=0)  # إجمالي السلفات بالليرة
+    balance_usd = db.Column(db.Float, default=0)  # الباقي بالدولار
+    balance_lbp = db.Column(db.Float, default=0)  # الباقي بالليرة
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    worker = db.relationship('Worker', backref=db.backref('ledger', uselist=False))
+    
+    def __repr__(self):
+        return f'<WorkerLedger {self.worker_id} - {self.balance_usd}>'
+
+class _RollupColumns:
+    """أعمدة مشتركة لجداول التجميع الزمني للإنتاج والمبيعات"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # production, sales
+    product_type_id = db.Column(db.Integer, db.ForeignKey('product_type.id'), nullable=False)
+    location = db.Column(db.String(50), nullable=False, default='')  # فارغ للمبيعات
+    period = db.Column(db.Date, nullable=False)  # اليوم، أو أول يوم في الشهر
+    quantity = db.Column(db.Float, default=0)
+    revenue_usd = db.Column(db.Float, default=0)
+    revenue_lbp = db.Column(db.Float, default=0)
+    record_count = db.Column(db.Integer, default=0)
+
+class DailyRollup(_RollupColumns, db.Model):
+    """Production/sales totals per product, location and day"""
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'period', 'product_type_id', 'location', name='uq_daily_rollup'),
+    )
+    
+    def __repr__(self):
+        return f'<DailyRollup {self.kind} {self.period} - {self.quantity}>'
+
+class MonthlyRollup(_RollupColumns, db.Model):
+    """Production/sales totals per product, location and month"""
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'period', 'product_type_id', 'location', name='uq_monthly_rollup'),
+    )
+    
+    def __repr__(self):
+        return f'<MonthlyRollup {self.kind} {self.period} - {self.quantity}>'
+
+class SyncTombstone(db.Model):
+    """سجل الحذف: ما حُذف من الجداول المتزامنة ليحذفه الجهاز أيضاً"""
+    __table_args__ = (
+        db.Index('ix_sync_tombstone_deleted', 'deleted_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    record_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SyncTombstone {self.table_name} #{self.record_id}>'
+
+class SyncReceipt(db.Model):
+    """الكتابات المستلمة من الأجهزة حسب معرف العميل (لجعل الإرسال المكرر بلا أثر)"""
+    id = db.Column(db.Integer, primary_key=True)
+    client_id = db.Column(db.String(64), nullable=False, unique=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    record_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SyncReceipt {self.client_id}>'
+
+class SchemaVersion(db.Model):
+    """بصمة المخطط المطبق على قاعدة البيانات، ليتخطى الإقلاع create_all إذا لم يتغير"""
+    __tablename__ = 'schema_version'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.String(64), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SchemaVersion {self.version}>'
+
+# ==================== Auth Cache ====================
+@lru_cache(maxsize=256)
+def compile_permissions(permissions):
+    """'view_workers,add_workers' → frozenset; each distinct string is parsed once."""
+    return frozenset(permission.strip() for permission in (permissions or '').split(',') if permission.strip())
+
+def _column_values(obj):
+    return {column.key: getattr(obj, column.key) for column in obj.__table__.columns}
+
+def _attach(model, values):
+    """كائن من القيم المخزنة يُضاف للجلسة كأنه محمّل من قاعدة البيانات، دون استعلام"""
+    existing = db.session.identity_map.get(inspect(model).identity_key_from_primary_key((values['id'],)))
+    if existing is not None:
+        return existing
+    obj = model(**values)
+    make_transient_to_detached(obj)
+    db.session.add(obj)
+    return obj
+
+def load_cached_user(user_id):
+    """The logged-in user, with its role, from a per-app cache.
+
+    Off by default. With ``AUTH_CACHE_TTL`` set (seconds) the user and role
+    columns are kept in process memory, so a warm request authenticates without
+    any query. Entries are dropped when this process changes the user or role;
+    changes made by other processes (e.g. another gunicorn worker) are only
+    seen once the TTL expires.
+    """
+    ttl = current_app.config.get('AUTH_CACHE_TTL', 0)
+    if not ttl:
+        return db.session.get(User, user_id)
+    cache = current_app.extensions.setdefault('auth_cache', {})
+    cached = cache.get(user_id)
+    if cached is None or cached[0] <= time.monotonic():
+        user = db.session.get(User, user_id, options=[joinedload(User.role)])
+        if user is None:
+            cache.pop(user_id, None)
+            return None
+        cache[user_id] = (time.monotonic() + ttl, _column_values(user),
+                          _column_values(user.role) if user.role else None)
+        return user
+
+    _, user_values, role_values = cached
+    user = _attach(User, user_values)
+    if 'role' not in user.__dict__:
+        set_committed_value(user, 'role', _attach(Role, role_values) if role_values else None)
+    return user
+
+# ==================== Session Snapshot ====================
+SNAPSHOT_KEY = '_auth_snapshot'
+SNAPSHOT_COLUMNS = ('id', 'username', 'is_admin', 'is_active', 'role_id', 'auth_version')
+
+def current_auth_version(user_id):
+    """``auth_version`` from the database, cached for ``AUTH_CACHE_TTL``; None if the user is gone."""
+    ttl = current_app.config.get('AUTH_CACHE_TTL', 0)
+    versions = current_app.extensions.setdefault('auth_versions', {})
+    cached = versions.get(user_id)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    row = db.session.query(User.auth_version).filter(User.id == user_id).first()
+    version = None if row is None else row[0] or 0
+    if ttl:
+        versions[user_id] = (time.monotonic() + ttl, version)
+    return version
+
+def load_snapshot_user(user_id):
+    """The logged-in user rebuilt from a snapshot in the signed session cookie.
+
+    The snapshot holds the columns in ``SNAPSHOT_COLUMNS`` and the role's
+    permission set. It is trusted while its ``auth_version`` matches the
+    database (checked at most once per ``AUTH_CACHE_TTL`` per process), so
+    read-only requests do not query the user or role; other columns load
+    lazily if a view reads them. A mismatch reloads the user and rewrites the
+    snapshot.
+    """
+    snapshot = session.get(SNAPSHOT_KEY)
+    version = current_auth_version(user_id)
+    if version is None:
+        session.pop(SNAPSHOT_KEY, None)
+        return None
+    if snapshot and snapshot.get('id') == user_id and snapshot.get('auth_version') == version:
+        user = _attach(User, {key: snapshot[key] for key in SNAPSHOT_COLUMNS})
+        if '_compiled_permissions' not in user.__dict__:
+            user._compiled_permissions = (bool(user.is_admin), frozenset(snapshot['permissions']))
+        return user
+
+    user = db.session.get(User, user_id, options=[joinedload(User.role)])
+    if user is None:
+        session.pop(SNAPSHOT_KEY, None)
+        return None
+    snapshot = {key: getattr(user, key) for key in SNAPSHOT_COLUMNS}
+    snapshot['auth_version'] = user.auth_version or 0
+    snapshot['permissions'] = sorted(user.role.permission_set) if user.role else []
+    session[SNAPSHOT_KEY] = snapshot
+    return user
+
+@user_logged_out.connect
+def _drop_snapshot(sender, user=None, **extra):
+    session.pop(SNAPSHOT_KEY, None)
+
+def invalidate_auth_cache(mapper=None, connection=None, target=None):
+    """مسح المستخدمين المخزنين بعد تعديل مستخدم أو دور (أو كلهم بدون target)"""
+    if not has_app_context():
+        return
+    for name in ('auth_cache', 'auth_versions'):
+        cache = current_app.extensions.get(name)
+        if not cache:
+            continue
+        if isinstance(target, User):
+            cache.pop(target.id, None)
+        else:
+            cache.clear()
+
+for _event_name in ('after_update', 'after_delete'):
+    event.listen(User, _event_name, invalidate_auth_cache)
+    event.listen(Role, _event_name, invalidate_auth_cache)
+
+def _reset_compiled_permissions(target, value, oldvalue, initiator):
+    target.__dict__.pop('_compiled_permissions', None)
+
+@event.listens_for(Mapper, 'after_configured', once=True)
+def _listen_permission_attributes():
+    # User.role هو backref من Role، فلا يوجد قبل تهيئة الـ mappers
+    for attribute in (User.is_admin, User.role_id, User.role):
+        event.listen(attribute, 'set', _reset_compiled_permissions)
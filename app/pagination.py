@@ -0,0 +1,153 @@
+import base64
+import json
+from datetime import date, datetime
+from flask import request, url_for
+from sqlalchemy import and_, or_
+from app import db
+
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 100
+
+# ==================== Cursors ====================
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+    return value
+
+def encode_cursor(sort_value, row_id, direction='next'):
+    """تحويل مفتاح الصف إلى مؤشر نصي غير شفاف"""
+    payload = json.dumps([_encode_value(sort_value), row_id, direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Return ``(sort_value, row_id, direction)`` or None for a missing/invalid cursor."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id, direction = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if direction not in ('next', 'prev'):
+            return None
+        return _decode_value(sort_value), int(row_id), direction
+    except (ValueError, TypeError):
+        return None
+
+# ==================== Keyset Pagination ====================
+class KeysetPage:
+    """One page of a keyset-paginated query, newest first."""
+
+    def __init__(self, items, per_page, sort_attr, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.sort_attr = sort_attr
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total  # تقديري على PostgreSQL، دقيق على SQLite
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def _url(self, cursor):
+        args = request.args.to_dict()
+        args.pop('cursor', None)
+        args.update(request.view_args or {})
+        return url_for(request.endpoint, cursor=cursor, **args)
+
+    def next_url(self):
+        return self._url(self.next_cursor) if self.has_next else None
+
+    def prev_url(self):
+        return self._url(self.prev_cursor) if self.has_prev else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+def keyset_paginate(query, sort_column, id_column, cursor=None, per_page=None, with_total=False):
+    """Paginate ``query`` on ``(sort_column, id_column)`` descending.
+
+    Instead of ``OFFSET`` the page boundary is a ``WHERE (sort, id) < (x, y)``
+    condition, so every page costs the same index range scan regardless of
+    depth. ``cursor``/``per_page`` default to the request arguments of the
+    same name. Rows are expected to have a non-NULL sort value.
+    """
+    if cursor is None:
+        cursor = request.args.get('cursor', '', type=str)
+    if per_page is None:
+        per_page = request.args.get('per_page', DEFAULT_PER_PAGE, type=int)
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+
+    total = estimate_count(query) if with_total else None
+
+    key = decode_cursor(cursor)
+    direction = 'next'
+    if key is not None:
+        sort_value, row_id, direction = key
+        if direction == 'next':
+            query = query.filter(or_(sort_column < sort_value,
+                                     and_(sort_column == sort_value, id_column < row_id)))
+        else:
+            query = query.filter(or_(sort_column > sort_value,
+                                     and_(sort_column == sort_value, id_column > row_id)))
+
+    if direction == 'next':
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    # صف إضافي لمعرفة وجود صفحة أخرى بدون COUNT
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'prev':
+        rows.reverse()
+
+    sort_attr = sort_column.key
+    id_attr = id_column.key
+    next_cursor = prev_cursor = None
+    if rows:
+        first, last = rows[0], rows[-1]
+        if direction == 'next':
+            if has_more:
+                next_cursor = encode_cursor(getattr(last, sort_attr), getattr(last, id_attr), 'next')
+            if key is not None:
+                prev_cursor = encode_cursor(getattr(first, sort_attr), getattr(first, id_attr), 'prev')
+        else:
+            next_cursor = encode_cursor(getattr(last, sort_attr), getattr(last, id_attr), 'next')
+            if has_more:
+                prev_cursor = encode_cursor(getattr(first, sort_attr), getattr(first, id_attr), 'prev')
+
+    return KeysetPage(rows, per_page, sort_attr, next_cursor, prev_cursor, total)
+
+def estimate_count(query):
+    """Approximate row count for a query.
+
+    PostgreSQL: the planner's row estimate from ``EXPLAIN (FORMAT JSON)``, which
+    does not scan the table. Other databases: an exact ``COUNT(*)``.
+    """
+    engine = db.engine
+    if engine.dialect.name == 'postgresql':
+        compiled = query.statement.compile(dialect=engine.dialect)
+        with engine.connect() as conn:
+            plan = conn.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + compiled.string, compiled.params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    return query.order_by(None).count()
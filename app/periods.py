@@ -0,0 +1,107 @@
+from datetime import date, datetime, timedelta
+from flask import current_app, request
+
+PERIOD_KINDS = ('all', 'season', 'month', 'fiscal_year', 'custom')
+
+PERIOD_LABELS = {
+    'all': 'كل الفترات',
+    'season': 'موسم',
+    'month': 'شهر',
+    'fiscal_year': 'سنة مالية',
+    'custom': 'فترة مخصصة'
+}
+
+# ==================== Period ====================
+class Period:
+    """A closed date range ``[start, end]`` used to filter reports (either bound may be None)."""
+
+    def __init__(self, kind='all', start=None, end=None, year=None, month=None):
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.year = year
+        self.month = month
+
+    @property
+    def is_all(self):
+        return self.start is None and self.end is None
+
+    def apply(self, query, column):
+        """إضافة شرط WHERE على عمود التاريخ"""
+        if self.start is not None:
+            query = query.filter(column >= self.start)
+        if self.end is not None:
+            query = query.filter(column <= self.end)
+        return query
+
+    @property
+    def label(self):
+        if self.is_all:
+            return PERIOD_LABELS['all']
+        start = self.start.isoformat() if self.start else '...'
+        end = self.end.isoformat() if self.end else '...'
+        return f'{PERIOD_LABELS[self.kind]}: {start} → {end}'
+
+    def args(self):
+        """معاملات الرابط التي تعيد إنشاء نفس الفترة"""
+        if self.kind in ('season', 'fiscal_year'):
+            return {'period': self.kind, 'year': self.year}
+        if self.kind == 'month':
+            return {'period': 'month', 'month': f'{self.year:04d}-{self.month:02d}'}
+        if self.kind == 'custom':
+            return {'period': 'custom',
+                    'start_date': self.start.isoformat() if self.start else '',
+                    'end_date': self.end.isoformat() if self.end else ''}
+        return {}
+
+def _add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def season_period(year):
+    """الموسم الزراعي: من شهر SEASON_START_MONTH حتى نهاية SEASON_END_MONTH"""
+    start_month = current_app.config.get('SEASON_START_MONTH', 3)
+    end_month = current_app.config.get('SEASON_END_MONTH', 11)
+    start = date(year, start_month, 1)
+    months = (end_month - start_month) % 12 + 1
+    return Period('season', start, _add_months(start, months) - timedelta(days=1), year=year)
+
+def month_period(year, month):
+    start = date(year, month, 1)
+    return Period('month', start, _add_months(start, 1) - timedelta(days=1), year=year, month=month)
+
+def fiscal_year_period(year):
+    """السنة المالية التي تبدأ في شهر FISCAL_YEAR_START_MONTH من السنة المحددة"""
+    start = date(year, current_app.config.get('FISCAL_YEAR_START_MONTH', 1), 1)
+    return Period('fiscal_year', start, _add_months(start, 12) - timedelta(days=1), year=year)
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value or '', '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+def period_from_request(args=None):
+    """Build a Period from ``period`` plus ``year``/``month``/``start_date``/``end_date``.
+
+    Without ``period``, ``start_date``/``end_date`` alone select a custom range
+    (the parameters the accounting report always accepted). Invalid values fall
+    back to all time.
+    """
+    args = request.args if args is None else args
+    kind = args.get('period') or ('custom' if args.get('start_date') or args.get('end_date') else 'all')
+    today = date.today()
+    try:
+        year = int(args.get('year') or today.year)
+        if kind == 'season':
+            return season_period(year)
+        if kind == 'fiscal_year':
+            return fiscal_year_period(year)
+        if kind == 'month':
+            month = datetime.strptime(args.get('month') or today.strftime('%Y-%m'), '%Y-%m')
+            return month_period(month.year, month.month)
+    except ValueError:
+        return Period()
+    if kind == 'custom':
+        return Period('custom', _parse_date(args.get('start_date')), _parse_date(args.get('end_date')))
+    return Period()
@@ -0,0 +1,197 @@
+"""
+توليد لقطات التقارير في الخلفية
+Background report snapshots: a request queues a ``Report`` row, a worker
+renders the report and stores the HTML in ``Report.content``.
+
+Job state lives in the ``report`` table, so it is shared by every gunicorn
+worker and survives restarts. ``REPORT_JOB_MODE`` selects who runs the jobs:
+``thread`` (a small in-process pool, default), ``worker`` (only
+``flask report-worker``) or ``inline`` (inside the request, for tests). Jobs
+are claimed with a conditional UPDATE, so a thread and an external worker
+never run the same job twice. In ``thread`` mode, jobs left behind by a
+restarted process are resumed when the reports page is opened: queued ones
+at once, running ones after ``REPORT_JOB_TIMEOUT``.
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import (Blueprint, abort, current_app, flash, jsonify, redirect, render_template, request,
+                   url_for)
+from flask_login import current_user, login_required, login_user
+from sqlalchemy import and_, or_
+from app import db
+from app.instrumentation import observe_report_duration
+from app.models import Report, User
+from app.periods import period_from_request
+from app.routes import require_permission, REPORT_TYPES, GRANULARITIES
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+report_jobs_bp = Blueprint('report_jobs', __name__, url_prefix='/reports/snapshots')
+
+_executor = None
+_submitted = set()  # المهام المرسلة إلى خيوط هذه العملية ولم تنته بعد
+
+# ==================== Queue ====================
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=current_app.config.get('REPORT_JOB_THREADS', 2),
+                                       thread_name_prefix='report-job')
+    return _executor
+
+def enqueue_report(report_type, args, user):
+    """Queue a snapshot of ``report_type`` for the period in ``args`` and return the Report row."""
+    title, _, _, endpoint = REPORT_TYPES[report_type]
+    period = period_from_request(args)
+    args = {**period.args(), 'granularity': args.get('granularity', 'month')}
+    report = Report(title=f'{title} - {period.label}', report_type=report_type, generated_by=user.id,
+                    status=QUEUED, params=json.dumps({'url': url_for(endpoint, **args)}, ensure_ascii=False))
+    db.session.add(report)
+    db.session.commit()
+
+    mode = current_app.config.get('REPORT_JOB_MODE', 'thread')
+    if mode == 'inline':
+        run_report_job(report.id)
+    elif mode == 'thread':
+        _submit(report.id)
+    return report
+
+def _submit(report_id):
+    _submitted.add(report_id)
+    _get_executor().submit(_run_in_app, current_app._get_current_object(), report_id)
+
+def _run_in_app(app, report_id):
+    try:
+        with app.app_context():
+            run_report_job(report_id)
+    finally:
+        _submitted.discard(report_id)
+
+def resume_report_jobs():
+    """``thread`` mode: submit the claimable jobs no thread of this process is handling.
+
+    Picks up jobs queued or running in a process that has since restarted.
+    Submitting a job another process is also running is harmless: only one
+    claim succeeds.
+    """
+    if current_app.config.get('REPORT_JOB_MODE', 'thread') != 'thread':
+        return
+    for (report_id,) in db.session.query(Report.id).filter(_claimable()).order_by(Report.id):
+        if report_id not in _submitted:
+            _submit(report_id)
+
+def _claimable():
+    """Queued jobs, and running ones whose worker died (started over REPORT_JOB_TIMEOUT ago)."""
+    timeout = current_app.config.get('REPORT_JOB_TIMEOUT', 1800)
+    return or_(Report.status == QUEUED,
+               and_(Report.status == RUNNING,
+                    Report.started_at < datetime.utcnow() - timedelta(seconds=timeout)))
+
+def claim_report_job(report_id=None):
+    """Mark one queued job (or one whose worker died) as running; returns its id or None."""
+    now = datetime.utcnow()
+    claimable = _claimable()
+    if report_id is None:
+        report_id = db.session.query(Report.id).filter(claimable).order_by(Report.id).limit(1).scalar()
+        if report_id is None:
+            return None
+    claimed = Report.query.filter(Report.id == report_id, claimable).update(
+        {Report.status: RUNNING, Report.started_at: now}, synchronize_session=False)
+    db.session.commit()
+    return report_id if claimed else None
+
+# ==================== Rendering ====================
+def render_block(template_name, block, **context):
+    """Render one block of a template (the report body without the site layout)."""
+    app = current_app._get_current_object()
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    return ''.join(template.blocks[block](template.new_context(context)))
+
+def run_report_job(report_id, claimed=False):
+    """Generate a snapshot if the job can be claimed; failures are stored on the row."""
+    if not claimed and claim_report_job(report_id) is None:
+        return
+    report = db.session.get(Report, report_id)
+    _, template, build_context, _ = REPORT_TYPES[report.report_type]
+    started = time.perf_counter()
+    try:
+        params = json.loads(report.params or '{}')
+        user = db.session.get(User, report.generated_by)
+        # نفس سياق الطلب الأصلي: الفترة من معاملات الرابط، والمستخدم الذي طلب التقرير
+        with current_app.test_request_context(params['url']):
+            if user is not None:
+                login_user(user)
+            granularity = request.args.get('granularity', 'month')
+            context = build_context(period_from_request(),
+                                    granularity if granularity in GRANULARITIES else 'month', snapshot=True)
+            # العرض قبل أي commit: commit يُنهي صلاحية الصفوف المحملة فيعيد تحميلها صفاً صفاً
+            content = render_block(template, 'content', snapshot=True, **context)
+        report.content = content
+        report.status = DONE
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception('Report job %s failed', report_id)
+        report = db.session.get(Report, report_id)
+        report.status = FAILED
+        report.error = str(e)[:1000]
+    report.finished_at = datetime.utcnow()
+    db.session.commit()
+    elapsed = time.perf_counter() - started
+    observe_report_duration(f'report_jobs.{report.report_type}', elapsed)
+    current_app.logger.info('Report job %s %s in %.2fs', report_id, report.status, elapsed)
+
+def work(poll_interval=2.0, once=False):
+    """Run queued jobs until interrupted (``once``: until the queue is empty)."""
+    while True:
+        report_id = claim_report_job()
+        if report_id is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        run_report_job(report_id, claimed=True)
+
+# ==================== Routes ====================
+@report_jobs_bp.route('/', methods=['POST'])
+@login_required
+@require_permission('view_reports')
+def create_snapshot():
+    report_type = request.form.get('report_type')
+    if report_type not in REPORT_TYPES:
+        flash('نوع التقرير غير معروف', 'danger')
+        return redirect(url_for('reports.reports_list'))
+    report = enqueue_report(report_type, request.form, current_user)
+    flash(f'تمت إضافة "{report.title}" إلى قائمة التوليد', 'info')
+    return redirect(url_for('reports.reports_list'))
+
+@report_jobs_bp.route('/<int:report_id>')
+@login_required
+@require_permission('view_reports')
+def view_snapshot(report_id):
+    report = Report.query.get_or_404(report_id)
+    if report.status not in (None, DONE):
+        return redirect(url_for('reports.reports_list'))
+    live_url = json.loads(report.params or '{}').get('url')
+    return render_template('reports/snapshot.html', report=report, live_url=live_url)
+
+@report_jobs_bp.route('/<int:report_id>/status')
+@login_required
+@require_permission('view_reports')
+def snapshot_status(report_id):
+    """حالة المهمة (JSON) لتحديث الصفحة دون إعادة تحميلها"""
+    report = db.session.get(Report, report_id)
+    if report is None:
+        abort(404)
+    done = report.status in (None, DONE)
+    return jsonify({
+        'id': report.id,
+        'status': report.status or DONE,
+        'error': report.error,
+        'url': url_for('report_jobs.view_snapshot', report_id=report.id) if done else None
+    })
@@ -2,9 +2,21 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user, login_user, logout_user
 from datetime import datetime, timedelta, date
 from functools import wraps
+from sqlalchemy import func, insert
+from sqlalchemy.orm import joinedload
+from sqlalchemy.exc import IntegrityError
 from app import db
 from app.models import (User, Role, Worker, WorkShift, ProductType, Production, Sales, 
-                        FuelLog, Medicine, Fertilizer, Consumption, Report, Attendance, Accounting)
+                        FuelLog, Medicine, Fertilizer, Consumption, Report, Attendance, Accounting,
+                        WorkerLedger)
+from app.services import (get_worker_balances, get_balance_totals, add_worker_hours, advance_amounts,
+                          ledger_apply_advance, refresh_worker_ledger, get_accounting_totals,
+                          get_stock_levels, get_all_stock_levels, InsufficientStockError,
+                          rollup_apply, delete_product_type_records, get_rollups,
+                          GRANULARITIES, PRODUCTION, SALES,
+                          compute_period_balances, get_accounting_summary, record_bulk_delete)
+from app.pagination import KeysetPage, keyset_paginate
+from app.periods import period_from_request
 
 # ==================== Permission Decorators ====================
 def require_permission(permission):
@@ -13,17 +25,17 @@ def require_permission(permission):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             if not current_user.is_authenticated:
+                if request.blueprint == 'api':
+                    return jsonify({'error': 'authentication required'}), 401
                 flash('يجب تسجيل الدخول أولاً', 'warning')
                 return redirect(url_for('auth.login'))
             
-            # Admin users have all permissions
-            if current_user.is_admin:
-                return f(*args, **kwargs)
-            
-            # Check if user has the required permission
+            # Admin users have all permissions (checked inside has_permission)
             if current_user.has_permission(permission):
                 return f(*args, **kwargs)
             
+            if request.blueprint == 'api':
+                return jsonify({'error': f'permission required: {permission}'}), 403
             flash('ليس لديك صلاحية للقيام بهذا الإجراء', 'danger')
             return redirect(url_for('main.index'))
         
@@ -54,7 +66,8 @@ def index():
     if current_user.is_authenticated:
         workers_count = Worker.query.count()
         total_shifts = WorkShift.query.count()
-        recent_shifts = WorkShift.query.order_by(WorkShift.date.desc()).limit(5).all()
+        recent_shifts = WorkShift.query.options(joinedload(WorkShift.worker)).order_by(
+            WorkShift.date.desc()).limit(5).all()
         
         # Attendance statistics
         today = datetime.now().date()
@@ -65,9 +78,9 @@ def index():
         ).count()
         
         # Accounting summary
-        all_records = Accounting.query.all()
-        total_income = sum(r.amount_usd for r in all_records if r.transaction_type == 'إيراد')
-        total_expense = sum(r.amount_usd for r in all_records if r.transaction_type == 'مصروف')
+        totals = get_accounting_totals()
+        total_income = totals['income_usd']
+        total_expense = totals['expense_usd']
         
         return render_template('dashboard.html', 
                              workers_count=workers_count, 
@@ -132,8 +145,11 @@ def logout():
 @login_required
 @require_permission('view_workers')
 def workers_list():
-    workers = Worker.query.all()
-    return render_template('workers/list.html', workers=workers)
+    page = keyset_paginate(Worker.query, Worker.created_at, Worker.id)
+    # تفاصيل صفوف الصفحة فقط، والإجماليات لكل العمال
+    workers_accounts, _ = get_worker_balances([worker.id for worker in page.items])
+    return render_template('workers/list.html', workers_accounts=workers_accounts, page=page,
+                           **get_balance_totals())
 
 @workers_bp.route('/add', methods=['GET', 'POST'])
 @login_required
@@ -148,6 +164,7 @@ def add_worker():
             advance=float(request.form.get('advance', 0))
         )
         db.session.add(worker)
+        db.session.add(WorkerLedger(worker=worker))
         db.session.commit()
         flash('تم إضافة العامل بنجاح', 'success')
         return redirect(url_for('workers.workers_list'))
@@ -159,8 +176,10 @@ def add_worker():
 @require_permission('view_workers')
 def worker_detail(worker_id):
     worker = Worker.query.get_or_404(worker_id)
-    shifts = WorkShift.query.filter_by(worker_id=worker_id).all()
-    return render_template('workers/detail.html', worker=worker, shifts=shifts)
+    shifts = WorkShift.query.options(joinedload(WorkShift.product_type)).filter_by(worker_id=worker_id).all()
+    # الرصيد من دفتر العامل (WorkerLedger) وليس من تجميع المحاسبة لكل طلب
+    (account,), _ = get_worker_balances([worker.id])
+    return render_template('workers/detail.html', worker=worker, shifts=shifts, account=account)
 
 @workers_bp.route('/<int:worker_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -173,6 +192,7 @@ def edit_worker(worker_id):
         worker.hourly_rate_usd = float(request.form.get('hourly_rate_usd', 0))
         worker.hourly_rate_lbp = float(request.form.get('hourly_rate_lbp', 0))
         worker.advance = float(request.form.get('advance', 0))
+        refresh_worker_ledger(worker.id)
         db.session.commit()
         flash('تم تحديث بيانات العامل بنجاح', 'success')
         return redirect(url_for('workers.worker_detail', worker_id=worker_id))
@@ -195,8 +215,8 @@ def add_shift(worker_id):
             date=datetime.strptime(request.form.get('date'), '%Y-%m-%d'),
             notes=request.form.get('notes')
         )
-        worker.total_hours += shift.hours
         db.session.add(shift)
+        add_worker_hours({worker_id: shift.hours})
         db.session.commit()
         flash('تم إضافة النوبة بنجاح', 'success')
         return redirect(url_for('workers.worker_detail', worker_id=worker_id))
@@ -204,12 +224,78 @@ def add_shift(worker_id):
     product_types = ProductType.query.all()
     return render_template('workers/add_shift.html', worker=worker, product_types=product_types)
 
+SHIFT_TYPES = ('صباحي', 'بعد ظهر')
+SHIFT_LOCATIONS = ('جبل', 'سهل')
+
+@workers_bp.route('/shifts/batch', methods=['GET', 'POST'])
+@login_required
+@require_permission('add_workers')
+def batch_shifts():
+    """نوبة واحدة لفريق كامل: نفس الموقع والمنتج ونوع العمل لعدة عمال"""
+    if request.method == 'POST':
+        try:
+            shift_date = datetime.strptime(request.form.get('date', ''), '%Y-%m-%d').date()
+        except ValueError:
+            flash('التاريخ غير صالح', 'danger')
+            return redirect(url_for('workers.batch_shifts'))
+        shift_type = request.form.get('shift_type')
+        location = request.form.get('location')
+        if shift_type not in SHIFT_TYPES or location not in SHIFT_LOCATIONS:
+            flash('نوع النوبة أو الموقع غير صالح', 'danger')
+            return redirect(url_for('workers.batch_shifts'))
+        product_type_id = request.form.get('product_type_id', type=int)
+        if product_type_id is not None and db.session.get(ProductType, product_type_id) is None:
+            flash('نوع المنتج غير موجود', 'danger')
+            return redirect(url_for('workers.batch_shifts'))
+        worker_ids = {int(i) for i in request.form.getlist('worker_ids') if i.isdigit()}
+        worker_ids &= {worker_id for (worker_id,) in db.session.query(Worker.id).filter(Worker.id.in_(worker_ids))}
+        default_hours = request.form.get('hours', type=float) or 0
+
+        rows, hours_by_worker = [], {}
+        for worker_id in sorted(worker_ids):
+            hours = request.form.get(f'hours-{worker_id}', type=float)
+            hours = default_hours if hours is None else hours
+            if hours <= 0:
+                continue
+            hours_by_worker[worker_id] = hours
+            rows.append({
+                'worker_id': worker_id,
+                'shift_type': shift_type,
+                'location': location,
+                'product_type_id': product_type_id,
+                'work_type': request.form.get('work_type'),
+                'hours': hours,
+                'date': shift_date,
+                'notes': request.form.get('notes') or None
+            })
+        if not rows:
+            flash('لم يتم اختيار أي عامل بعدد ساعات صحيح', 'warning')
+            return redirect(url_for('workers.batch_shifts'))
+
+        # إدخال جماعي ثم تحديث ذري للساعات، في معاملة واحدة
+        try:
+            db.session.execute(insert(WorkShift), rows)
+            add_worker_hours(hours_by_worker)
+            db.session.commit()
+        except IntegrityError:
+            # مثلاً عامل أو منتج حُذف أثناء الإدخال: لا يُحفظ شيء
+            db.session.rollback()
+            flash('تعذر حفظ النوبات بسبب تعارض في البيانات، أعد المحاولة', 'danger')
+            return redirect(url_for('workers.batch_shifts'))
+        flash(f'تم إضافة {len(rows)} نوبة بتاريخ {shift_date.isoformat()}', 'success')
+        return redirect(url_for('workers.workers_list'))
+
+    workers = Worker.query.order_by(Worker.name).all()
+    product_types = ProductType.query.all()
+    return render_template('workers/batch_shifts.html', workers=workers, product_types=product_types)
+
 # ==================== Production Routes ====================
 @production_bp.route('/')
 @login_required
 @require_permission('view_production')
 def production_list():
-    productions = Production.query.all()
+    productions = keyset_paginate(Production.query.options(joinedload(Production.product_type)),
+                                  Production.date, Production.id)
     return render_template('production/list.html', productions=productions)
 
 @production_bp.route('/add', methods=['GET', 'POST'])
@@ -236,6 +322,7 @@ def add_production():
             notes=request.form.get('notes')
         )
         db.session.add(production)
+        rollup_apply(production)
         db.session.commit()
         flash('تم إضافة الإنتاج بنجاح', 'success')
         return redirect(url_for('production.production_list'))
@@ -248,7 +335,7 @@ def add_production():
 @login_required
 @require_permission('view_sales')
 def sales_list():
-    sales = Sales.query.all()
+    sales = keyset_paginate(Sales.query.options(joinedload(Sales.product_type)), Sales.date, Sales.id)
     return render_template('sales/list.html', sales=sales)
 
 @sales_bp.route('/add', methods=['GET', 'POST'])
@@ -273,6 +360,7 @@ def add_sale():
             notes=request.form.get('notes')
         )
         db.session.add(sale)
+        rollup_apply(sale)
         db.session.commit()
         flash('تم إضافة عملية البيع بنجاح', 'success')
         return redirect(url_for('sales.sales_list'))
@@ -285,9 +373,11 @@ def add_sale():
 @login_required
 @require_permission('view_fuel')
 def fuel_list():
-    fuel_logs = FuelLog.query.all()
-    total_usd = sum(log.total_usd for log in fuel_logs)
-    total_lbp = sum(log.total_lbp for log in fuel_logs)
+    fuel_logs = keyset_paginate(FuelLog.query, FuelLog.date, FuelLog.id)
+    total_usd, total_lbp = db.session.query(
+        func.coalesce(func.sum(FuelLog.total_usd), 0),
+        func.coalesce(func.sum(FuelLog.total_lbp), 0)
+    ).one()
     return render_template('fuel/list.html', fuel_logs=fuel_logs, total_usd=total_usd, total_lbp=total_lbp)
 
 @fuel_bp.route('/add', methods=['GET', 'POST'])
@@ -325,8 +415,9 @@ def add_fuel():
 @login_required
 @require_permission('view_medicines')
 def medicines_list():
-    medicines = Medicine.query.all()
-    return render_template('medicines/list.html', medicines=medicines)
+    medicines = keyset_paginate(Medicine.query, Medicine.date, Medicine.id)
+    stock_levels = get_stock_levels('دواء', [medicine.id for medicine in medicines])
+    return render_template('medicines/list.html', medicines=medicines, stock_levels=stock_levels)
 
 @medicines_bp.route('/add', methods=['GET', 'POST'])
 @login_required
@@ -358,8 +449,12 @@ def add_medicine():
 @login_required
 @require_permission('view_consumption')
 def consumption_list():
-    consumptions = Consumption.query.all()
-    return render_template('consumption/list.html', consumptions=consumptions)
+    consumptions = keyset_paginate(
+        Consumption.query.options(joinedload(Consumption.fuel), joinedload(Consumption.medicine),
+                                  joinedload(Consumption.fertilizer)),
+        Consumption.date, Consumption.id)
+    stock_levels = get_all_stock_levels()
+    return render_template('consumption/list.html', consumptions=consumptions, stock_levels=stock_levels)
 
 @consumption_bp.route('/add', methods=['GET', 'POST'])
 @login_required
@@ -387,131 +482,141 @@ def add_consumption():
             consumption.fertilizer_id = request.form.get('fertilizer_id', type=int)
         
         db.session.add(consumption)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except InsufficientStockError:
+            db.session.rollback()
+            flash('الكمية المستهلكة أكبر من الكمية المتبقية في المخزون', 'danger')
+            return redirect(url_for('consumption.add_consumption'))
         flash('تم تسجيل الاستهلاك بنجاح', 'success')
         return redirect(url_for('consumption.consumption_list'))
     
     fuels = FuelLog.query.all()
     medicines = Medicine.query.all()
     fertilizers = Fertilizer.query.all()
-    return render_template('consumption/add.html', fuels=fuels, medicines=medicines, fertilizers=fertilizers)
+    stock_levels = get_all_stock_levels()
+    return render_template('consumption/add.html', fuels=fuels, medicines=medicines, fertilizers=fertilizers,
+                           stock_levels=stock_levels)
 
 # ==================== Reports Routes ====================
 @reports_bp.route('/')
 @login_required
 @require_permission('view_reports')
 def reports_list():
-    reports = Report.query.all()
+    # استيراد داخل الدالة: report_jobs يستورد من هذه الوحدة
+    from app.report_jobs import resume_report_jobs
+    resume_report_jobs()
+    reports = keyset_paginate(Report.query, Report.created_at, Report.id)
     return render_template('reports/list.html', reports=reports)
 
+# كل تقرير: دالة تبني سياق القالب من الفترة، ليستخدمها العرض المباشر ومهام اللقطات الخلفية
+# (snapshot=True: كل السجلات بدلاً من صفحة واحدة)
+def workers_report_context(period, granularity, snapshot=False):
+    if period.is_all:
+        workers_accounts, totals = get_worker_balances()
+    else:
+        workers_accounts, totals = compute_period_balances(period.start, period.end)
+    return dict(workers_accounts=workers_accounts, period=period, **totals)
+
 @reports_bp.route('/workers')
 @login_required
 def workers_report():
-    workers = Worker.query.all()
-    return render_template('reports/workers_report.html', workers=workers)
+    return render_template('reports/workers_report.html',
+                           **workers_report_context(period_from_request(), _granularity_arg()))
 
-@reports_bp.route('/production')
-@login_required
-def production_report():
-    productions = Production.query.all()
+def _granularity_arg():
+    granularity = request.args.get('granularity', 'month')
+    return granularity if granularity in GRANULARITIES else 'month'
+
+def production_report_context(period, granularity, snapshot=False):
+    periods = get_rollups(PRODUCTION, period.start, period.end, granularity)
     
-    # تجميع البيانات حسب المنتج والموقع
+    # تجميع البيانات حسب المنتج والموقع (من جداول التجميع وليس من كل السجلات)
     grouped_data = {}
     total_by_product = {}
     
-    for prod in productions:
-        product_name = prod.product_type.name
-        location = prod.location or '-'
-        category = prod.product_type.category or '-'
-        
-        # مفتاح التجميع: المنتج + الموقع
-        key = f"{product_name}|{location}"
-        
+    for row in periods:
+        key = (row['product_name'], row['location'])
         if key not in grouped_data:
             grouped_data[key] = {
-                'product_name': product_name,
-                'category': category,
-                'location': location,
+                'product_name': row['product_name'],
+                'category': row['category'],
+                'location': row['location'],
                 'quantity': 0,
-                'unit': prod.unit,
-                'records': []
+                'unit': 'كجم',
+                'record_count': 0
             }
-        
-        grouped_data[key]['quantity'] += prod.quantity
-        grouped_data[key]['records'].append(prod)
-        
-        # حساب الإجمالي لكل منتج
-        if product_name not in total_by_product:
-            total_by_product[product_name] = 0
-        total_by_product[product_name] += prod.quantity
+        grouped_data[key]['quantity'] += row['quantity']
+        grouped_data[key]['record_count'] += row['record_count']
+        total_by_product[row['product_name']] = total_by_product.get(row['product_name'], 0) + row['quantity']
     
-    # تحويل البيانات المجمعة إلى قائمة مرتبة
     grouped_list = sorted(grouped_data.values(), key=lambda x: (x['product_name'], x['location']))
     
-    return render_template('reports/production_report.html', 
-                         productions=productions,
-                         grouped_data=grouped_list,
-                         total_by_product=total_by_product)
+    return dict(periods=periods,
+                grouped_data=grouped_list,
+                total_by_product=total_by_product,
+                period=period, granularity=granularity)
+
+@reports_bp.route('/production')
+@login_required
+def production_report():
+    return render_template('reports/production_report.html',
+                           **production_report_context(period_from_request(), _granularity_arg()))
+
+def sales_report_context(period, granularity, snapshot=False):
+    periods = get_rollups(SALES, period.start, period.end, granularity)
+    total_usd = sum(row['revenue_usd'] for row in periods)
+    total_lbp = sum(row['revenue_lbp'] for row in periods)
+    return dict(periods=periods, total_usd=total_usd, total_lbp=total_lbp, period=period, granularity=granularity)
 
 @reports_bp.route('/sales')
 @login_required
 def sales_report():
-    sales = Sales.query.all()
-    total_usd = sum(s.total_usd for s in sales)
-    total_lbp = sum(s.total_lbp for s in sales)
-    return render_template('reports/sales_report.html', sales=sales, total_usd=total_usd, total_lbp=total_lbp)
+    return render_template('reports/sales_report.html',
+                           **sales_report_context(period_from_request(), _granularity_arg()))
 
-@reports_bp.route('/accounting')
-@login_required
-def accounting_report():
+def accounting_report_context(period, granularity, snapshot=False):
     """تقرير محاسبي شامل - الإيرادات والمصروفات"""
-    accounting = Accounting.query.all()
-    
-    # حساب الإيرادات (إيراد)
-    revenues = [a for a in accounting if a.transaction_type == 'إيراد']
-    revenue_usd = sum(a.amount_usd for a in revenues)
-    revenue_lbp = sum(a.amount_lbp for a in revenues)
-    
-    # حساب المصروفات (مصروف)
-    expenses = [a for a in accounting if a.transaction_type == 'مصروف']
-    expenses_usd = sum(a.amount_usd for a in expenses)
-    expenses_lbp = sum(a.amount_lbp for a in expenses)
-    
-    # حساب النتيجة الصافية
-    net_usd = revenue_usd - expenses_usd
-    net_lbp = revenue_lbp - expenses_lbp
-    
-    # تجميع حسب الفئة
-    revenue_by_category = {}
-    expense_by_category = {}
-    
-    for transaction in accounting:
-        if transaction.transaction_type == 'إيراد':
-            if transaction.category not in revenue_by_category:
-                revenue_by_category[transaction.category] = {'usd': 0, 'lbp': 0}
-            revenue_by_category[transaction.category]['usd'] += transaction.amount_usd
-            revenue_by_category[transaction.category]['lbp'] += transaction.amount_lbp
-        else:
-            if transaction.category not in expense_by_category:
-                expense_by_category[transaction.category] = {'usd': 0, 'lbp': 0}
-            expense_by_category[transaction.category]['usd'] += transaction.amount_usd
-            expense_by_category[transaction.category]['lbp'] += transaction.amount_lbp
-    
-    return render_template(
-        'reports/accounting_report.html',
+    summary = get_accounting_summary(period.start, period.end)
+    query = period.apply(Accounting.query, Accounting.date)
+    if snapshot:
+        # اللقطة المحفوظة تحتوي كل معاملات الفترة، لا الصفحة الأولى فقط
+        rows = query.order_by(Accounting.date.desc(), Accounting.id.desc()).all()
+        accounting = KeysetPage(rows, len(rows), 'date')
+    else:
+        accounting = keyset_paginate(query, Accounting.date, Accounting.id)
+    
+    return dict(
         accounting=accounting,
-        revenues=revenues,
-        expenses=expenses,
-        revenue_usd=revenue_usd,
-        revenue_lbp=revenue_lbp,
-        expenses_usd=expenses_usd,
-        expenses_lbp=expenses_lbp,
-        net_usd=net_usd,
-        net_lbp=net_lbp,
-        revenue_by_category=revenue_by_category,
-        expense_by_category=expense_by_category
+        period=period,
+        revenue_count=summary['income_count'],
+        expense_count=summary['expense_count'],
+        revenue_usd=summary['income_usd'],
+        revenue_lbp=summary['income_lbp'],
+        expenses_usd=summary['expense_usd'],
+        expenses_lbp=summary['expense_lbp'],
+        net_usd=summary['income_usd'] - summary['expense_usd'],
+        net_lbp=summary['income_lbp'] - summary['expense_lbp'],
+        revenue_by_category=summary['income_by_category'],
+        expense_by_category=summary['expense_by_category']
     )
 
+@reports_bp.route('/accounting')
+@login_required
+def accounting_report():
+    return render_template('reports/accounting_report.html',
+                           **accounting_report_context(period_from_request(), _granularity_arg()))
+
+# نوع التقرير -> (العنوان، القالب، دالة السياق، نقطة العرض المباشر)
+REPORT_TYPES = {
+    'workers': ('تقرير العمال', 'reports/workers_report.html', workers_report_context, 'reports.workers_report'),
+    'production': ('تقرير الإنتاج', 'reports/production_report.html', production_report_context,
+                   'reports.production_report'),
+    'sales': ('تقرير المبيعات', 'reports/sales_report.html', sales_report_context, 'reports.sales_report'),
+    'accounting': ('التقرير المحاسبي', 'reports/accounting_report.html', accounting_report_context,
+                   'reports.accounting_report')
+}
+
 # ==================== Users & Permissions Routes ====================
 @settings_bp.route('/users')
 @login_required
@@ -576,11 +681,14 @@ def edit_user(user_id):
     user = User.query.get_or_404(user_id)
     
     if request.method == 'POST':
+        access = (user.role_id, bool(user.is_active), bool(user.is_admin))
         user.username = request.form.get('username')
         user.email = request.form.get('email')
         user.role_id = request.form.get('role_id', type=int)
         user.is_active = request.form.get('is_active') == 'on'
         user.is_admin = request.form.get('is_admin') == 'on'
+        if (user.role_id, user.is_active, user.is_admin) != access:
+            user.bump_auth_version()
         
         password = request.form.get('password')
         if password:
@@ -716,7 +824,12 @@ def edit_role(role_id):
             if request.form.get(perm):
                 permissions.append(perm)
         
-        role.permissions = ','.join(permissions) if permissions else ''
+        new_permissions = ','.join(permissions) if permissions else ''
+        if new_permissions != (role.permissions or ''):
+            # لقطات الجلسة لمستخدمي هذا الدور تحمل الصلاحيات القديمة
+            User.query.filter_by(role_id=role.id).update(
+                {User.auth_version: func.coalesce(User.auth_version, 0) + 1}, synchronize_session=False)
+        role.permissions = new_permissions
         
         db.session.commit()
         flash(f'تم تحديث الدور {role.name} بنجاح', 'success')
@@ -795,6 +908,7 @@ def delete_product_type(product_type_id):
         return jsonify({'error': 'Unauthorized'}), 403
     
     product_type = ProductType.query.get_or_404(product_type_id)
+    delete_product_type_records(product_type.id)
     db.session.delete(product_type)
     db.session.commit()
     
@@ -806,11 +920,10 @@ def delete_product_type(product_type_id):
 @require_permission('view_attendance')
 def attendance_list():
     """Display attendance records"""
-    page = request.args.get('page', 1, type=int)
     search_worker = request.args.get('worker', '', type=str)
     search_date = request.args.get('date', '', type=str)
     
-    query = Attendance.query
+    query = Attendance.query.options(joinedload(Attendance.worker))
     
     if search_worker:
         query = query.filter(Worker.name.ilike(f'%{search_worker}%')).join(Worker)
@@ -822,49 +935,15 @@ def attendance_list():
         except:
             pass
     
-    attendance_records = query.paginate(page=page, per_page=20)
-    workers = Worker.query.all()
-    
-    # حساب معلومات الحسابات لكل عامل
-    workers_accounts = []
-    for worker in workers:
-        total_advances_usd = worker.get_total_advances_usd()
-        total_advances_lbp = worker.get_total_advances_lbp()
-        workers_accounts.append({
-            'worker': worker,
-            'total_hours': worker.total_hours,
-            'hourly_rate_usd': worker.hourly_rate_usd,
-            'hourly_rate_lbp': worker.hourly_rate_lbp,
-            'total_earnings_usd': worker.get_total_earnings_usd(),
-            'total_earnings_lbp': worker.get_total_earnings_lbp(),
-            'total_advances_usd': total_advances_usd,
-            'total_advances_lbp': total_advances_lbp,
-            'balance_usd': worker.get_balance_usd(),
-            'balance_lbp': worker.get_balance_lbp()
-        })
-    
-    # حساب إجماليات للملخص
-    total_workers = len(workers_accounts)
-    total_all_hours = sum(account['total_hours'] for account in workers_accounts)
-    total_all_earnings_usd = sum(account['total_earnings_usd'] for account in workers_accounts)
-    total_all_earnings_lbp = sum(account['total_earnings_lbp'] for account in workers_accounts)
-    total_all_advances_usd = sum(account['total_advances_usd'] for account in workers_accounts)
-    total_all_advances_lbp = sum(account['total_advances_lbp'] for account in workers_accounts)
-    total_all_balance_usd = sum(account['balance_usd'] for account in workers_accounts)
-    total_all_balance_lbp = sum(account['balance_lbp'] for account in workers_accounts)
+    attendance_records = keyset_paginate(query, Attendance.date, Attendance.id, with_total=True)
+    workers_accounts, totals = get_worker_balances()
+    workers = [account['worker'] for account in workers_accounts]
     
     return render_template('attendance/list.html', 
                          attendance_records=attendance_records, 
                          workers=workers, 
                          workers_accounts=workers_accounts,
-                         total_workers=total_workers,
-                         total_all_hours=total_all_hours,
-                         total_all_earnings_usd=total_all_earnings_usd,
-                         total_all_earnings_lbp=total_all_earnings_lbp,
-                         total_all_advances_usd=total_all_advances_usd,
-                         total_all_advances_lbp=total_all_advances_lbp,
-                         total_all_balance_usd=total_all_balance_usd,
-                         total_all_balance_lbp=total_all_balance_lbp)
+                         **totals)
 
 @attendance_bp.route('/add', methods=['GET', 'POST'])
 @login_required
@@ -907,7 +986,13 @@ def add_attendance():
                 pass
         
         db.session.add(attendance)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # تسجيل متزامن لنفس العامل في نفس اليوم
+            db.session.rollback()
+            flash('تم تسجيل الحضور بالفعل لهذا العامل في هذا التاريخ', 'warning')
+            return redirect(url_for('attendance.attendance_list'))
         
         flash('تم تسجيل الحضور بنجاح', 'success')
         return redirect(url_for('attendance.attendance_list'))
@@ -915,6 +1000,81 @@ def add_attendance():
     workers = Worker.query.all()
     return render_template('attendance/add.html', workers=workers)
 
+ATTENDANCE_STATUSES = ('حاضر', 'غائب', 'نصف يوم')
+
+def _parse_time(value):
+    try:
+        return datetime.strptime(value, '%H:%M').time() if value else None
+    except ValueError:
+        return None
+
+@attendance_bp.route('/batch', methods=['GET', 'POST'])
+@login_required
+@require_permission('add_attendance')
+def batch_attendance():
+    """تسجيل حضور الفريق كاملاً ليوم واحد في طلب واحد"""
+    try:
+        att_date = datetime.strptime(request.values.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        att_date = date.today()
+
+    if request.method == 'POST':
+        worker_ids = sorted({int(i) for i in request.form.getlist('worker_ids') if i.isdigit()})
+        if not worker_ids:
+            flash('لم يتم اختيار أي عامل', 'warning')
+            return redirect(url_for('attendance.batch_attendance', date=att_date.isoformat()))
+
+        # استعلام واحد بدلاً من فحص لكل عامل
+        existing = {worker_id for (worker_id,) in db.session.query(Attendance.worker_id).filter(
+            Attendance.date == att_date, Attendance.worker_id.in_(worker_ids))}
+        known = {worker_id for (worker_id,) in db.session.query(Worker.id).filter(Worker.id.in_(worker_ids))}
+
+        records = []
+        for worker_id in worker_ids:
+            if worker_id in existing or worker_id not in known:
+                continue
+            status = request.form.get(f'status-{worker_id}')
+            if status not in ATTENDANCE_STATUSES:
+                status = ATTENDANCE_STATUSES[0]
+            records.append(Attendance(
+                worker_id=worker_id,
+                date=att_date,
+                status=status,
+                hours_worked=request.form.get(f'hours-{worker_id}', type=float) or 0,
+                check_in_time=_parse_time(request.form.get(f'check_in-{worker_id}')),
+                check_out_time=_parse_time(request.form.get(f'check_out-{worker_id}')),
+                notes=request.form.get(f'notes-{worker_id}') or None
+            ))
+
+        db.session.add_all(records)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # تسجيل متزامن لنفس اليوم: لا يُحفظ شيء
+            db.session.rollback()
+            flash('تم تسجيل حضور بعض العمال في هذا التاريخ أثناء الإدخال، أعد المحاولة', 'warning')
+            return redirect(url_for('attendance.batch_attendance', date=att_date.isoformat()))
+
+        message = f'تم تسجيل حضور {len(records)} عامل بتاريخ {att_date.isoformat()}'
+        if existing:
+            message += f' (تم تخطي {len(existing)} مسجلين مسبقاً)'
+        flash(message, 'success')
+        return redirect(url_for('attendance.attendance_list', date=att_date.isoformat()))
+
+    workers = Worker.query.order_by(Worker.name).all()
+    recorded = {a.worker_id: a for a in Attendance.query.filter_by(date=att_date)}
+
+    # نسخ قائمة آخر يوم مسجل قبل التاريخ المختار
+    copied_from, template = None, {}
+    if request.args.get('copy'):
+        copied_from = db.session.query(func.max(Attendance.date)).filter(Attendance.date < att_date).scalar()
+        if copied_from:
+            template = {a.worker_id: a for a in Attendance.query.filter_by(date=copied_from)}
+
+    return render_template('attendance/batch.html', workers=workers, att_date=att_date,
+                           recorded=recorded, template=template, copied_from=copied_from,
+                           statuses=ATTENDANCE_STATUSES)
+
 @attendance_bp.route('/<int:attendance_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_attendance(attendance_id):
@@ -963,11 +1123,10 @@ def delete_attendance(attendance_id):
 @require_permission('view_accounting')
 def accounting_list():
     """Display accounting records"""
-    page = request.args.get('page', 1, type=int)
     transaction_type = request.args.get('type', '', type=str)
     category = request.args.get('category', '', type=str)
     
-    query = Accounting.query
+    query = Accounting.query.options(joinedload(Accounting.worker))
     
     if transaction_type:
         query = query.filter_by(transaction_type=transaction_type)
@@ -975,21 +1134,17 @@ def accounting_list():
     if category:
         query = query.filter_by(category=category)
     
-    accounting_records = query.order_by(Accounting.date.desc()).paginate(page=page, per_page=20)
+    accounting_records = keyset_paginate(query, Accounting.date, Accounting.id, with_total=True)
     
     # Calculate totals
-    all_records = Accounting.query.all()
-    total_income_usd = sum(r.amount_usd for r in all_records if r.transaction_type == 'إيراد')
-    total_expense_usd = sum(r.amount_usd for r in all_records if r.transaction_type == 'مصروف')
-    total_income_lbp = sum(r.amount_lbp for r in all_records if r.transaction_type == 'إيراد')
-    total_expense_lbp = sum(r.amount_lbp for r in all_records if r.transaction_type == 'مصروف')
+    totals = get_accounting_totals()
     
     return render_template('accounting/list.html', 
                          accounting_records=accounting_records,
-                         total_income_usd=total_income_usd,
-                         total_expense_usd=total_expense_usd,
-                         total_income_lbp=total_income_lbp,
-                         total_expense_lbp=total_expense_lbp)
+                         total_income_usd=totals['income_usd'],
+                         total_expense_usd=totals['expense_usd'],
+                         total_income_lbp=totals['income_lbp'],
+                         total_expense_lbp=totals['expense_lbp'])
 
 @accounting_bp.route('/add', methods=['GET', 'POST'])
 @login_required
@@ -1029,6 +1184,7 @@ def add_accounting():
             return redirect(url_for('accounting.add_accounting'))
         
         db.session.add(accounting)
+        ledger_apply_advance(advance_amounts(accounting))
         db.session.commit()
         
         flash('تم إضافة المعاملة المحاسبية بنجاح', 'success')
@@ -1044,6 +1200,7 @@ def edit_accounting(accounting_id):
     accounting = Accounting.query.get_or_404(accounting_id)
     
     if request.method == 'POST':
+        old_advance = advance_amounts(accounting)
         accounting.transaction_type = request.form.get('transaction_type')
         accounting.category = request.form.get('category')
         amount_usd_str = request.form.get('amount_usd', '0').strip()
@@ -1064,6 +1221,8 @@ def edit_accounting(accounting_id):
             flash('يجب اختيار العامل عند إضافة سلفة', 'danger')
             return redirect(url_for('accounting.edit_accounting', accounting_id=accounting_id))
         
+        ledger_apply_advance(old_advance, sign=-1)
+        ledger_apply_advance(advance_amounts(accounting))
         db.session.commit()
         flash('تم تحديث المعاملة المحاسبية بنجاح', 'success')
         return redirect(url_for('accounting.accounting_list'))
@@ -1076,6 +1235,7 @@ def edit_accounting(accounting_id):
 def delete_accounting(accounting_id):
     """Delete accounting record"""
     accounting = Accounting.query.get_or_404(accounting_id)
+    ledger_apply_advance(advance_amounts(accounting), sign=-1)
     db.session.delete(accounting)
     db.session.commit()
     flash('تم حذف المعاملة المحاسبية بنجاح', 'success')
@@ -1085,49 +1245,16 @@ def delete_accounting(accounting_id):
 @login_required
 def accounting_report():
     """Generate accounting report"""
-    start_date = request.args.get('start_date', '', type=str)
-    end_date = request.args.get('end_date', '', type=str)
-    
-    query = Accounting.query
-    
-    if start_date:
-        try:
-            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-            query = query.filter(Accounting.date >= start_date_obj)
-        except:
-            pass
-    
-    if end_date:
-        try:
-            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-            query = query.filter(Accounting.date <= end_date_obj)
-        except:
-            pass
-    
-    records = query.order_by(Accounting.date.desc()).all()
-    
-    # Calculate totals by category
-    income_by_category = {}
-    expense_by_category = {}
-    
-    for record in records:
-        if record.transaction_type == 'إيراد':
-            if record.category not in income_by_category:
-                income_by_category[record.category] = {'usd': 0, 'lbp': 0}
-            income_by_category[record.category]['usd'] += record.amount_usd
-            income_by_category[record.category]['lbp'] += record.amount_lbp
-        else:
-            if record.category not in expense_by_category:
-                expense_by_category[record.category] = {'usd': 0, 'lbp': 0}
-            expense_by_category[record.category]['usd'] += record.amount_usd
-            expense_by_category[record.category]['lbp'] += record.amount_lbp
+    period = period_from_request()
+    summary = get_accounting_summary(period.start, period.end)
+    records = keyset_paginate(period.apply(Accounting.query, Accounting.date), Accounting.date, Accounting.id)
     
     return render_template('accounting/report.html',
                          records=records,
-                         income_by_category=income_by_category,
-                         expense_by_category=expense_by_category,
-                         start_date=start_date,
-                         end_date=end_date)
+                         summary=summary,
+                         income_by_category=summary['income_by_category'],
+                         expense_by_category=summary['expense_by_category'],
+                         period=period)
 
 # ==================== Admin Delete Routes ====================
 # These routes allow admin to delete any record in case of errors
@@ -1144,8 +1271,10 @@ def admin_delete_worker(worker_id):
     worker_name = worker.name
     
     # Delete all related records
-    WorkShift.query.filter_by(worker_id=worker_id).delete()
-    Attendance.query.filter_by(worker_id=worker_id).delete()
+    for query in (WorkShift.query.filter_by(worker_id=worker_id), Attendance.query.filter_by(worker_id=worker_id)):
+        record_bulk_delete(query)
+        query.delete()
+    WorkerLedger.query.filter_by(worker_id=worker_id).delete()
     
     db.session.delete(worker)
     db.session.commit()
@@ -1183,6 +1312,7 @@ def admin_delete_production(production_id):
     product_name = production.product_type.name if production.product_type else 'غير محدد'
     quantity = production.quantity
     
+    rollup_apply(production, sign=-1)
     db.session.delete(production)
     db.session.commit()
     
@@ -1201,6 +1331,7 @@ def admin_delete_sale(sale_id):
     product_name = sale.product_type.name if sale.product_type else 'غير محدد'
     total_usd = sale.total_usd
     
+    rollup_apply(sale, sign=-1)
     db.session.delete(sale)
     db.session.commit()
     
@@ -1274,6 +1405,7 @@ def admin_delete_accounting(accounting_id):
     amount_usd = accounting.amount_usd
     category = accounting.category
     
+    ledger_apply_advance(advance_amounts(accounting), sign=-1)
     db.session.delete(accounting)
     db.session.commit()
     
@@ -0,0 +1,272 @@
+"""
+توليد بيانات مزرعة اصطناعية لعدة مواسم
+Synthetic multi-season farm dataset for local load testing.
+"""
+import random
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import func, insert, update
+from app import db
+from app.models import (Worker, WorkShift, ProductType, Production, Sales, FuelLog, Medicine,
+                        Fertilizer, Consumption, Attendance, Accounting)
+from app.services import (rebuild_worker_ledger, rebuild_rollups, invalidate_accounting_totals,
+                          SYNCED_MODELS, FUEL, MEDICINE, FERTILIZER, INCOME, EXPENSE)
+
+BATCH_SIZE = 5000
+
+DEFAULT_COUNTS = {
+    'workers': 150,
+    'shifts': 60000,
+    'attendance': 40000,
+    'production': 8000,
+    'sales': 6000,
+    'fuel': 600,
+    'medicines': 400,
+    'fertilizers': 400,
+    'consumption': 12000,
+    'accounting': 20000,
+}
+
+FIRST_NAMES = ['محمد', 'أحمد', 'علي', 'حسن', 'حسين', 'خليل', 'يوسف', 'إبراهيم', 'سامي', 'جورج',
+               'طوني', 'إيلي', 'ربيع', 'فادي', 'وسيم', 'مريم', 'فاطمة', 'زينب', 'ليلى', 'رنا']
+LAST_NAMES = ['الحاج', 'شمص', 'جعفر', 'زعيتر', 'ناصر', 'حيدر', 'عواد', 'سليمان', 'طربيه', 'نصار']
+PRODUCTS = [('دراق', 'دراق'), ('تفاح أحمر', 'تفاح'), ('تفاح أصفر', 'تفاح'), ('كرز', 'كرز'),
+            ('بطاطا', 'خضروات'), ('بندورة', 'خضروات'), ('عنب', 'عنب'), ('إجاص', 'إجاص')]
+LOCATIONS = ['جبل', 'سهل']
+SHIFT_TYPES = ['صباحي', 'بعد ظهر']
+WORK_TYPES = ['تنظيف', 'تقليم', 'تشحيل', 'جني', 'أخرى']
+FUEL_TYPES = ['مازوت', 'بنزين']
+MEDICINES = [('مبيد فطري', 'لتر'), ('مبيد حشري', 'لتر'), ('كبريت', 'كجم'), ('زيت صيفي', 'لتر')]
+FERTILIZERS = [('يوريا', 'كجم'), ('NPK 20-20-20', 'كجم'), ('سماد عضوي', 'كجم'), ('نترات الكالسيوم', 'كجم')]
+ATTENDANCE_STATUSES = ['حاضر'] * 8 + ['غائب', 'نصف يوم']
+EXPENSE_CATEGORIES = ['رواتب', 'سلفة', 'وقود', 'أدوية', 'أسمدة', 'إصلاحات', 'أخرى']
+INCOME_CATEGORIES = ['مبيعات', 'إنتاج', 'أخرى']
+LBP_RATE = 89500
+
+
+def _insert(model, rows):
+    """Bulk insert in batches (mapper events are intentionally skipped)."""
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(insert(model), rows[start:start + BATCH_SIZE])
+
+
+def _season_day(rng, days):
+    """Random day, weighted towards the summer harvest months."""
+    while True:
+        day = date.today() - timedelta(days=rng.randrange(days))
+        if day.month in (6, 7, 8, 9, 10) or rng.random() < 0.4:
+            return day
+
+
+def _created(rng, day):
+    return datetime.combine(day, time(8)) + timedelta(minutes=rng.randrange(600))
+
+
+def generate_farm_data(seasons=3, seed=None, **counts):
+    """Insert a synthetic dataset spanning ``seasons`` years and commit.
+
+    ``counts`` overrides any key of ``DEFAULT_COUNTS``. Rows are written with
+    bulk INSERTs, so on-hand stock is computed here and the worker ledger and
+    report rollups are rebuilt afterwards instead of by the per-row hooks. Returns the number of rows
+    inserted per table.
+    """
+    unknown = set(counts) - set(DEFAULT_COUNTS)
+    if unknown:
+        raise ValueError(f'Unknown counts: {", ".join(sorted(unknown))}')
+    counts = {**DEFAULT_COUNTS, **counts}
+    rng = random.Random(seed)
+    days = max(1, seasons) * 365
+    inserted = {}
+    started = datetime.utcnow()
+
+    # ---- أنواع المنتجات ----
+    existing = {p.name: p.id for p in ProductType.query.all()}
+    for name, category in PRODUCTS:
+        if name not in existing:
+            product = ProductType(name=name, category=category)
+            db.session.add(product)
+            db.session.flush()
+            existing[name] = product.id
+    product_ids = list(existing.values())
+
+    # ---- العمال ----
+    first_worker = (db.session.query(func.max(Worker.id)).scalar() or 0) + 1
+    workers = []
+    for index in range(counts['workers']):
+        rate_usd = round(rng.uniform(2, 6), 2)
+        workers.append({
+            'id': first_worker + index,
+            'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {first_worker + index}',
+            'phone': f'03{rng.randrange(100000, 999999)}',
+            'hourly_rate_usd': rate_usd,
+            'hourly_rate_lbp': round(rate_usd * LBP_RATE, -3),
+            'advance': 0,
+            'total_hours': 0,
+            'created_at': datetime.now() - timedelta(days=rng.randrange(days)),
+        })
+    worker_ids = [w['id'] for w in workers]
+
+    # ---- النوبات ----
+    shifts = []
+    hours_by_worker = dict.fromkeys(worker_ids, 0)
+    for _ in range(counts['shifts'] if worker_ids else 0):
+        worker_id = rng.choice(worker_ids)
+        hours = rng.choice([4, 4.5, 5, 6, 8])
+        hours_by_worker[worker_id] += hours
+        shifts.append({
+            'worker_id': worker_id,
+            'shift_type': rng.choice(SHIFT_TYPES),
+            'location': rng.choice(LOCATIONS),
+            'product_type_id': rng.choice(product_ids),
+            'work_type': rng.choice(WORK_TYPES),
+            'hours': hours,
+            'date': _season_day(rng, days),
+        })
+    for worker in workers:
+        worker['total_hours'] = hours_by_worker[worker['id']]
+    _insert(Worker, workers)
+    _insert(WorkShift, shifts)
+    inserted['workers'], inserted['shifts'] = len(workers), len(shifts)
+
+    # ---- الحضور: الفريق كاملاً يوماً بيوم بدءاً من اليوم (عمال جدد، فلا تعارض مع القيد الفريد) ----
+    attendance = []
+    day = date.today()
+    while len(attendance) < counts['attendance'] and worker_ids and (date.today() - day).days < days:
+        for worker_id in worker_ids:
+            if len(attendance) >= counts['attendance']:
+                break
+            status = rng.choice(ATTENDANCE_STATUSES)
+            hours = {'حاضر': 8, 'نصف يوم': 4}.get(status, 0)
+            attendance.append({
+                'worker_id': worker_id,
+                'date': day,
+                'status': status,
+                'check_in_time': time(7) if hours else None,
+                'check_out_time': time(7 + hours) if hours else None,
+                'hours_worked': hours,
+                'created_at': _created(rng, day),
+            })
+        day -= timedelta(days=1)
+    _insert(Attendance, attendance)
+    inserted['attendance'] = len(attendance)
+
+    # ---- الإنتاج والمبيعات ----
+    production = []
+    for _ in range(counts['production']):
+        day = _season_day(rng, days)
+        production.append({
+            'product_type_id': rng.choice(product_ids),
+            'location': rng.choice(LOCATIONS),
+            'quantity': round(rng.uniform(50, 3000), 1),
+            'unit': 'كجم',
+            'date': day,
+            'created_at': _created(rng, day),
+        })
+    sales = []
+    for _ in range(counts['sales']):
+        day = _season_day(rng, days)
+        quantity = round(rng.uniform(20, 2000), 1)
+        price = round(rng.uniform(0.3, 2.5), 2)
+        sales.append({
+            'product_type_id': rng.choice(product_ids),
+            'quantity': quantity,
+            'unit': 'كجم',
+            'price_per_unit_usd': price,
+            'price_per_unit_lbp': round(price * LBP_RATE, -2),
+            'total_usd': round(quantity * price, 2),
+            'total_lbp': round(quantity * price * LBP_RATE, -2),
+            'date': day,
+            'created_at': _created(rng, day),
+        })
+    _insert(Production, production)
+    _insert(Sales, sales)
+    inserted['production'], inserted['sales'] = len(production), len(sales)
+
+    # ---- المخزون: وقود، أدوية، أسمدة ----
+    def lot_rows(model, count, build):
+        first = (db.session.query(func.max(model.id)).scalar() or 0) + 1
+        rows = []
+        for index in range(count):
+            day = _season_day(rng, days)
+            row = build(day)
+            row.update(id=first + index, date=day, created_at=_created(rng, day))
+            rows.append(row)
+        return rows
+
+    def fuel_lot(day):
+        liters = round(rng.uniform(200, 2000), 1)
+        price = round(rng.uniform(0.8, 1.4), 2)
+        return {'fuel_type': rng.choice(FUEL_TYPES), 'liters': liters, 'quantity_on_hand': liters,
+                'price_per_liter_usd': price, 'price_per_liter_lbp': round(price * LBP_RATE, -2),
+                'total_usd': round(liters * price, 2), 'total_lbp': round(liters * price * LBP_RATE, -2)}
+
+    def input_lot(catalogue):
+        def build(day):
+            name, unit = rng.choice(catalogue)
+            quantity = round(rng.uniform(20, 500), 1)
+            price = round(rng.uniform(1, 15), 2)
+            return {'name': name, 'unit': unit, 'quantity': quantity, 'quantity_on_hand': quantity,
+                    'price_usd': price, 'price_lbp': round(price * LBP_RATE, -2)}
+        return build
+
+    lots = {
+        FUEL: (FuelLog, 'fuel_id', 'لتر', lot_rows(FuelLog, counts['fuel'], fuel_lot)),
+        MEDICINE: (Medicine, 'medicine_id', None, lot_rows(Medicine, counts['medicines'], input_lot(MEDICINES))),
+        FERTILIZER: (Fertilizer, 'fertilizer_id', None,
+                     lot_rows(Fertilizer, counts['fertilizers'], input_lot(FERTILIZERS))),
+    }
+
+    # الاستهلاك لا يتجاوز الكمية المتبقية في الدفعة
+    consumption = []
+    lot_types = [t for t, (_, _, _, rows) in lots.items() if rows]
+    for _ in range(counts['consumption'] if lot_types else 0):
+        consumption_type = rng.choice(lot_types)
+        model, fk, unit, rows = lots[consumption_type]
+        lot = rng.choice(rows)
+        if lot['quantity_on_hand'] <= 1:
+            continue
+        quantity = round(min(lot['quantity_on_hand'], rng.uniform(1, 40)), 1)
+        lot['quantity_on_hand'] = round(lot['quantity_on_hand'] - quantity, 4)
+        day = max(lot['date'], _season_day(rng, days))
+        consumption.append({
+            'consumption_type': consumption_type,
+            fk: lot['id'],
+            'quantity_consumed': quantity,
+            'unit': unit or lot['unit'],
+            'date': day,
+            'created_at': _created(rng, day),
+        })
+    for key, (model, _, _, rows) in zip(('fuel', 'medicines', 'fertilizers'), lots.values()):
+        _insert(model, rows)
+        inserted[key] = len(rows)
+    _insert(Consumption, consumption)
+    inserted['consumption'] = len(consumption)
+
+    # ---- المحاسبة ----
+    accounting = []
+    for _ in range(counts['accounting']):
+        day = _season_day(rng, days)
+        income = rng.random() < 0.35
+        category = rng.choice(INCOME_CATEGORIES if income else EXPENSE_CATEGORIES)
+        amount = round(rng.uniform(10, 1500 if income else 600), 2)
+        accounting.append({
+            'transaction_type': INCOME if income else EXPENSE,
+            'category': category,
+            'worker_id': rng.choice(worker_ids) if category in ('سلفة', 'رواتب') and worker_ids else None,
+            'amount_usd': amount,
+            'amount_lbp': round(amount * LBP_RATE, -3) if rng.random() < 0.3 else 0,
+            'description': f'{category} - {day.isoformat()}',
+            'date': day,
+            'created_at': _created(rng, day),
+        })
+    _insert(Accounting, accounting)
+    inserted['accounting'] = len(accounting)
+
+    rebuild_worker_ledger(fix=True)
+    rebuild_rollups()
+    # updated_at = وقت الحفظ: التوليد أطول من SYNC_SETTLE_SECONDS (انظر sync.pull_changes)
+    now = datetime.utcnow()
+    for model in SYNCED_MODELS:
+        db.session.execute(update(model).where(model.updated_at >= started).values(updated_at=now))
+    db.session.commit()
+    invalidate_accounting_totals()
+    return inserted
@@ -0,0 +1,896 @@
+import hashlib
+import time
+from datetime import date, datetime, timedelta
+from flask import current_app
+from sqlalchemy import bindparam, func, event, inspect, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from app import db
+from app.models import (Worker, WorkShift, ProductType, Production, Sales, FuelLog, Medicine, Fertilizer,
+                        Consumption, Attendance, Accounting, WorkerLedger, DailyRollup, MonthlyRollup,
+                        SyncTombstone, SchemaVersion)
+
+# ==================== Worker Balances ====================
+def _advances_subquery(start=None, end=None):
+    """إجمالي السلفات لكل عامل في استعلام واحد مجمّع"""
+    query = db.session.query(
+        Accounting.worker_id.label('worker_id'),
+        func.sum(Accounting.amount_usd).label('advances_usd'),
+        func.sum(Accounting.amount_lbp).label('advances_lbp')
+    ).filter(
+        Accounting.worker_id.isnot(None),
+        Accounting.transaction_type == 'مصروف',
+        Accounting.category == 'سلفة'
+    )
+    if start is not None:
+        query = query.filter(Accounting.date >= start)
+    if end is not None:
+        query = query.filter(Accounting.date <= end)
+    return query.group_by(Accounting.worker_id).subquery()
+
+def _compute_balances(worker_ids=None):
+    """Aggregate balances straight from Worker and Accounting (source of truth)."""
+    advances = _advances_subquery()
+    hours = func.coalesce(Worker.total_hours, 0)
+    advances_usd = func.coalesce(advances.c.advances_usd, 0)
+    advances_lbp = func.coalesce(advances.c.advances_lbp, 0)
+
+    query = db.session.query(
+        Worker,
+        (hours * func.coalesce(Worker.hourly_rate_usd, 0)).label('earnings_usd'),
+        (hours * func.coalesce(Worker.hourly_rate_lbp, 0)).label('earnings_lbp'),
+        advances_usd.label('advances_usd'),
+        advances_lbp.label('advances_lbp')
+    ).outerjoin(advances, advances.c.worker_id == Worker.id)
+
+    if worker_ids is not None:
+        query = query.filter(Worker.id.in_(worker_ids))
+
+    accounts = []
+    for worker, earnings_usd, earnings_lbp, adv_usd, adv_lbp in query.order_by(Worker.id).all():
+        accounts.append(_account_row(worker, worker.total_hours, earnings_usd, earnings_lbp, adv_usd, adv_lbp))
+    return accounts
+
+def compute_period_balances(start=None, end=None):
+    """Hours, earnings and advances per worker restricted to ``[start, end]``.
+
+    Hours are ``SUM(WorkShift.hours)`` and advances ``SUM(amount)`` over the
+    period, both grouped per worker in SQL; earnings use the current hourly
+    rate. Returns ``(accounts, totals)`` like get_worker_balances().
+    """
+    shifts = db.session.query(
+        WorkShift.worker_id.label('worker_id'),
+        func.sum(WorkShift.hours).label('hours')
+    )
+    if start is not None:
+        shifts = shifts.filter(WorkShift.date >= start)
+    if end is not None:
+        shifts = shifts.filter(WorkShift.date <= end)
+    shifts = shifts.group_by(WorkShift.worker_id).subquery()
+    advances = _advances_subquery(start, end)
+    hours = func.coalesce(shifts.c.hours, 0)
+
+    query = db.session.query(
+        Worker,
+        hours,
+        hours * func.coalesce(Worker.hourly_rate_usd, 0),
+        hours * func.coalesce(Worker.hourly_rate_lbp, 0),
+        func.coalesce(advances.c.advances_usd, 0),
+        func.coalesce(advances.c.advances_lbp, 0)
+    ).outerjoin(shifts, shifts.c.worker_id == Worker.id).outerjoin(advances, advances.c.worker_id == Worker.id)
+
+    accounts = [_account_row(*row) for row in query.order_by(Worker.id).all()]
+    return accounts, summarize_balances(accounts)
+
+def _account_row(worker, hours, earnings_usd, earnings_lbp, advances_usd, advances_lbp):
+    earnings_usd = earnings_usd or 0
+    earnings_lbp = earnings_lbp or 0
+    advances_usd = advances_usd or 0
+    advances_lbp = advances_lbp or 0
+    return {
+        'worker': worker,
+        'total_hours': hours or 0,
+        'hourly_rate_usd': worker.hourly_rate_usd or 0,
+        'hourly_rate_lbp': worker.hourly_rate_lbp or 0,
+        'total_earnings_usd': earnings_usd,
+        'total_earnings_lbp': earnings_lbp,
+        'total_advances_usd': advances_usd,
+        'total_advances_lbp': advances_lbp,
+        'balance_usd': earnings_usd - advances_usd,
+        'balance_lbp': earnings_lbp - advances_lbp
+    }
+
+def get_worker_balances(worker_ids=None):
+    """Return hours, earnings, advances and balance for all workers.
+
+    Reads the materialized ``WorkerLedger`` rows (one row per worker). Workers
+    that have no ledger row yet (data created before the table existed) fall
+    back to the grouped aggregate until ``flask rebuild-ledger`` is run.
+
+    Returns a tuple ``(accounts, totals)`` where ``accounts`` is a list of dicts
+    (one per worker) and ``totals`` is the summary row shown under the tables.
+    """
+    query = db.session.query(Worker, WorkerLedger).outerjoin(
+        WorkerLedger, WorkerLedger.worker_id == Worker.id
+    )
+    if worker_ids is not None:
+        query = query.filter(Worker.id.in_(worker_ids))
+
+    accounts = []
+    missing = []
+    for worker, ledger in query.order_by(Worker.id).all():
+        if ledger is None:
+            missing.append(worker.id)
+            accounts.append(None)
+            continue
+        accounts.append(_account_row(worker, ledger.total_hours, ledger.earnings_usd, ledger.earnings_lbp,
+                                     ledger.advances_usd, ledger.advances_lbp))
+
+    if missing:
+        computed = iter(_compute_balances(missing))
+        accounts = [account if account is not None else next(computed) for account in accounts]
+
+    if worker_ids is not None:
+        # نفس ترتيب المعرفات المطلوبة (مثلاً ترتيب الصفحة)
+        order = {worker_id: i for i, worker_id in enumerate(worker_ids)}
+        accounts.sort(key=lambda account: order[account['worker'].id])
+
+    return accounts, summarize_balances(accounts)
+
+def summarize_balances(accounts):
+    """حساب صف الإجماليات لجميع العمال"""
+    return {
+        'total_workers': len(accounts),
+        'total_all_hours': sum(a['total_hours'] for a in accounts),
+        'total_all_earnings_usd': sum(a['total_earnings_usd'] for a in accounts),
+        'total_all_earnings_lbp': sum(a['total_earnings_lbp'] for a in accounts),
+        'total_all_advances_usd': sum(a['total_advances_usd'] for a in accounts),
+        'total_all_advances_lbp': sum(a['total_advances_lbp'] for a in accounts),
+        'total_all_balance_usd': sum(a['balance_usd'] for a in accounts),
+        'total_all_balance_lbp': sum(a['balance_lbp'] for a in accounts)
+    }
+
+def get_balance_totals():
+    """The summary row for all workers, whatever page of the list is shown.
+
+    One grouped SUM over the ``WorkerLedger`` rows; workers without a ledger
+    row are added from the aggregate fallback like in get_worker_balances().
+    """
+    count, hours, earnings_usd, earnings_lbp, advances_usd, advances_lbp = db.session.query(
+        func.count(WorkerLedger.id),
+        func.coalesce(func.sum(WorkerLedger.total_hours), 0),
+        func.coalesce(func.sum(WorkerLedger.earnings_usd), 0),
+        func.coalesce(func.sum(WorkerLedger.earnings_lbp), 0),
+        func.coalesce(func.sum(WorkerLedger.advances_usd), 0),
+        func.coalesce(func.sum(WorkerLedger.advances_lbp), 0)
+    ).join(Worker, Worker.id == WorkerLedger.worker_id).one()
+    totals = {
+        'total_workers': count,
+        'total_all_hours': hours,
+        'total_all_earnings_usd': earnings_usd,
+        'total_all_earnings_lbp': earnings_lbp,
+        'total_all_advances_usd': advances_usd,
+        'total_all_advances_lbp': advances_lbp,
+        'total_all_balance_usd': earnings_usd - advances_usd,
+        'total_all_balance_lbp': earnings_lbp - advances_lbp
+    }
+
+    missing = [worker_id for (worker_id,) in db.session.query(Worker.id).outerjoin(
+        WorkerLedger, WorkerLedger.worker_id == Worker.id).filter(WorkerLedger.id.is_(None))]
+    if missing:
+        for key, value in summarize_balances(_compute_balances(missing)).items():
+            totals[key] += value
+    return totals
+
+# ==================== Worker Ledger ====================
+# التحديثات التالية لا تقوم بـ commit، بل تعمل داخل نفس المعاملة الخاصة بالطلب.
+# العامل الذي لا يملك صفاً في الدفتر بعد يُحسب مباشرة عند القراءة حتى تشغيل rebuild-ledger.
+
+def _fill_ledger(ledger, account):
+    ledger.total_hours = account['total_hours']
+    ledger.earnings_usd = account['total_earnings_usd']
+    ledger.earnings_lbp = account['total_earnings_lbp']
+    ledger.advances_usd = account['total_advances_usd']
+    ledger.advances_lbp = account['total_advances_lbp']
+    ledger.balance_usd = account['balance_usd']
+    ledger.balance_lbp = account['balance_lbp']
+
+def add_worker_hours(hours_by_worker):
+    """Add ``{worker_id: hours}`` to ``Worker.total_hours`` and the ledger (caller commits).
+
+    Both tables are updated with ``SET x = x + :hours`` (one executemany UPDATE
+    each), so concurrent shift entries for the same worker never lose hours.
+    Earnings use the hourly rate read inside the same statement.
+    """
+    params = [{'b_worker': worker_id, 'b_hours': hours} for worker_id, hours in hours_by_worker.items() if hours]
+    if not params:
+        return
+    worker = Worker.__table__
+    db.session.execute(
+        worker.update().where(worker.c.id == bindparam('b_worker')).values(
+            total_hours=func.coalesce(worker.c.total_hours, 0) + bindparam('b_hours')),
+        params
+    )
+    ledger = WorkerLedger.__table__
+    rate_usd = select(func.coalesce(worker.c.hourly_rate_usd, 0)).where(
+        worker.c.id == ledger.c.worker_id).scalar_subquery()
+    rate_lbp = select(func.coalesce(worker.c.hourly_rate_lbp, 0)).where(
+        worker.c.id == ledger.c.worker_id).scalar_subquery()
+    db.session.execute(
+        ledger.update().where(ledger.c.worker_id == bindparam('b_worker')).values(
+            total_hours=ledger.c.total_hours + bindparam('b_hours'),
+            earnings_usd=ledger.c.earnings_usd + bindparam('b_hours') * rate_usd,
+            earnings_lbp=ledger.c.earnings_lbp + bindparam('b_hours') * rate_lbp,
+            balance_usd=ledger.c.balance_usd + bindparam('b_hours') * rate_usd,
+            balance_lbp=ledger.c.balance_lbp + bindparam('b_hours') * rate_lbp),
+        params
+    )
+    # العمال المحمّلون في الجلسة يحملون القيمة القديمة
+    for instance in list(db.session.identity_map.values()):
+        if isinstance(instance, Worker) and instance.id in hours_by_worker:
+            db.session.expire(instance, ['total_hours'])
+        elif isinstance(instance, WorkerLedger) and instance.worker_id in hours_by_worker:
+            db.session.expire(instance)
+
+def advance_amounts(accounting):
+    """Return ``(worker_id, usd, lbp)`` if the record is a worker advance, else None."""
+    if accounting.worker_id and accounting.transaction_type == 'مصروف' and accounting.category == 'سلفة':
+        return accounting.worker_id, accounting.amount_usd or 0, accounting.amount_lbp or 0
+    return None
+
+def ledger_apply_advance(advance, sign=1):
+    """Add (sign=1) or remove (sign=-1) an advance returned by advance_amounts()."""
+    if advance is None:
+        return
+    worker_id, usd, lbp = advance
+    usd *= sign
+    lbp *= sign
+    WorkerLedger.query.filter_by(worker_id=worker_id).update({
+        WorkerLedger.advances_usd: WorkerLedger.advances_usd + usd,
+        WorkerLedger.advances_lbp: WorkerLedger.advances_lbp + lbp,
+        WorkerLedger.balance_usd: WorkerLedger.balance_usd - usd,
+        WorkerLedger.balance_lbp: WorkerLedger.balance_lbp - lbp
+    }, synchronize_session=False)
+
+def refresh_worker_ledger(worker_id):
+    """إعادة حساب دفتر عامل واحد من المصدر (مثلاً بعد تغيير سعر الساعة)"""
+    refresh_worker_ledgers([worker_id])
+
+def refresh_worker_ledgers(worker_ids, chunk_size=500):
+    """Recompute the ledger rows of many workers, one aggregate query per chunk (caller commits)."""
+    db.session.flush()
+    worker_ids = list(worker_ids)
+    for start in range(0, len(worker_ids), chunk_size):
+        chunk = worker_ids[start:start + chunk_size]
+        ledgers = {ledger.worker_id: ledger
+                   for ledger in WorkerLedger.query.filter(WorkerLedger.worker_id.in_(chunk))}
+        for account in _compute_balances(chunk):
+            ledger = ledgers.get(account['worker'].id)
+            if ledger is None:
+                ledger = WorkerLedger(worker_id=account['worker'].id)
+                db.session.add(ledger)
+            _fill_ledger(ledger, account)
+
+def rebuild_worker_ledger(fix=True, tolerance=0.01):
+    """Recompute every ledger row from scratch and report drift.
+
+    Returns a list of ``(worker, field, ledger_value, actual_value)`` tuples for
+    every value that differed by more than ``tolerance``. Missing rows are
+    reported with a ledger value of None. When ``fix`` is true the ledger is
+    overwritten with the recomputed values (caller commits).
+    """
+    fields = [
+        ('total_hours', 'total_hours'),
+        ('earnings_usd', 'total_earnings_usd'),
+        ('earnings_lbp', 'total_earnings_lbp'),
+        ('advances_usd', 'total_advances_usd'),
+        ('advances_lbp', 'total_advances_lbp'),
+        ('balance_usd', 'balance_usd'),
+        ('balance_lbp', 'balance_lbp')
+    ]
+    ledgers = {ledger.worker_id: ledger for ledger in WorkerLedger.query.all()}
+    drift = []
+
+    for account in _compute_balances():
+        worker = account['worker']
+        ledger = ledgers.pop(worker.id, None)
+        if ledger is None:
+            drift.append((worker, 'row', None, 'missing'))
+            if fix:
+                ledger = WorkerLedger(worker_id=worker.id)
+                db.session.add(ledger)
+                _fill_ledger(ledger, account)
+            continue
+        for column, key in fields:
+            stored = getattr(ledger, column) or 0
+            if abs(stored - account[key]) > tolerance:
+                drift.append((worker, column, stored, account[key]))
+        if fix:
+            _fill_ledger(ledger, account)
+
+    # صفوف يتيمة لعمال محذوفين
+    for ledger in ledgers.values():
+        drift.append((None, 'orphan', ledger.worker_id, None))
+        if fix:
+            db.session.delete(ledger)
+
+    return drift
+
+# ==================== Accounting Totals ====================
+INCOME = 'إيراد'
+EXPENSE = 'مصروف'
+
+_totals_cache = None  # (expires_at, totals)
+
+def _empty_totals():
+    return {
+        'income_usd': 0, 'income_lbp': 0, 'income_count': 0,
+        'expense_usd': 0, 'expense_lbp': 0, 'expense_count': 0
+    }
+
+def _query_accounting_totals():
+    totals = _empty_totals()
+    rows = db.session.query(
+        Accounting.transaction_type,
+        func.coalesce(func.sum(Accounting.amount_usd), 0),
+        func.coalesce(func.sum(Accounting.amount_lbp), 0),
+        func.count(Accounting.id)
+    ).group_by(Accounting.transaction_type).all()
+
+    for transaction_type, usd, lbp, count in rows:
+        prefix = 'income' if transaction_type == INCOME else 'expense' if transaction_type == EXPENSE else None
+        if prefix is None:
+            continue
+        totals[f'{prefix}_usd'] = usd
+        totals[f'{prefix}_lbp'] = lbp
+        totals[f'{prefix}_count'] = count
+    return totals
+
+def get_accounting_totals():
+    """Income and expense per currency via ``SUM ... GROUP BY transaction_type``.
+
+    When ``ACCOUNTING_TOTALS_CACHE_TTL`` is set (seconds), the result is kept in
+    process memory for that long and dropped as soon as an Accounting row is
+    inserted, updated or deleted by this process.
+    """
+    global _totals_cache
+    ttl = current_app.config.get('ACCOUNTING_TOTALS_CACHE_TTL', 0)
+    if ttl:
+        cached = _totals_cache
+        if cached is not None and cached[0] > time.monotonic():
+            return dict(cached[1])
+
+    totals = _query_accounting_totals()
+    if ttl:
+        _totals_cache = (time.monotonic() + ttl, totals)
+    return dict(totals)
+
+def get_accounting_summary(start=None, end=None):
+    """Income/expense totals and per-category amounts for ``[start, end]``.
+
+    One ``GROUP BY transaction_type, category`` query; nothing is loaded row by
+    row. Returns the keys of get_accounting_totals() plus ``income_by_category``
+    and ``expense_by_category`` (category -> usd/lbp/count, largest first).
+    """
+    query = db.session.query(
+        Accounting.transaction_type,
+        Accounting.category,
+        func.coalesce(func.sum(Accounting.amount_usd), 0),
+        func.coalesce(func.sum(Accounting.amount_lbp), 0),
+        func.count(Accounting.id)
+    )
+    if start is not None:
+        query = query.filter(Accounting.date >= start)
+    if end is not None:
+        query = query.filter(Accounting.date <= end)
+    rows = query.group_by(Accounting.transaction_type, Accounting.category).all()
+
+    summary = _empty_totals()
+    by_category = {INCOME: {}, EXPENSE: {}}
+    for transaction_type, category, usd, lbp, count in sorted(rows, key=lambda row: -row[2]):
+        prefix = 'income' if transaction_type == INCOME else 'expense' if transaction_type == EXPENSE else None
+        if prefix is None:
+            continue
+        summary[f'{prefix}_usd'] += usd
+        summary[f'{prefix}_lbp'] += lbp
+        summary[f'{prefix}_count'] += count
+        by_category[transaction_type][category] = {'usd': usd, 'lbp': lbp, 'count': count}
+    summary['income_by_category'] = by_category[INCOME]
+    summary['expense_by_category'] = by_category[EXPENSE]
+    return summary
+
+def invalidate_accounting_totals(*args):
+    """مسح الإجماليات المخزنة مؤقتاً"""
+    global _totals_cache
+    _totals_cache = None
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Accounting, _event_name, invalidate_accounting_totals)
+
+# ==================== Stock Levels ====================
+FUEL = 'وقود'
+MEDICINE = 'دواء'
+FERTILIZER = 'سماد'
+
+def _stock_sources():
+    # نوع الاستهلاك -> (الجدول، عمود الكمية الأصلية، عمود الربط في Consumption)
+    return {
+        FUEL: (FuelLog, FuelLog.liters, Consumption.fuel_id),
+        MEDICINE: (Medicine, Medicine.quantity, Consumption.medicine_id),
+        FERTILIZER: (Fertilizer, Fertilizer.quantity, Consumption.fertilizer_id)
+    }
+
+class InsufficientStockError(Exception):
+    """Raised when a consumption would take a lot below zero."""
+
+def _aggregate_stock_levels(consumption_type, ids=None):
+    """Recompute remaining quantity from the Consumption history.
+
+    One ``SUM(quantity_consumed) ... GROUP BY`` over Consumption joined to the
+    lot table. Used for lots without ``quantity_on_hand`` and by the
+    inventory consistency check.
+    """
+    model, quantity, lot_id = _stock_sources()[consumption_type]
+    consumed = db.session.query(
+        lot_id.label('lot_id'),
+        func.sum(Consumption.quantity_consumed).label('consumed')
+    ).filter(
+        Consumption.consumption_type == consumption_type,
+        lot_id.isnot(None)
+    ).group_by(lot_id).subquery()
+
+    query = db.session.query(
+        model.id,
+        func.coalesce(quantity, 0) - func.coalesce(consumed.c.consumed, 0)
+    ).outerjoin(consumed, consumed.c.lot_id == model.id)
+
+    if ids is not None:
+        query = query.filter(model.id.in_(ids))
+    return dict(query.all())
+
+def get_stock_levels(consumption_type, ids=None):
+    """Remaining quantity per lot of one type as ``{lot_id: remaining}``.
+
+    Reads the ``quantity_on_hand`` column; lots that predate the column (NULL)
+    fall back to the aggregate until ``flask check-inventory --fix`` runs.
+    """
+    model = _stock_sources()[consumption_type][0]
+    query = db.session.query(model.id, model.quantity_on_hand)
+    if ids is not None:
+        query = query.filter(model.id.in_(ids))
+
+    levels = {}
+    missing = []
+    for lot_id, on_hand in query.all():
+        if on_hand is None:
+            missing.append(lot_id)
+        else:
+            levels[lot_id] = on_hand
+    if missing:
+        levels.update(_aggregate_stock_levels(consumption_type, missing))
+    return levels
+
+def get_all_stock_levels():
+    """الكميات المتبقية لجميع أنواع المخزون (استعلام واحد لكل نوع)"""
+    return {consumption_type: get_stock_levels(consumption_type) for consumption_type in _stock_sources()}
+
+def _consumption_lot(consumption):
+    """Return the ``lot_id`` that a consumption draws from, or None."""
+    sources = _stock_sources()
+    if consumption.consumption_type not in sources:
+        return None
+    return getattr(consumption, sources[consumption.consumption_type][2].key)
+
+def _remaining_quantity(consumption_type, exclude_id=None):
+    """SQL expression: the lot's quantity minus its recorded consumption.
+
+    Correlated to the lot table of an UPDATE; used for lots whose
+    ``quantity_on_hand`` is still NULL (created before the column existed).
+    """
+    model, quantity, lot_column = _stock_sources()[consumption_type]
+    consumed = select(func.coalesce(func.sum(Consumption.quantity_consumed), 0)).where(
+        Consumption.consumption_type == consumption_type, lot_column == model.id)
+    if exclude_id is not None:
+        consumed = consumed.where(Consumption.id != exclude_id)
+    return func.coalesce(quantity, 0) - consumed.scalar_subquery()
+
+@event.listens_for(Consumption, 'after_insert')
+def _take_from_stock(mapper, connection, consumption):
+    """خصم الكمية المستهلكة من المخزون بشكل ذري (compare-and-swap)"""
+    lot_id = _consumption_lot(consumption)
+    quantity = consumption.quantity_consumed or 0
+    if lot_id is None or not quantity:
+        return
+    # الصف مُدرج بالفعل: لا يُحسب ضمن الاستهلاك السابق لدفعة بلا quantity_on_hand
+    if not _take_quantity(connection, consumption.consumption_type, lot_id, quantity, exclude_id=consumption.id):
+        table = _stock_sources()[consumption.consumption_type][0].__table__
+        raise InsufficientStockError(f'Not enough stock in {table.name} #{lot_id} for {quantity}')
+
+def _take_quantity(connection, consumption_type, lot_id, quantity, exclude_id=None):
+    # الشرط على الكمية يمنع كاتبين متزامنين من سحب نفس الكمية مرتين
+    model = _stock_sources()[consumption_type][0]
+    on_hand = func.coalesce(model.quantity_on_hand, _remaining_quantity(consumption_type, exclude_id))
+    result = connection.execute(
+        update(model.__table__)
+        .where(model.id == lot_id, on_hand >= quantity)
+        .values(quantity_on_hand=on_hand - quantity)
+    )
+    return result.rowcount > 0
+
+def take_from_lot(consumption_type, lot_id, quantity):
+    """Subtract stock for consumptions inserted in bulk (they skip ``after_insert``).
+
+    Returns False, changing nothing, if the lot does not exist or holds less
+    than ``quantity``.
+    """
+    return _take_quantity(db.session.connection(), consumption_type, lot_id, quantity)
+
+@event.listens_for(Consumption, 'after_delete')
+def _return_to_stock(mapper, connection, consumption):
+    """إرجاع الكمية إلى المخزون عند حذف سجل الاستهلاك"""
+    lot_id = _consumption_lot(consumption)
+    quantity = consumption.quantity_consumed or 0
+    if lot_id is None or not quantity:
+        return
+    model = _stock_sources()[consumption.consumption_type][0]
+    # الصف محذوف بالفعل، فالكمية المحسوبة لدفعة بلا quantity_on_hand تشمل الإرجاع
+    connection.execute(
+        update(model.__table__)
+        .where(model.id == lot_id)
+        .values(quantity_on_hand=func.coalesce(model.quantity_on_hand + quantity,
+                                               _remaining_quantity(consumption.consumption_type)))
+    )
+
+def backfill_stock_levels():
+    """Fill ``quantity_on_hand`` of lots where it is NULL from the consumption records."""
+    filled = 0
+    for consumption_type, (model, _, _) in _stock_sources().items():
+        result = db.session.execute(
+            update(model.__table__)
+            .where(model.quantity_on_hand.is_(None))
+            .values(quantity_on_hand=_remaining_quantity(consumption_type))
+        )
+        filled += result.rowcount
+    return filled
+
+def check_stock_levels(fix=False, tolerance=0.0001):
+    """Compare ``quantity_on_hand`` with the Consumption history.
+
+    Returns ``(consumption_type, lot_id, stored, actual)`` for every lot that
+    differs (stored is None when the column was never filled). With ``fix`` the
+    stored value is overwritten (caller commits).
+    """
+    issues = []
+    for consumption_type, (model, _, _) in _stock_sources().items():
+        actual = _aggregate_stock_levels(consumption_type)
+        stored = dict(db.session.query(model.id, model.quantity_on_hand).all())
+        for lot_id, remaining in actual.items():
+            on_hand = stored.get(lot_id)
+            if on_hand is not None and abs(on_hand - remaining) <= tolerance:
+                continue
+            issues.append((consumption_type, lot_id, on_hand, remaining))
+            if fix:
+                model.query.filter_by(id=lot_id).update(
+                    {model.quantity_on_hand: remaining}, synchronize_session=False)
+    return issues
+
+# ==================== Report Rollups ====================
+PRODUCTION = 'production'
+SALES = 'sales'
+GRANULARITIES = ('day', 'month')
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+def _month_start(day):
+    return day.replace(day=1)
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+def _rollup_key(record):
+    """Return ``(kind, product_type_id, location, day)`` for a Production or Sales row."""
+    if isinstance(record, Production):
+        return PRODUCTION, int(record.product_type_id), record.location or '', _as_date(record.date)
+    return SALES, int(record.product_type_id), '', _as_date(record.date)
+
+def _bump_rollup(model, key, quantity, usd, lbp, count):
+    values = {
+        model.quantity: model.quantity + quantity,
+        model.revenue_usd: model.revenue_usd + usd,
+        model.revenue_lbp: model.revenue_lbp + lbp,
+        model.record_count: model.record_count + count
+    }
+    if model.query.filter_by(**key).update(values, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(model(quantity=quantity, revenue_usd=usd, revenue_lbp=lbp,
+                                 record_count=count, **key))
+    except IntegrityError:
+        # طلب متزامن أنشأ الصف في نفس اللحظة
+        model.query.filter_by(**key).update(values, synchronize_session=False)
+
+def rollup_apply(record, sign=1):
+    """Add (sign=1) or remove (sign=-1) a Production/Sales row from the daily and monthly rollups.
+
+    Called by the routes that create or delete records (caller commits).
+    """
+    if record.date is None:
+        db.session.flush()
+    kind, product_type_id, location, day = _rollup_key(record)
+    quantity = (record.quantity or 0) * sign
+    usd = lbp = 0
+    if kind == SALES:
+        usd = (record.total_usd or 0) * sign
+        lbp = (record.total_lbp or 0) * sign
+    for model, period in ((DailyRollup, day), (MonthlyRollup, _month_start(day))):
+        key = {'kind': kind, 'product_type_id': product_type_id, 'location': location, 'period': period}
+        _bump_rollup(model, key, quantity, usd, lbp, sign)
+
+def delete_product_type_records(product_type_id):
+    """Bulk-delete the productions, sales and rollup rows of a product type (caller commits).
+
+    Call before deleting the product type itself: its rollup rows reference it
+    (a foreign-key violation on Postgres) and would otherwise keep counting the
+    deleted records. Tombstones are recorded for the sync clients.
+    """
+    for model in (Production, Sales):
+        query = model.query.filter_by(product_type_id=product_type_id)
+        record_bulk_delete(query)
+        query.delete(synchronize_session=False)
+    for model in (DailyRollup, MonthlyRollup):
+        model.query.filter_by(product_type_id=product_type_id).delete(synchronize_session=False)
+
+def rebuild_rollups():
+    """Recompute both rollup tables from Production and Sales with GROUP BY (caller commits).
+
+    Returns ``(daily_rows, monthly_rows)``.
+    """
+    DailyRollup.query.delete(synchronize_session=False)
+    MonthlyRollup.query.delete(synchronize_session=False)
+
+    location = func.coalesce(Production.location, '')
+    production = db.session.query(
+        Production.product_type_id, location, Production.date,
+        func.sum(Production.quantity), func.count(Production.id)
+    ).filter(Production.date.isnot(None)).group_by(Production.product_type_id, location, Production.date)
+    sales = db.session.query(
+        Sales.product_type_id, Sales.date, func.sum(Sales.quantity),
+        func.sum(Sales.total_usd), func.sum(Sales.total_lbp), func.count(Sales.id)
+    ).filter(Sales.date.isnot(None)).group_by(Sales.product_type_id, Sales.date)
+
+    daily = [{'kind': PRODUCTION, 'product_type_id': product_type_id, 'location': loc, 'period': day,
+              'quantity': quantity or 0, 'revenue_usd': 0, 'revenue_lbp': 0, 'record_count': count}
+             for product_type_id, loc, day, quantity, count in production]
+    daily += [{'kind': SALES, 'product_type_id': product_type_id, 'location': '', 'period': day,
+               'quantity': quantity or 0, 'revenue_usd': usd or 0, 'revenue_lbp': lbp or 0, 'record_count': count}
+              for product_type_id, day, quantity, usd, lbp, count in sales]
+
+    # الجدول الشهري يُجمع من اليومي (أصغر بكثير من الجداول الأصلية)
+    monthly = {}
+    for row in daily:
+        key = (row['kind'], row['product_type_id'], row['location'], _month_start(row['period']))
+        if key not in monthly:
+            monthly[key] = dict(row, period=key[3], quantity=0, revenue_usd=0, revenue_lbp=0, record_count=0)
+        for column in ('quantity', 'revenue_usd', 'revenue_lbp', 'record_count'):
+            monthly[key][column] += row[column]
+
+    if daily:
+        db.session.execute(insert(DailyRollup), daily)
+        db.session.execute(insert(MonthlyRollup), list(monthly.values()))
+    return len(daily), len(monthly)
+
+def _query_rollup(model, kind, start=None, end=None):
+    location = model.location
+    query = db.session.query(
+        model.period, model.product_type_id, ProductType.name, ProductType.category, location,
+        func.sum(model.quantity), func.sum(model.revenue_usd), func.sum(model.revenue_lbp),
+        func.sum(model.record_count)
+    ).join(ProductType, ProductType.id == model.product_type_id).filter(model.kind == kind)
+    if start is not None:
+        query = query.filter(model.period >= start)
+    if end is not None:
+        query = query.filter(model.period <= end)
+    return query.group_by(model.period, model.product_type_id, ProductType.name,
+                          ProductType.category, location).having(func.sum(model.record_count) > 0)
+
+def get_rollups(kind, start=None, end=None, granularity='month'):
+    """Report rows for ``kind`` between ``start`` and ``end`` (inclusive, either may be None).
+
+    With ``granularity='month'`` whole months are read from MonthlyRollup and
+    only the partial months at the edges of the range from DailyRollup, so the
+    cost depends on the number of months, not on the number of records. Each
+    row is a dict with period, product_type_id, product_name, category,
+    location, quantity, revenue_usd, revenue_lbp and record_count.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'Unknown granularity: {granularity}')
+
+    if granularity == 'day':
+        parts = [_query_rollup(DailyRollup, kind, start, end)]
+    else:
+        first_full = start if start is None or start.day == 1 else _next_month(start)
+        after_full = None if end is None else _month_start(end + timedelta(days=1))
+        if first_full is not None and after_full is not None and first_full >= after_full:
+            parts = [_query_rollup(DailyRollup, kind, start, end)]
+        else:
+            parts = [_query_rollup(MonthlyRollup, kind, first_full,
+                                   after_full - timedelta(days=1) if after_full else None)]
+            if start is not None and start < first_full:
+                parts.append(_query_rollup(DailyRollup, kind, start, first_full - timedelta(days=1)))
+            if after_full is not None and after_full <= end:
+                parts.append(_query_rollup(DailyRollup, kind, after_full, end))
+
+    rows = {}
+    for part in parts:
+        for period, product_type_id, name, category, location, quantity, usd, lbp, count in part:
+            if granularity == 'month':
+                period = _month_start(period)
+            key = (period, product_type_id, location)
+            if key not in rows:
+                rows[key] = {'period': period, 'product_type_id': product_type_id, 'product_name': name,
+                             'category': category or '-', 'location': location or '-', 'quantity': 0,
+                             'revenue_usd': 0, 'revenue_lbp': 0, 'record_count': 0}
+            row = rows[key]
+            row['quantity'] += quantity or 0
+            row['revenue_usd'] += usd or 0
+            row['revenue_lbp'] += lbp or 0
+            row['record_count'] += count or 0
+    return sorted(rows.values(), key=lambda r: (r['period'], r['product_name'], r['location']))
+
+# ==================== Sync Tombstones ====================
+# الجداول التي تُزامن مع الأجهزة الميدانية (لها عمود updated_at)
+SYNCED_MODELS = (Worker, WorkShift, Production, Sales, FuelLog, Medicine, Fertilizer, Consumption,
+                 Attendance, Accounting)
+
+def _record_tombstone(mapper, connection, target):
+    """تسجيل الحذف ليصل إلى الأجهزة في المزامنة التالية"""
+    connection.execute(insert(SyncTombstone).values(
+        table_name=mapper.local_table.name, record_id=target.id, deleted_at=datetime.utcnow()))
+
+for _model in SYNCED_MODELS:
+    event.listen(_model, 'after_delete', _record_tombstone)
+
+def record_bulk_delete(query):
+    """Tombstones for the rows of a bulk ``query.delete()``, which skips ``after_delete``.
+
+    Call it with the same query just before deleting; one INSERT ... SELECT.
+    """
+    model = query.column_descriptions[0]['entity']
+    db.session.execute(insert(SyncTombstone).from_select(
+        ['table_name', 'record_id', 'deleted_at'],
+        query.with_entities(literal(model.__table__.name), model.id, literal(datetime.utcnow()))
+    ))
+
+# ==================== Schema ====================
+def upgrade_schema():
+    """Add columns declared on the models but missing from existing tables.
+
+    ``db.create_all()`` only creates missing tables, so databases created by an
+    older version would fail on new columns. Only nullable columns without
+    server defaults are added, which is all this project declares.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+            added.append(f'{table.name}.{column.name}')
+            # الصفوف القديمة تحتاج قيمة للمزامنة التفاضلية
+            if column.name == 'updated_at':
+                source = 'created_at' if 'created_at' in table.c else 'CURRENT_TIMESTAMP'
+                with engine.begin() as conn:
+                    conn.exec_driver_sql(f'UPDATE {table.name} SET updated_at = COALESCE({source}, CURRENT_TIMESTAMP)')
+    # الدفعات القديمة بلا quantity_on_hand: المتبقي من سجلات الاستهلاك، وإلا لا يعمل منع السحب الزائد
+    backfill_stock_levels()
+    db.session.commit()
+    return added
+
+# ==================== Schema Version ====================
+def schema_fingerprint():
+    """Hash of the tables, columns and indexes declared on the models."""
+    parts = []
+    for table in db.metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(f'{column.name} {column.type!r} {column.nullable}' for column in table.columns)
+        parts.extend(sorted(f'{index.name} {index.unique} {",".join(column.name for column in index.columns)}'
+                            for index in table.indexes))
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+def stored_schema_version():
+    """آخر بصمة مسجلة، أو None لقاعدة جديدة أو أقدم من جدول schema_version"""
+    try:
+        return db.session.query(SchemaVersion.version).order_by(SchemaVersion.id.desc()).limit(1).scalar()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return None
+
+def migrate_schema():
+    """Create missing tables and columns, then record the schema version.
+
+    Returns the columns added to existing tables (see upgrade_schema).
+    """
+    db.create_all()
+    added = upgrade_schema()
+    db.session.add(SchemaVersion(version=schema_fingerprint()))
+    db.session.commit()
+    return added
+
+def ensure_schema():
+    """Boot-time check: one query when the schema is current, migrate_schema() otherwise.
+
+    Returns True if the schema was migrated.
+    """
+    if stored_schema_version() == schema_fingerprint():
+        return False
+    migrate_schema()
+    return True
+
+# ==================== Indexes ====================
+def create_missing_indexes():
+    """Create declared indexes that are missing from an existing database.
+
+    Tables are left untouched. Returns ``(created, failed)`` where ``failed``
+    holds ``(index_name, error)`` pairs, e.g. a unique index that cannot be
+    built because duplicate rows already exist.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    created, failed = [], []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            if index.name in existing:
+                continue
+            try:
+                index.create(bind=engine)
+                created.append(index.name)
+            except SQLAlchemyError as e:
+                failed.append((index.name, str(e.orig if hasattr(e, 'orig') else e)))
+    return created, failed
+
+def list_query_statements():
+    """الاستعلامات الأساسية لصفحات القوائم (لعرض خطط التنفيذ)"""
+    today = date.today()
+    return {
+        'attendance_by_date': select(Attendance).where(Attendance.date == today),
+        'attendance_duplicate_check': select(Attendance).where(
+            Attendance.worker_id == 1, Attendance.date == today),
+        'accounting_list': select(Accounting).where(
+            Accounting.transaction_type == EXPENSE, Accounting.category == 'سلفة'
+        ).order_by(Accounting.date.desc()),
+        'worker_advances': select(Accounting).where(
+            Accounting.worker_id == 1, Accounting.transaction_type == EXPENSE,
+            Accounting.category == 'سلفة'),
+        'worker_shifts': select(WorkShift).where(WorkShift.worker_id == 1),
+        'recent_shifts': select(WorkShift).order_by(WorkShift.date.desc()).limit(5),
+        'production_list': select(Production).order_by(Production.date.desc()),
+        'sales_list': select(Sales).order_by(Sales.date.desc()),
+        'medicine_consumption': select(Consumption).where(Consumption.medicine_id == 1),
+    }
+
+def explain_statement(statement):
+    """Return the database's query plan for a statement as a list of lines."""
+    engine = db.engine
+    compiled = statement.compile(dialect=engine.dialect)
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(prefix + compiled.string, params).fetchall()
+    # SQLite: (id, parent, notused, detail) - PostgreSQL: (QUERY PLAN,)
+    return [str(row[-1]) for row in rows]
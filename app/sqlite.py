@@ -0,0 +1,42 @@
+"""
+إعدادات أداء SQLite
+SQLite tuning: PRAGMAs applied to every new connection of a SQLite engine.
+
+WAL lets clerks read while another request writes, ``synchronous=NORMAL``
+avoids an fsync per commit (safe with WAL: a power cut can lose only the last
+commits, never corrupt the file) and ``busy_timeout`` makes a writer wait for
+the lock instead of failing with "database is locked". The set comes from
+``SQLITE_PRAGMAS`` in the config, so each environment can change it.
+"""
+import re
+from functools import partial
+from sqlalchemy import event
+from app import db
+
+_NAME = re.compile(r'[a-z_]+')
+_VALUE = re.compile(r'-?\w+')
+
+def _apply_pragmas(dbapi_connection, connection_record, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
+
+def init_sqlite(app):
+    """Register the connect event on the app's SQLite engines (call before the first connection)."""
+    pragmas = list((app.config.get('SQLITE_PRAGMAS') or {}).items())
+    if not pragmas:
+        return
+    for name, value in pragmas:
+        # القيم تُكتب في نص PRAGMA مباشرة، فلا يُقبل إلا اسم أو رقم
+        if not _NAME.fullmatch(name) or not _VALUE.fullmatch(str(value)):
+            raise ValueError(f'invalid SQLite pragma: {name}={value}')
+    for engine in db.engines.values():
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', partial(_apply_pragmas, pragmas=pragmas))
+
+def current_pragmas(names=('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'temp_store')):
+    """القيم الفعلية على اتصال الجلسة الحالية (للتحقق)"""
+    return {name: db.session.execute(db.text(f'PRAGMA {name}')).scalar() for name in names}
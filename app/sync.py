@@ -0,0 +1,270 @@
+"""
+المزامنة التفاضلية للأجهزة الميدانية
+Delta sync for offline field devices.
+
+Pull: every row whose ``updated_at`` is newer than the device's sync token,
+plus tombstones for deleted rows, so a device only downloads what changed.
+Push: queued attendance/shift/consumption writes applied in one batched
+transaction; each carries a client-generated ID, so resending has no effect.
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, insert, or_
+from app import db
+from app.models import (WorkShift, Attendance, Consumption, FuelLog, Medicine, Fertilizer, SyncTombstone,
+                        SyncReceipt)
+from app.imports import (HEADER_ALIASES, RowError, ShiftImporter, AttendanceImporter,
+                         _text, _number, _date)
+from app.services import add_worker_hours, get_stock_levels, take_from_lot, FUEL, MEDICINE, FERTILIZER
+
+DELETED = '_deleted'
+
+# ==================== Tokens ====================
+def encode_token(marks):
+    """``{key: (updated_at, id or None)}`` → opaque token."""
+    payload = {key: [moment.isoformat(), row_id] for key, (moment, row_id) in marks.items()}
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_token(token):
+    """Inverse of encode_token; an empty token means a full download. Raises ValueError."""
+    if not token:
+        return {}
+    try:
+        payload = json.loads(base64.urlsafe_b64decode((token + '=' * (-len(token) % 4)).encode()))
+        return {key: (datetime.fromisoformat(moment), None if row_id is None else int(row_id))
+                for key, (moment, row_id) in payload.items()}
+    except (TypeError, ValueError, AttributeError) as e:
+        raise ValueError('invalid sync token') from e
+
+def _after(column, id_column, mark):
+    """الصفوف بعد العلامة: (الوقت، المعرف) أو الوقت فقط إذا سُلّم كل ما قبله"""
+    moment, row_id = mark
+    if row_id is None:
+        return column > moment
+    return or_(column > moment, and_(column == moment, id_column > row_id))
+
+# ==================== Pull ====================
+def pull_changes(resources, marks, limit):
+    """Rows changed and deleted since ``marks`` for ``{name: resource}``.
+
+    Only rows older than ``SYNC_SETTLE_SECONDS`` are returned, so a transaction
+    that is still committing with an earlier ``updated_at`` is not skipped.
+    ``updated_at`` is set when a row is flushed, not when it commits: a
+    transaction that stays open longer than the window after writing can
+    commit rows older than a device's mark, and that device never pulls them.
+    Long writers must set ``updated_at`` just before committing (the CSV
+    import does, see ``Importer.stamp_updated_at``), or the window must be
+    raised to cover them. Each table is read in ``(updated_at, id)`` order, at most ``limit`` rows;
+    ``has_more`` asks the device to call again with the new marks.
+
+    Returns ``(changes, deleted, marks, has_more)``: ``changes`` maps a
+    resource to row mappings, ``deleted`` to lists of ids.
+    """
+    settle = current_app.config.get('SYNC_SETTLE_SECONDS', 2)
+    until = datetime.utcnow() - timedelta(seconds=settle)
+    marks = dict(marks)
+    changes, deleted, has_more = {}, {}, False
+
+    for name, resource in resources.items():
+        updated_at, row_id = resource.columns['updated_at'], resource.columns['id']
+        query = resource.select(list(resource.columns)).filter(updated_at <= until)
+        if name in marks:
+            query = query.filter(_after(updated_at, row_id, marks[name]))
+        rows = query.order_by(updated_at, row_id).limit(limit + 1).all()
+        if len(rows) > limit:
+            rows, has_more = rows[:limit], True
+            marks[name] = (rows[-1].updated_at, rows[-1].id)
+        else:
+            marks[name] = (until, None)
+        changes[name] = rows
+
+    tables = {resource.model.__table__.name: name for name, resource in resources.items()}
+    query = db.session.query(SyncTombstone).filter(
+        SyncTombstone.table_name.in_(tables), SyncTombstone.deleted_at <= until)
+    if DELETED in marks:
+        query = query.filter(_after(SyncTombstone.deleted_at, SyncTombstone.id, marks[DELETED]))
+    tombstones = query.order_by(SyncTombstone.deleted_at, SyncTombstone.id).limit(limit + 1).all()
+    if len(tombstones) > limit:
+        tombstones, has_more = tombstones[:limit], True
+        marks[DELETED] = (tombstones[-1].deleted_at, tombstones[-1].id)
+    else:
+        marks[DELETED] = (until, None)
+    for tombstone in tombstones:
+        deleted.setdefault(tables[tombstone.table_name], []).append(tombstone.record_id)
+
+    return changes, deleted, marks, has_more
+
+# ==================== Push ====================
+class _ConsumptionParser:
+    LOTS = {FUEL: 'fuel_id', MEDICINE: 'medicine_id', FERTILIZER: 'fertilizer_id'}
+    LOT_MODELS = {FUEL: FuelLog, MEDICINE: Medicine, FERTILIZER: Fertilizer}
+
+    def prepare(self):
+        pass
+
+    def parse(self, row):
+        consumption_type = _text(row, 'consumption_type', required=True)
+        if consumption_type not in self.LOTS:
+            raise RowError(f'consumption_type: "{consumption_type}" غير معروف')
+        lot_key = self.LOTS[consumption_type]
+        lot_id = _number(row, lot_key, default=None)
+        if lot_id is None:
+            raise RowError(f'العمود {lot_key} مطلوب')
+        # نفس المفاتيح لكل الصفوف ليُدرج الجميع في INSERT واحد
+        mapping = dict.fromkeys(self.LOTS.values())
+        mapping.update({
+            'consumption_type': consumption_type,
+            lot_key: int(lot_id),
+            'quantity_consumed': _number(row, 'quantity_consumed', minimum=0),
+            'unit': _text(row, 'unit', max_length=20) or '',
+            'date': _date(row),
+            'notes': _text(row, 'notes')
+        })
+        return mapping
+
+# المورد -> (النموذج، محلل الحقول)
+PUSH_PARSERS = {
+    'shifts': (WorkShift, ShiftImporter),
+    'attendance': (Attendance, AttendanceImporter),
+    'consumption': (Consumption, _ConsumptionParser)
+}
+
+def _row(data):
+    """قيم JSON كنصوص بنفس أسماء أعمدة الاستيراد، ليُعاد استخدام نفس التحقق"""
+    return {HEADER_ALIASES.get(key, key): '' if value is None else str(value) for key, value in data.items()}
+
+def _skip_recorded_attendance(items):
+    """استعلام واحد عن الحضور المسجل مسبقاً لنفس العامل واليوم"""
+    if not items:
+        return items
+    existing = {(worker_id, day): record_id for record_id, worker_id, day in db.session.query(
+        Attendance.id, Attendance.worker_id, Attendance.date).filter(
+        Attendance.worker_id.in_({mapping['worker_id'] for _, _, mapping in items}),
+        Attendance.date.in_({mapping['date'] for _, _, mapping in items}))}
+    kept = []
+    for item in items:
+        result, _, mapping = item
+        record_id = existing.get((mapping['worker_id'], mapping['date']))
+        if record_id is None:
+            kept.append(item)
+        else:
+            result.update(status='conflict', id=record_id)
+    return kept
+
+def _take_consumed_stock(items):
+    """Accept consumptions in order while the lot has stock, then one atomic UPDATE per lot."""
+    by_lot = {}
+    for item in items:
+        mapping = item[2]
+        lot_id = mapping[_ConsumptionParser.LOTS[mapping['consumption_type']]]
+        by_lot.setdefault((mapping['consumption_type'], lot_id), []).append(item)
+    on_hand = {}
+    for consumption_type in _ConsumptionParser.LOT_MODELS:
+        lot_ids = [lot_id for kind, lot_id in by_lot if kind == consumption_type]
+        if lot_ids:
+            on_hand.update(((consumption_type, lot_id), quantity) for lot_id, quantity in
+                           get_stock_levels(consumption_type, lot_ids).items())
+
+    kept = []
+    for key, lot_items in by_lot.items():
+        if key not in on_hand:
+            for result, _, _ in lot_items:
+                result.update(status='rejected', error='unknown lot')
+            continue
+        available, accepted = on_hand[key], []
+        for item in lot_items:
+            quantity = item[2]['quantity_consumed']
+            if quantity <= available:
+                accepted.append(item)
+                available -= quantity
+            else:
+                item[0].update(status='rejected', error='insufficient stock')
+        # الشرط الذري يحمي من كاتب متزامن سحب من نفس الدفعة بعد القراءة
+        if accepted and not take_from_lot(*key, sum(item[2]['quantity_consumed'] for item in accepted)):
+            for result, _, _ in accepted:
+                result.update(status='rejected', error='insufficient stock')
+            accepted = []
+        kept.extend(accepted)
+    return kept
+
+def push_changes(changes, user, allowed):
+    """Apply queued device writes as one batch (caller commits).
+
+    ``changes`` is a list of ``{"client_id", "resource", "data"}``; ``allowed``
+    the resource names the user may write. Every change gets a result with
+    status ``created``, ``duplicate`` (client_id already received),
+    ``conflict`` (attendance already recorded for that worker and day) or
+    ``rejected``. Changes are validated in memory, checked with one query per
+    resource and written with one bulk INSERT per table, so the statement
+    count does not grow with the batch. An IntegrityError from a concurrent
+    writer propagates: the caller rolls back and the device resends the same
+    batch, which is safe because of the client IDs.
+    """
+    client_ids = [str(change.get('client_id') or '') for change in changes]
+    received = {receipt.client_id: receipt.record_id for receipt in
+                SyncReceipt.query.filter(SyncReceipt.client_id.in_(set(client_ids)))}
+    parsers = {}
+    pending = {name: [] for name in PUSH_PARSERS}
+    first_seen = {}
+    repeats = []
+    results = []
+
+    for client_id, change in zip(client_ids, changes):
+        result = {'client_id': client_id}
+        results.append(result)
+        name = change.get('resource')
+        if not client_id or len(client_id) > 64:
+            result.update(status='rejected', error='client_id must be 1-64 characters')
+            continue
+        if client_id in received:
+            result.update(status='duplicate', id=received[client_id])
+            continue
+        if client_id in first_seen:
+            # نفس التغيير مرتين في الطلب نفسه: يأخذ نتيجة الأول
+            repeats.append((len(results) - 1, first_seen[client_id]))
+            continue
+        first_seen[client_id] = result
+        if name not in PUSH_PARSERS or not isinstance(change.get('data'), dict):
+            result.update(status='rejected', error=f'unsupported resource: {name}')
+            continue
+        if name not in allowed:
+            result.update(status='rejected', error='permission denied')
+            continue
+        if name not in parsers:
+            parsers[name] = PUSH_PARSERS[name][1]()
+            parsers[name].prepare()
+        try:
+            pending[name].append((result, client_id, parsers[name].parse(_row(change['data']))))
+        except RowError as e:
+            result.update(status='rejected', error=str(e))
+
+    pending['attendance'] = _skip_recorded_attendance(pending['attendance'])
+    pending['consumption'] = _take_consumed_stock(pending['consumption'])
+
+    receipts = []
+    hours_by_worker = {}
+    for name, items in pending.items():
+        if not items:
+            continue
+        model = PUSH_PARSERS[name][0]
+        record_ids = db.session.scalars(
+            insert(model).returning(model.id, sort_by_parameter_order=True),
+            [mapping for _, _, mapping in items]
+        ).all()
+        for (result, client_id, mapping), record_id in zip(items, record_ids):
+            result.update(status='created', id=record_id)
+            receipts.append({'client_id': client_id, 'table_name': model.__table__.name,
+                             'record_id': record_id, 'user_id': user.id})
+            if model is WorkShift:
+                hours_by_worker[mapping['worker_id']] = hours_by_worker.get(mapping['worker_id'], 0) + mapping['hours']
+    if receipts:
+        db.session.execute(insert(SyncReceipt), receipts)
+    add_worker_hours(hours_by_worker)
+
+    for index, first in repeats:
+        results[index] = dict(first) if first.get('status') != 'created' else \
+            {'client_id': first['client_id'], 'status': 'duplicate', 'id': first['id']}
+    return results
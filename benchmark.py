@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+قياس أداء الصفحات على بيانات اصطناعية
+Load benchmark: drives the Flask test client through every list, report and
+dashboard page and prints p50/p95 latency and SQL query counts as JSON.
+
+    python benchmark.py                                  # instance/benchmark.db, seeded on first run
+    python benchmark.py --repeat 50 --output current.json
+    python benchmark.py --baseline baseline.json         # exit code 1 on regressions
+    python benchmark.py --startup --repeat 10            # cold start: import, create_app, first request
+    python benchmark.py --writers 4 --writes 100         # SQLite concurrent shift entry, default vs tuned PRAGMAs
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+# Endpoints measured on every run; (endpoint, url_for arguments)
+ENDPOINTS = [
+    ('main.index', {}),
+    ('workers.workers_list', {}),
+    ('workers.worker_detail', {'worker_id': None}),
+    ('production.production_list', {}),
+    ('sales.sales_list', {}),
+    ('fuel.fuel_list', {}),
+    ('medicines.medicines_list', {}),
+    ('consumption.consumption_list', {}),
+    ('attendance.attendance_list', {}),
+    ('accounting.accounting_list', {}),
+    ('accounting.accounting_report', {}),
+    ('reports.reports_list', {}),
+    ('reports.workers_report', {}),
+    ('reports.production_report', {}),
+    ('reports.sales_report', {}),
+    ('reports.accounting_report', {}),
+]
+
+BENCHMARK_USER = 'benchmark'
+
+# مراحل الإقلاع المقاسة في عملية جديدة لكل تكرار
+STARTUP_PHASES = ('import', 'create_app', 'first_request')
+
+# SQLITE_PRAGMAS لكل وضع في اختبار الكتابة المتزامنة: افتراضيات SQLite ثم إعدادات التطبيق
+WRITE_MODES = {
+    'default': 'journal_mode=DELETE,synchronous=FULL',
+    'tuned': None,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--database', default=os.environ.get('BENCHMARK_DATABASE_URL', 'sqlite:///benchmark.db'),
+                        help='SQLAlchemy URL of the database to benchmark (default: instance/benchmark.db)')
+    parser.add_argument('--no-seed', action='store_true', help='Do not seed an empty database')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier for the default seed row counts')
+    parser.add_argument('--seasons', type=int, default=3, help='Seasons of seed data')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the dataset')
+    parser.add_argument('--repeat', type=int, default=20, help='Measured requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=2, help='Unmeasured requests per endpoint')
+    parser.add_argument('--output', help='Write the JSON result to this file instead of stdout')
+    parser.add_argument('--baseline', help='Compare with a previous JSON result')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='Allowed p95 ratio against the baseline before reporting a regression')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0,
+                        help='Ignore p95 increases smaller than this (timer noise on fast pages)')
+    parser.add_argument('--startup', action='store_true',
+                        help='Measure cold start in fresh interpreters instead of page latency')
+    parser.add_argument('--startup-child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--writers', type=int, default=0,
+                        help='Measure SQLite write throughput with this many concurrent writer processes')
+    parser.add_argument('--writes', type=int, default=50, help='Shift entries per writer process')
+    parser.add_argument('--writer-child', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(timings, **extra):
+    return {
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'max_ms': round(max(timings), 2),
+        **extra,
+    }
+
+
+def measure_endpoints(client, urls, statements, args):
+    """p50/p95 latency and SQL statement count per page."""
+    response = client.post('/auth/login', data={'username': BENCHMARK_USER, 'password': BENCHMARK_USER})
+    if response.status_code != 302:
+        sys.exit('Could not log in as the benchmark user')
+
+    results = {}
+    for endpoint, url in urls:
+        for _ in range(args.warmup):
+            client.get(url)
+        timings, queries = [], []
+        status = size = None
+        for _ in range(args.repeat):
+            statements[0] = 0
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+            queries.append(statements[0])
+            status, size = response.status_code, len(response.data)
+        results[endpoint] = {'url': url, 'status': status, 'bytes': size,
+                             **summarize(timings, queries=max(queries))}
+        print(f'{endpoint:32} p50 {results[endpoint]["p50_ms"]:9.2f}ms  p95 {results[endpoint]["p95_ms"]:9.2f}ms  '
+              f'{results[endpoint]["queries"]:4} queries  HTTP {status}', file=sys.stderr)
+    return results
+
+
+def startup_child():
+    """Runs in a fresh interpreter: times one cold start and prints it as JSON."""
+    started = time.perf_counter()
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    statements = [0]
+
+    def count_statement(*_):
+        statements[0] += 1
+    event.listen(Engine, 'before_cursor_execute', count_statement)
+
+    from app import create_app, db
+    from app.models import User
+    imported = time.perf_counter()
+    app = create_app('production')
+    created = time.perf_counter()
+    boot_statements = statements[0]
+
+    with app.app_context():
+        user_id = db.session.query(User.id).filter_by(username=BENCHMARK_USER).scalar()
+    client = app.test_client()
+    # جلسة مسجلة مسبقاً: زمن تجزئة كلمة المرور ليس من الإقلاع
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+        sess['_fresh'] = True
+    statements[0] = 0
+    before = time.perf_counter()
+    response = client.get('/')
+    finished = time.perf_counter()
+    print(json.dumps({
+        'import': {'ms': (imported - started) * 1000, 'queries': 0},
+        'create_app': {'ms': (created - imported) * 1000, 'queries': boot_statements},
+        'first_request': {'ms': (finished - before) * 1000, 'queries': statements[0],
+                          'status': response.status_code},
+    }))
+    return 0
+
+
+def measure_startup(args):
+    """Cold start phases over ``--repeat`` fresh interpreters."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for _ in range(args.warmup + args.repeat):
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), '--startup-child',
+                                '--database', args.database], cwd=here, capture_output=True, text=True)
+        if child.returncode != 0:
+            sys.exit(f'Startup run failed:\n{child.stderr}')
+        runs.append(json.loads(child.stdout.strip().splitlines()[-1]))
+    runs = runs[args.warmup:]
+
+    results = {}
+    for phase in STARTUP_PHASES:
+        samples = [run[phase] for run in runs]
+        results[f'startup.{phase}'] = summarize([sample['ms'] for sample in samples],
+                                                queries=max(sample['queries'] for sample in samples))
+        if 'status' in samples[-1]:
+            results[f'startup.{phase}']['status'] = samples[-1]['status']
+    total = [sum(run[phase]['ms'] for phase in STARTUP_PHASES) for run in runs]
+    results['startup.total'] = summarize(total, queries=sum(results[f'startup.{phase}']['queries']
+                                                            for phase in STARTUP_PHASES))
+    for name, result in results.items():
+        print(f'{name:32} p50 {result["p50_ms"]:9.2f}ms  p95 {result["p95_ms"]:9.2f}ms  '
+              f'{result["queries"]:4} queries', file=sys.stderr)
+    return results
+
+
+def writer_child(args):
+    """Runs in its own process: ``--writes`` shift entries the way add_shift does, one commit each."""
+    from sqlalchemy import event
+    from sqlalchemy.exc import OperationalError
+    from app import create_app, db
+    from app.models import Worker, WorkShift
+    from app.services import add_worker_hours
+
+    app = create_app('production')
+    with app.app_context():
+        statements = [0]
+
+        def count_statement(*_):
+            statements[0] += 1
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        worker_ids = [row[0] for row in db.session.query(Worker.id).order_by(Worker.id).limit(100)]
+        db.session.rollback()
+        if not worker_ids:
+            sys.exit('No workers in the database')
+
+        print('ready', flush=True)
+        sys.stdin.readline()
+        timings, queries, errors = [], [], []
+        started = time.perf_counter()
+        for i in range(args.writes):
+            worker_id = worker_ids[(os.getpid() + i) % len(worker_ids)]
+            statements[0] = 0
+            before = time.perf_counter()
+            try:
+                db.session.add(WorkShift(worker_id=worker_id, shift_type='صباحي', location='سهل', hours=1,
+                                         date=date.today(), notes='benchmark'))
+                add_worker_hours({worker_id: 1})
+                db.session.commit()
+            except OperationalError as e:
+                # غالباً "database is locked"
+                db.session.rollback()
+                errors.append(str(e.orig))
+                continue
+            timings.append((time.perf_counter() - before) * 1000)
+            queries.append(statements[0])
+        elapsed = time.perf_counter() - started
+    print(json.dumps({'timings': timings, 'queries': queries, 'errors': errors, 'elapsed': elapsed}))
+    return 0
+
+
+def measure_writes(args, database_path):
+    """Concurrent writers on copies of the SQLite database, once per entry of WRITE_MODES."""
+    if not database_path:
+        sys.exit('--writers needs a SQLite database file')
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, pragmas in WRITE_MODES.items():
+            # نسخة جديدة لكل وضع بوضع journal الافتراضي، ليبدأ الوضعان من نفس الحالة
+            target = os.path.join(tmp, f'{mode}.db')
+            source, copy = sqlite3.connect(database_path), sqlite3.connect(target)
+            source.backup(copy)
+            copy.execute('PRAGMA journal_mode=DELETE')
+            source.close()
+            copy.close()
+
+            env = os.environ.copy()
+            if pragmas is not None:
+                env['SQLITE_PRAGMAS'] = pragmas
+            children = [subprocess.Popen([sys.executable, os.path.abspath(__file__), '--writer-child',
+                                          '--database', f'sqlite:///{target}', '--writes', str(args.writes)],
+                                         cwd=here, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                         text=True)
+                        for _ in range(args.writers)]
+            for child in children:
+                if child.stdout.readline().strip() != 'ready':
+                    sys.exit(f'Writer failed to start ({mode})')
+            for child in children:
+                child.stdin.write('go\n')
+                child.stdin.flush()
+            runs = []
+            for child in children:
+                output, _ = child.communicate()
+                if child.returncode != 0:
+                    sys.exit(f'Writer failed ({mode})')
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+
+            timings = [ms for run in runs for ms in run['timings']]
+            errors = [error for run in runs for error in run['errors']]
+            wall = max(run['elapsed'] for run in runs)
+            results[f'writes.{mode}'] = summarize(
+                timings or [0.0], queries=max((q for run in runs for q in run['queries']), default=0),
+                writers=args.writers, commits=len(timings), errors=len(errors),
+                writes_per_s=round(len(timings) / wall, 1) if wall else 0.0)
+            if errors:
+                results[f'writes.{mode}']['first_error'] = errors[0]
+
+    for name, result in results.items():
+        print(f'{name:32} p50 {result["p50_ms"]:9.2f}ms  p95 {result["p95_ms"]:9.2f}ms  '
+              f'{result["writes_per_s"]:8.1f} writes/s  {result["errors"]} failed', file=sys.stderr)
+    return results
+
+
+def main():
+    args = parse_args()
+    # يجب ضبط قاعدة البيانات قبل استيراد الإعدادات
+    os.environ['DATABASE_URL'] = args.database
+    if args.startup_child:
+        return startup_child()
+    if args.writer_child:
+        return writer_child(args)
+
+    from flask import url_for
+    from sqlalchemy import event
+    from app import create_app, db
+    from app.models import User, Worker
+    from app.seed import generate_farm_data, DEFAULT_COUNTS
+
+    app = create_app('production')
+    client = app.test_client()
+
+    with app.app_context():
+        seeded = None
+        if not args.no_seed and Worker.query.first() is None:
+            counts = {name: int(count * args.scale) for name, count in DEFAULT_COUNTS.items()}
+            print(f'Seeding {args.database} ...', file=sys.stderr)
+            seeded = generate_farm_data(seasons=args.seasons, seed=args.seed, **counts)
+
+        user = User.query.filter_by(username=BENCHMARK_USER).first()
+        if user is None:
+            user = User(username=BENCHMARK_USER, email='benchmark@localhost', is_admin=True)
+            user.set_password(BENCHMARK_USER)
+            db.session.add(user)
+            db.session.commit()
+        first_worker = db.session.query(Worker.id).order_by(Worker.id).limit(1).scalar()
+        database_path = db.engine.url.database if db.engine.dialect.name == 'sqlite' else None
+
+        statements = [0]
+
+        def count_statement(*_):
+            statements[0] += 1
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+
+        with app.test_request_context():
+            urls = []
+            for endpoint, values in ENDPOINTS:
+                values = {key: first_worker if value is None else value for key, value in values.items()}
+                if None in values.values():
+                    continue
+                urls.append((endpoint, url_for(endpoint, **values)))
+
+    if args.startup:
+        results = measure_startup(args)
+    elif args.writers:
+        results = measure_writes(args, database_path)
+    else:
+        results = measure_endpoints(client, urls, statements, args)
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'database': app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1],
+        'repeat': args.repeat,
+        'seeded': seeded,
+        'endpoints': results,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['endpoints']
+        for endpoint, current in results.items():
+            previous = baseline.get(endpoint)
+            if not previous:
+                continue
+            current['baseline_p95_ms'] = previous['p95_ms']
+            current['baseline_queries'] = previous['queries']
+            slower = (current['p95_ms'] > previous['p95_ms'] * args.tolerance
+                      and current['p95_ms'] - previous['p95_ms'] > args.min_delta_ms)
+            if slower or current['queries'] > previous['queries']:
+                regressions.append(endpoint)
+        report['regressions'] = regressions
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    for endpoint in regressions:
+        current = results[endpoint]
+        print(f'REGRESSION {endpoint}: p95 {current["baseline_p95_ms"]} -> {current["p95_ms"]}ms, '
+              f'queries {current["baseline_queries"]} -> {current["queries"]}', file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,87 @@
 import os
 from datetime import timedelta
 
+def engine_options(database_uri):
+    """SQLAlchemy pool settings from the environment.
+
+    Every gunicorn worker has its own pool, so the database sees up to
+    ``workers × (DB_POOL_SIZE + DB_MAX_OVERFLOW)`` connections. Pool sizing is
+    skipped for SQLite, whose in-memory pool does not accept it.
+    """
+    options = {
+        # التحقق من الاتصال قبل استخدامه (بعد انقطاع الخادم أو إعادة تشغيله)
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    }
+    if not database_uri.startswith('sqlite'):
+        options.update(
+            pool_size=int(os.environ.get('DB_POOL_SIZE', 5)),
+            max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+            pool_timeout=int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        )
+    return options
+
+def sqlite_pragmas():
+    """PRAGMAs for every SQLite connection.
+
+    ``SQLITE_PRAGMAS`` replaces the whole set: ``off`` disables it, or a list
+    such as ``journal_mode=DELETE,synchronous=FULL``.
+    """
+    raw = os.environ.get('SQLITE_PRAGMAS', '').strip()
+    if raw.lower() in ('0', 'off', 'false', 'no'):
+        return {}
+    if raw:
+        return dict(item.strip().split('=', 1) for item in raw.split(',') if item.strip())
+    return {
+        # busy_timeout أولاً: تغيير journal_mode نفسه قد ينتظر القفل
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -int(os.environ.get('SQLITE_CACHE_SIZE_KB', 20000)),  # سالب = بالكيلوبايت
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'temp_store': 'MEMORY',
+    }
+
 class Config:
     """Base configuration"""
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///worker_management.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-change-in-production'
+    # التحقق من إصدار المخطط عند الإقلاع وتحديثه إذا تغير؛ عطّله إذا كان النشر يشغّل flask init-db
+    SCHEMA_AUTO_MIGRATE = os.environ.get('SCHEMA_AUTO_MIGRATE', 'true').lower() in ('1', 'true', 'yes')
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     SESSION_COOKIE_SAMESITE = 'Lax'
+    # وضع WAL وإعدادات الأداء لكل اتصال SQLite (لا أثر على PostgreSQL)
+    SQLITE_PRAGMAS = sqlite_pragmas()
+    # مدة تخزين إجماليات المحاسبة مؤقتاً بالثواني (0 = بدون تخزين)
+    ACCOUNTING_TOTALS_CACHE_TTL = int(os.environ.get('ACCOUNTING_TOTALS_CACHE_TTL', 0))
+    # مدة تخزين المستخدم ودوره في الذاكرة بالثواني (0 = استعلام في كل طلب، الافتراضي)؛
+    # اختياري: مع عدة عمليات gunicorn تبقى تعديلات الصلاحيات أو التعطيل من عملية أخرى
+    # غير مرئية حتى انتهاء هذه المدة، فلا تُفعّل إلا مع عملية واحدة أو قيمة قصيرة
+    AUTH_CACHE_TTL = int(os.environ.get('AUTH_CACHE_TTL', 0))
+    # بيانات المستخدم وصلاحياته في كعكة الجلسة الموقعة، تُراجع فقط عند تغير auth_version
+    AUTH_SESSION_SNAPSHOT = os.environ.get('AUTH_SESSION_SNAPSHOT', '').lower() in ('1', 'true', 'yes')
+    # قياس زمن الطلبات (Server-Timing + تسجيل الطلبات البطيئة)
+    REQUEST_TIMING = os.environ.get('REQUEST_TIMING', '').lower() in ('1', 'true', 'yes')
+    SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))
+    SLOW_REQUEST_STATEMENTS = int(os.environ.get('SLOW_REQUEST_STATEMENTS', 5))
+    # نقطة /metrics بصيغة Prometheus (تتطلب prometheus_client)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # حدود الموسم الزراعي وبداية السنة المالية (أرقام الأشهر) لفلاتر التقارير
+    SEASON_START_MONTH = int(os.environ.get('SEASON_START_MONTH', 3))
+    SEASON_END_MONTH = int(os.environ.get('SEASON_END_MONTH', 11))
+    FISCAL_YEAR_START_MONTH = int(os.environ.get('FISCAL_YEAR_START_MONTH', 1))
+    # عدد الصفوف في كل INSERT عند استيراد ملفات CSV
+    IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 1000))
+    # المزامنة مع الأجهزة: عمر الصف الأدنى قبل إرساله، وحدود الصفحة والإرسال
+    SYNC_SETTLE_SECONDS = int(os.environ.get('SYNC_SETTLE_SECONDS', 2))
+    SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', 1000))
+    SYNC_MAX_PUSH = int(os.environ.get('SYNC_MAX_PUSH', 500))
+    # لقطات التقارير في الخلفية: thread (داخل العملية)، worker (flask report-worker فقط)، inline
+    REPORT_JOB_MODE = os.environ.get('REPORT_JOB_MODE', 'thread')
+    REPORT_JOB_THREADS = int(os.environ.get('REPORT_JOB_THREADS', 2))
+    REPORT_JOB_TIMEOUT = int(os.environ.get('REPORT_JOB_TIMEOUT', 1800))  # ثوانٍ قبل إعادة مهمة عالقة
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -18,12 +92,19 @@ class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
     TESTING = False
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(Config.SQLALCHEMY_DATABASE_URI)
 
 class TestingConfig(Config):
     """Testing configuration"""
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     DEBUG = True
     TESTING = True
+    ACCOUNTING_TOTALS_CACHE_TTL = 0
+    REPORT_JOB_MODE = 'inline'
+    # قاعدة في الذاكرة: WAL وmmap بلا معنى
+    SQLITE_PRAGMAS = {'temp_store': 'MEMORY'}
+    # أقصى عدد لاستعلامات SQL في الطلب الواحد (لاكتشاف مشكلة N+1)
+    SQL_STATEMENT_LIMIT = 20
 
 config = {
     'development': DevelopmentConfig,
@@ -0,0 +1,63 @@
+"""Gunicorn settings (loaded automatically by ``gunicorn run:app``).
+
+Production profile, tuned through environment variables:
+
+    GUNICORN_WORKER_CLASS   sync, gthread (default) or gevent (needs ``pip install gevent``)
+    WEB_CONCURRENCY         worker processes (default: derived from the CPU count)
+    GUNICORN_THREADS        threads per gthread worker (default 4)
+    GUNICORN_CONNECTIONS    concurrent requests per gevent worker (default 100)
+    GUNICORN_PRELOAD        load the app once in the master before forking (default true)
+    GUNICORN_TIMEOUT        seconds before a silent worker is restarted (default 60)
+    GUNICORN_MAX_REQUESTS   restart a worker after this many requests (default 0 = never)
+
+Keep ``DB_POOL_SIZE`` at least ``GUNICORN_THREADS`` so threads do not wait
+for a connection (see ``config.engine_options``).
+"""
+import multiprocessing
+import os
+
+
+def _flag(name, default):
+    return os.environ.get(name, default).lower() in ('1', 'true', 'yes')
+
+
+cpus = multiprocessing.cpu_count()
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class == 'sync':
+    # كل عامل يخدم طلباً واحداً: عمال أكثر لتغطية انتظار قاعدة البيانات
+    workers = int(os.environ.get('WEB_CONCURRENCY', cpus * 2 + 1))
+else:
+    # صفحات التقارير تنتظر قاعدة البيانات أكثر من المعالج: خيوط/اتصالات أكثر لكل عامل
+    workers = int(os.environ.get('WEB_CONCURRENCY', cpus + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4)) if worker_class == 'gthread' else 1
+worker_connections = int(os.environ.get('GUNICORN_CONNECTIONS', 100))
+
+preload_app = _flag('GUNICORN_PRELOAD', 'true')
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')  # '-' للطباعة على stdout
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    """Drop pooled connections inherited from the master (opened while preloading the app)."""
+    if not server.cfg.preload_app:
+        return
+    from run import app
+    from app import db
+    with app.app_context():
+        for engine in db.engines.values():
+            # close=False: لا تُغلق اتصالات العملية الأم، فقط لا تُستخدم في هذا العامل
+            engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    """Drop the metric files of an exited worker (Prometheus multiprocess mode)."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,6 +1,10 @@
 import os
+import click
 from app import create_app, db
 from app.models import User
+from app.services import (rebuild_worker_ledger, create_missing_indexes, list_query_statements,
+                          explain_statement, upgrade_schema, check_stock_levels, rebuild_rollups,
+                          migrate_schema)
 
 app = create_app(os.environ.get('FLASK_ENV', 'development'))
 
@@ -10,8 +14,9 @@ def make_shell_context():
 
 @app.cli.command()
 def init_db():
-    """Initialize the database."""
-    db.create_all()
+    """Create or upgrade the database schema and record its version."""
+    for column in migrate_schema():
+        print(f'Added column {column}')
     print('Database initialized.')
 
 @app.cli.command()
@@ -33,5 +38,108 @@ def create_admin():
     
     print(f'Admin user {username} created successfully!')
 
+@app.cli.command()
+@click.option('--check', is_flag=True, help='Only report drift, do not rewrite the ledger.')
+def rebuild_ledger(check):
+    """Recompute the worker ledger from scratch and report drift."""
+    drift = rebuild_worker_ledger(fix=not check)
+    for worker, field, stored, actual in drift:
+        name = worker.name if worker else f'#{stored}'
+        print(f'  {name}: {field} ledger={stored} actual={actual}')
+    if check:
+        print(f'{len(drift)} drifted value(s) found.')
+        return
+    db.session.commit()
+    print(f'Worker ledger rebuilt ({len(drift)} drifted value(s) fixed).')
+
+@app.cli.command()
+@click.option('--explain/--no-explain', default=True, help='Print query plans before and after.')
+def create_indexes(explain):
+    """Create missing indexes on an existing database without recreating tables."""
+    statements = list_query_statements()
+    before = {name: explain_statement(stmt) for name, stmt in statements.items()} if explain else {}
+    
+    created, failed = create_missing_indexes()
+    for name in created:
+        print(f'Created index {name}')
+    for name, error in failed:
+        print(f'Could not create index {name}: {error}')
+    if not created and not failed:
+        print('All indexes already exist.')
+    
+    if explain:
+        for name, stmt in statements.items():
+            print(f'\n== {name} ==')
+            print('  before:')
+            for line in before[name]:
+                print(f'    {line}')
+            print('  after:')
+            for line in explain_statement(stmt):
+                print(f'    {line}')
+
+@app.cli.command()
+@click.option('--fix', is_flag=True, help='Overwrite quantity_on_hand with the recomputed value.')
+def check_inventory(fix):
+    """Recompute on-hand stock from consumption records and report discrepancies."""
+    for column in upgrade_schema():
+        print(f'Added column {column}')
+    issues = check_stock_levels(fix=fix)
+    for consumption_type, lot_id, stored, actual in issues:
+        print(f'  {consumption_type} #{lot_id}: on hand={stored} actual={actual}')
+    if fix:
+        db.session.commit()
+        print(f'{len(issues)} lot(s) fixed.')
+    else:
+        print(f'{len(issues)} discrepancy(ies) found.')
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Backfill the daily/monthly production and sales rollups from all records."""
+    daily, monthly = rebuild_rollups()
+    db.session.commit()
+    print(f'Rollups rebuilt: {daily} daily row(s), {monthly} monthly row(s).')
+
+@app.cli.command()
+@click.option('--seasons', default=3, show_default=True, help='Number of yearly seasons to spread the data over.')
+@click.option('--seed', type=int, default=None, help='Random seed for a reproducible dataset.')
+@click.option('--count', 'counts', multiple=True, metavar='TABLE=N',
+              help='Override a row count, e.g. --count shifts=200000 (repeatable).')
+def seed_data(seasons, seed, counts):
+    """Fill the database with a synthetic multi-season farm dataset."""
+    from app.seed import generate_farm_data, DEFAULT_COUNTS
+    overrides = {}
+    for item in counts:
+        name, _, value = item.partition('=')
+        if name not in DEFAULT_COUNTS or not value.isdigit():
+            raise click.BadParameter(f'{item} (tables: {", ".join(DEFAULT_COUNTS)})', param_hint='--count')
+        overrides[name] = int(value)
+    inserted = generate_farm_data(seasons=seasons, seed=seed, **overrides)
+    for table, rows in inserted.items():
+        print(f'  {table}: {rows}')
+    print(f'Inserted {sum(inserted.values())} rows.')
+
+@app.cli.command('import-csv')
+@click.argument('kind', type=click.Choice(['workers', 'shifts', 'attendance']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', type=int, default=None, help='Rows per INSERT (default IMPORT_BATCH_SIZE).')
+@click.option('--skip-invalid', is_flag=True, help='Import the valid rows even if some rows fail.')
+def import_csv_command(kind, path, batch_size, skip_invalid):
+    """Bulk-import workers, shifts or attendance from a CSV file."""
+    from app.imports import import_csv
+    with open(path, 'rb') as f:
+        result = import_csv(kind, f, batch_size=batch_size, skip_invalid=skip_invalid)
+    for line, message in result['errors']:
+        print(f'  line {line}: {message}')
+    status = 'Imported' if result['committed'] else 'Nothing imported,'
+    print(f"{status} {result['inserted']} of {result['rows']} row(s), {result['error_count']} error(s).")
+
+@app.cli.command('report-worker')
+@click.option('--poll', default=2.0, show_default=True, help='Seconds to wait when the queue is empty.')
+@click.option('--once', is_flag=True, help='Exit when no queued report is left.')
+def report_worker_command(poll, once):
+    """Generate queued report snapshots (use with REPORT_JOB_MODE=worker)."""
+    from app.report_jobs import work
+    work(poll_interval=poll, once=once)
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5001)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+اختبار واجهة JSON
+Test JSON API
+"""
+
+import gzip
+import json
+import sys
+from datetime import date
+from app import db, create_app
+from app.models import User, Role, Worker, WorkShift
+
+def make_app():
+    """تطبيق اختبار بمستخدم يرى العمال فقط، وعاملين وعدة نوبات"""
+    app = create_app('testing')
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        user = User(username='viewer', email='viewer@test.local',
+                    role=Role(name='viewer', permissions='view_workers'))
+        user.set_password('x')
+        workers = [Worker(name=name, hourly_rate_usd=2, hourly_rate_lbp=1000) for name in ('سمير', 'خليل')]
+        db.session.add_all([user] + workers)
+        db.session.flush()
+        db.session.add_all([WorkShift(worker_id=workers[i % 2].id, shift_type='صباحي', location='جبل',
+                                      hours=i + 1, date=date(2024, 5, i + 1), notes='ملاحظة ' * 20)
+                            for i in range(6)])
+        db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'viewer', 'password': 'x'})
+    return app, client
+
+def test_etag_not_modified():
+    """نفس المحتوى يعيد 304 بدون جسم، وأي تعديل يغير الـ ETag"""
+    print("\nاختبار ETag و 304")
+    app, client = make_app()
+    response = client.get('/api/v1/shifts')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+
+    cached = client.get('/api/v1/shifts', headers={'If-None-Match': etag})
+    assert cached.status_code == 304 and cached.data == b''
+
+    with app.app_context():
+        db.session.get(WorkShift, 1).hours = 9
+        db.session.commit()
+    changed = client.get('/api/v1/shifts', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    print("✅ ETag يعمل")
+
+def test_sparse_fields():
+    """fields يرجع الأعمدة المطلوبة فقط (مع المعرف)، وحقل غير معروف → 400"""
+    print("\nاختبار اختيار الحقول")
+    app, client = make_app()
+    data = client.get('/api/v1/shifts?fields=hours,date&worker_id=1').get_json()['data']
+    assert [sorted(row) for row in data] == [['date', 'hours', 'id']] * 3
+    assert [row['hours'] for row in data] == [5, 3, 1]  # الأحدث أولاً
+    assert client.get('/api/v1/workers/2?fields=name').get_json() == {'data': {'id': 2, 'name': 'خليل'}}
+
+    response = client.get('/api/v1/shifts?fields=hours,password')
+    assert response.status_code == 400 and 'password' in response.get_json()['error']
+    assert client.get('/api/v1/shifts?worker_id=abc').status_code == 400
+    assert client.get('/api/v1/workers/99').status_code == 404
+
+    full = client.get('/api/v1/shifts', headers={'Accept-Encoding': 'gzip'})
+    assert full.headers.get('Content-Encoding') == 'gzip'
+    assert len(json.loads(gzip.decompress(full.data))['data']) == 6
+    print("✅ الحقول المختارة فقط")
+
+def test_permissions():
+    """مورد بلا صلاحية → 403 JSON، وبدون تسجيل دخول → 401 بدل التحويل"""
+    print("\nاختبار صلاحيات الواجهة")
+    app, client = make_app()
+    for url in ('/api/v1/accounting', '/api/v1/attendance/1', '/api/v1/sync?resources=sales'):
+        response = client.get(url)
+        assert response.status_code == 403, url
+        assert response.get_json()['error'].startswith('permission required')
+    results = client.post('/api/v1/sync', json={'changes': [
+        {'client_id': 'a', 'resource': 'attendance', 'data': {'worker_id': 1, 'date': '2024-05-01'}}]}
+    ).get_json()['results']
+    assert results[0]['status'] == 'rejected'
+
+    anonymous = app.test_client()
+    response = anonymous.get('/api/v1/shifts')
+    assert response.status_code == 401 and response.get_json() == {'error': 'authentication required'}
+    print("✅ الصلاحيات مفروضة")
+
+if __name__ == '__main__':
+    try:
+        test_etag_not_modified()
+        test_sparse_fields()
+        test_permissions()
+    except Exception as e:
+        print(f"\n❌ خطأ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
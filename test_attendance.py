@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+اختبار تسجيل حضور الفريق دفعة واحدة
+Test Crew Batch Attendance
+"""
+
+import sys
+from datetime import date, time
+from app import db, create_app
+from app.models import User, Role, Worker, Attendance
+
+def make_app():
+    """تطبيق اختبار بمدير مسجل الدخول وفريق من ثلاثة عمال"""
+    app = create_app('testing')
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        admin = User(username='admin', email='admin@test.local', is_admin=True)
+        admin.set_password('x')
+        viewer = User(username='viewer', email='viewer@test.local',
+                      role=Role(name='viewer', permissions='view_attendance'))
+        viewer.set_password('x')
+        db.session.add_all([admin, viewer] + [Worker(name=name, hourly_rate_usd=2, hourly_rate_lbp=1000)
+                                              for name in ('سمير', 'خليل', 'رامي')])
+        db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'x'})
+    return app, client
+
+def test_batch_attendance():
+    """صف لكل عامل مختار، وتخطي المسجلين مسبقاً والأرقام غير الموجودة، وحالة افتراضية للقيم الغريبة"""
+    print("\nاختبار تسجيل حضور الفريق")
+    app, client = make_app()
+    with app.app_context():
+        db.session.add(Attendance(worker_id=3, date=date(2024, 5, 1), status='غائب'))
+        db.session.commit()
+
+    response = client.post('/attendance/batch', data={
+        'date': '2024-05-01', 'worker_ids': ['1', '2', '3', '99', 'x'],
+        'status-1': 'نصف يوم', 'hours-1': '4', 'check_in-1': '07:00', 'check_out-1': '11:00',
+        'status-2': 'مريض', 'hours-2': '', 'notes-2': 'متأخر', 'status-3': 'حاضر'})
+    assert response.status_code == 302
+    assert '/attendance/' in response.location
+    with app.app_context():
+        records = {a.worker_id: a for a in Attendance.query.filter_by(date=date(2024, 5, 1))}
+        assert sorted(records) == [1, 2, 3]
+        assert (records[1].status, records[1].hours_worked) == ('نصف يوم', 4)
+        assert (records[1].check_in_time, records[1].check_out_time) == (time(7), time(11))
+        assert (records[2].status, records[2].hours_worked, records[2].notes) == ('حاضر', 0, 'متأخر')
+        assert records[3].status == 'غائب'
+
+    # إعادة الإرسال لا تكرر شيئاً
+    client.post('/attendance/batch', data={'date': '2024-05-01', 'worker_ids': ['1', '2', '3']})
+    with app.app_context():
+        assert Attendance.query.count() == 3
+    print("✅ الحضور مسجل مرة واحدة لكل عامل")
+
+def test_batch_attendance_copy_and_permission():
+    """نسخ قائمة آخر يوم مسجل، ومنع من لا يملك صلاحية الإضافة"""
+    print("\nاختبار نسخ قائمة الأمس والصلاحية")
+    app, client = make_app()
+    client.post('/attendance/batch', data={'date': '2024-05-01', 'worker_ids': ['1', '2'],
+                                           'status-2': 'غائب'})
+    page = client.get('/attendance/batch?date=2024-05-02&copy=1').get_data(as_text=True)
+    assert 'تم نسخ الحالات من يوم 2024-05-01' in page
+    assert page.count('checked></td>') == 2 and page.count('<option value="غائب" selected>') == 1
+
+    viewer = app.test_client()
+    viewer.post('/auth/login', data={'username': 'viewer', 'password': 'x'})
+    response = viewer.post('/attendance/batch', data={'date': '2024-05-02', 'worker_ids': ['3']})
+    assert response.status_code == 302
+    assert viewer.get('/attendance/batch').status_code == 302
+    with app.app_context():
+        assert Attendance.query.filter_by(date=date(2024, 5, 2)).count() == 0
+    print("✅ النسخ والصلاحية يعملان")
+
+if __name__ == '__main__':
+    try:
+        test_batch_attendance()
+        test_batch_attendance_copy_and_permission()
+    except Exception as e:
+        print(f"\n❌ خطأ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
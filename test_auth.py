@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+اختبار تخزين المستخدمين وصلاحياتهم مؤقتاً
+Test Cached Authentication
+"""
+
+import sys
+from sqlalchemy import event
+from app import db, create_app
+from app.models import User, Role, SNAPSHOT_KEY, load_cached_user
+
+def make_app(**settings):
+    """تطبيق اختبار بمدير ومستخدم دوره يرى العمال فقط"""
+    app = create_app('testing')
+    app.config.update(WTF_CSRF_ENABLED=False, **settings)
+    with app.app_context():
+        db.create_all()
+        admin = User(username='admin', email='admin@test.local', is_admin=True)
+        viewer = User(username='viewer', email='viewer@test.local',
+                      role=Role(name='viewer', permissions='view_workers'))
+        db.session.add_all([admin, viewer, Role(name='accountant', permissions='view_accounting')])
+        for user in (admin, viewer):
+            user.set_password('x')
+        db.session.commit()
+    return app
+
+def login(app, username):
+    client = app.test_client()
+    client.post('/auth/login', data={'username': username, 'password': 'x'})
+    return client
+
+def edit_role(admin, role_id, name, *permissions):
+    admin.post(f'/settings/roles/{role_id}/edit', data={'name': name, **dict.fromkeys(permissions, 'on')})
+
+def test_cache_invalidated_on_change():
+    """مع AUTH_CACHE_TTL: تعديل الدور أو المستخدم يظهر في الطلب التالي دون انتظار المدة"""
+    print("\nاختبار إبطال ذاكرة المستخدمين")
+    app = make_app(AUTH_CACHE_TTL=300)
+    admin, viewer = login(app, 'admin'), login(app, 'viewer')
+    assert viewer.get('/api/v1/workers').status_code == 200
+    assert 2 in app.extensions['auth_cache']
+
+    edit_role(admin, 1, 'viewer', 'view_attendance')
+    assert viewer.get('/api/v1/workers').status_code == 403
+    assert viewer.get('/api/v1/attendance').status_code == 200
+
+    admin.post('/settings/users/2/edit', data={'username': 'viewer', 'email': 'viewer@test.local',
+                                               'role_id': '2', 'is_active': 'on'})
+    assert viewer.get('/api/v1/accounting').status_code == 200
+    assert viewer.get('/api/v1/attendance').status_code == 403
+    with app.app_context():
+        assert db.session.get(User, 2).auth_version == 2
+
+    admin.post('/settings/users/2/delete')
+    assert viewer.get('/api/v1/accounting').status_code == 401
+    print("✅ التعديلات تظهر فوراً")
+
+def test_cache_expires_for_other_processes():
+    """تعديل من عملية أخرى (لا يمر بأحداث هذه العملية) يظهر بعد انتهاء المدة أو الإبطال"""
+    print("\nاختبار مدة صلاحية الذاكرة")
+    app = make_app(AUTH_CACHE_TTL=300)
+    with app.app_context():
+        assert load_cached_user(2).role.permission_set == {'view_workers'}
+        # UPDATE مباشر كما تفعل عملية gunicorn أخرى
+        db.session.execute(Role.__table__.update().values(permissions='view_sales'))
+        db.session.commit()
+    with app.app_context():
+        assert load_cached_user(2).role.permission_set == {'view_workers'}
+        _, user_values, role_values = app.extensions['auth_cache'][2]
+        app.extensions['auth_cache'][2] = (0, user_values, role_values)
+    with app.app_context():
+        assert load_cached_user(2).role.permission_set == {'view_sales'}
+    print("✅ الذاكرة تنتهي بعد المدة")
+
+def test_session_snapshot():
+    """مع AUTH_SESSION_SNAPSHOT: لا استعلام عن الدور ما دام auth_version لم يتغير، وأي تغيير يعيد التحميل"""
+    print("\nاختبار لقطة المستخدم في الجلسة")
+    app = make_app(AUTH_SESSION_SNAPSHOT=True)
+    admin, viewer = login(app, 'admin'), login(app, 'viewer')
+    assert viewer.get('/api/v1/workers').status_code == 200
+    with viewer.session_transaction() as session:
+        assert session[SNAPSHOT_KEY]['auth_version'] == 0
+        assert session[SNAPSHOT_KEY]['permissions'] == ['view_workers']
+
+    statements = []
+    with app.app_context():
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            assert viewer.get('/api/v1/workers').status_code == 200
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+    assert not any('FROM role' in statement for statement in statements), statements
+
+    edit_role(admin, 1, 'viewer', 'view_sales')
+    assert viewer.get('/api/v1/workers').status_code == 403
+    assert viewer.get('/api/v1/sales').status_code == 200
+    with viewer.session_transaction() as session:
+        assert session[SNAPSHOT_KEY]['auth_version'] == 1
+        assert session[SNAPSHOT_KEY]['permissions'] == ['view_sales']
+
+    viewer.get('/auth/logout')
+    with viewer.session_transaction() as session:
+        assert SNAPSHOT_KEY not in session
+    viewer = login(app, 'viewer')
+    assert viewer.get('/api/v1/sales').status_code == 200
+    admin.post('/settings/users/2/delete')
+    assert viewer.get('/api/v1/sales').status_code == 401
+    print("✅ اللقطة تُحدث عند تغير الصلاحيات")
+
+if __name__ == '__main__':
+    try:
+        test_cache_invalidated_on_change()
+        test_cache_expires_for_other_processes()
+        test_session_snapshot()
+    except Exception as e:
+        print(f"\n❌ خطأ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
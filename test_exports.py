@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+اختبار تصدير القوائم والتقارير
+Test List and Report Exports
+"""
+
+import csv
+import io
+import sys
+import zipfile
+from datetime import date
+from app import db, create_app
+from app import exports
+from app.models import User, Worker, WorkerLedger, ProductType, Production, Sales
+from app.services import rebuild_rollups
+
+FORMULA = '=HYPERLINK("http://example.com","x")'
+
+def make_app():
+    """تطبيق اختبار بمدير مسجل الدخول وبيانات في كل تقرير"""
+    app = create_app('testing')
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        admin = User(username='admin', email='admin@test.local', is_admin=True)
+        admin.set_password('x')
+        worker = Worker(name=FORMULA, phone='+9613000000', hourly_rate_usd=2, hourly_rate_lbp=1000)
+        product = ProductType(name='تفاح', category='فواكه')
+        db.session.add_all([admin, worker, WorkerLedger(worker=worker, total_hours=5, earnings_usd=10),
+                            product])
+        db.session.flush()
+        db.session.add_all([
+            Production(product_type_id=product.id, location='جبل', quantity=7, date=date(2024, 5, 1),
+                       notes='@SUM(A1)'),
+            Sales(product_type_id=product.id, quantity=3, total_usd=6, total_lbp=3000, date=date(2024, 5, 2))
+        ])
+        rebuild_rollups()
+        db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'x'})
+    return app, client
+
+def read_csv(response):
+    assert response.status_code == 200, response.status_code
+    return list(csv.reader(io.StringIO(response.get_data(as_text=True).lstrip('\ufeff'))))
+
+def test_every_dataset_exports():
+    """كل قائمة وتقرير له مصدر تصدير يعمل"""
+    print("\nاختبار مصادر التصدير")
+    app, client = make_app()
+    for name in ('workers', 'shifts', 'attendance', 'production', 'sales', 'fuel', 'medicines',
+                 'consumption', 'accounting', 'workers_report', 'production_report', 'sales_report'):
+        assert name in exports._datasets, name
+        rows = read_csv(client.get(f'/export/{name}.csv'))
+        assert rows and rows[0][0], name
+
+    assert read_csv(client.get('/export/workers_report.csv'))[1][1:3] == ["'" + FORMULA, "'+9613000000"]
+    production = read_csv(client.get('/export/production_report.csv?granularity=day'))
+    assert production[1] == ['2024-05-01', 'تفاح', 'فواكه', 'جبل', '7.0', '1']
+    sales = read_csv(client.get('/export/sales_report.csv?granularity=month'))
+    assert sales[1][:5] == ['2024-05-01', 'تفاح', 'فواكه', '3.0', '6.0']
+    print("✅ جميع القوائم والتقارير قابلة للتصدير")
+
+def test_formula_cells_are_escaped():
+    """النص الذي يبدأ بـ = + - @ لا يُنفذ كصيغة في Excel"""
+    print("\nاختبار حماية الخلايا من الصيغ")
+    app, client = make_app()
+    rows = read_csv(client.get('/export/workers.csv'))
+    assert rows[1][1] == "'" + FORMULA
+    production = read_csv(client.get('/export/production.csv'))
+    assert production[1][-1] == "'@SUM(A1)"
+
+    if exports.xlsxwriter is not None:
+        response = client.get('/export/workers.xlsx')
+        assert response.status_code == 200
+        with zipfile.ZipFile(io.BytesIO(response.data)) as workbook:
+            sheet = workbook.read('xl/worksheets/sheet1.xml').decode()
+        assert '<f>' not in sheet
+    print("✅ الصيغ مكتوبة كنصوص")
+
+if __name__ == '__main__':
+    try:
+        test_every_dataset_exports()
+        test_formula_cells_are_escaped()
+    except Exception as e:
+        print(f"\n❌ خطأ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+اختبار استيراد ملفات CSV
+Test CSV Import
+"""
+
+import io
+import sys
+from datetime import date
+from app import db, create_app
+from app.imports import import_csv
+from app.models import User, Role, Worker, WorkerLedger, WorkShift, Attendance
+from app.services import rebuild_worker_ledger
+
+def make_app():
+    """تطبيق اختبار بقاعدة في الذاكرة ومستخدمين بصلاحيات مختلفة"""
+    app = create_app('testing')
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        for name, permissions in (('workers', 'add_workers'), ('attendance', 'add_attendance')):
+            role = Role(name=name, permissions=permissions)
+            user = User(username=name, email=f'{name}@test.local', role=role)
+            user.set_password('x')
+            db.session.add(user)
+        db.session.add(Worker(name='سمير', hourly_rate_usd=2, hourly_rate_lbp=100000))
+        db.session.commit()
+    return app
+
+def login(app, username):
+    client = app.test_client()
+    client.post('/auth/login', data={'username': username, 'password': 'x'})
+    return client
+
+def upload(client, kind, text):
+    data = {'kind': kind, 'file': (io.BytesIO(text.encode('utf-8')), 'data.csv')}
+    return client.post('/import/', data=data, content_type='multipart/form-data')
+
+def test_import_permissions():
+    """كل نوع استيراد يتطلب صلاحية صفحة الإدخال الخاصة به"""
+    print("\nاختبار صلاحيات الاستيراد")
+    app = make_app()
+    attendance_csv = 'worker,date,status\nسمير,2024-05-01,حاضر\n'
+
+    workers_user = login(app, 'workers')
+    assert upload(workers_user, 'attendance', attendance_csv).status_code == 302
+    assert workers_user.get('/import/?kind=attendance').status_code == 302
+    page = workers_user.get('/import/?kind=workers').get_data(as_text=True)
+    assert 'value="workers"' in page and 'value="attendance"' not in page
+    with app.app_context():
+        assert Attendance.query.count() == 0
+
+    attendance_user = login(app, 'attendance')
+    assert attendance_user.get('/import/').status_code == 200
+    assert upload(attendance_user, 'workers', 'name\nجديد\n').status_code == 302
+    assert upload(attendance_user, 'attendance', attendance_csv).status_code == 200
+    with app.app_context():
+        assert Attendance.query.count() == 1
+        assert Worker.query.count() == 1
+    print("✅ الصلاحيات تُفحص لكل نوع")
+
+def test_import_errors_and_duplicates():
+    """كل صف خاطئ أو مكرر يُبلغ برقم سطره؛ دون skip_invalid لا يُحفظ شيء"""
+    print("\nاختبار أخطاء الاستيراد والتكرار")
+    app = make_app()
+    text = ('worker,date,status,hours\n'
+            'سمير,2024-05-01,حاضر,8\n'     # سليم
+            'سمير,2024-05-01,غائب,0\n'     # مكرر داخل الملف
+            'سمير,2024-04-30,حاضر,8\n'     # مسجل مسبقاً في القاعدة
+            'مجهول,2024-05-02,حاضر,8\n'    # عامل غير موجود
+            'سمير,2024-13-01,حاضر,8\n'     # تاريخ غير صالح
+            'سمير,2024-05-03,حاضر,ثمانية\n'  # ليس رقماً
+            'سمير,2024-05-04,مريض,8\n')    # حالة غير معروفة
+    with app.app_context():
+        db.session.add(Attendance(worker_id=1, date=date(2024, 4, 30), status='حاضر'))
+        db.session.commit()
+
+        result = import_csv('attendance', io.BytesIO(text.encode('utf-8')), batch_size=2)
+        assert not result['committed'] and result['inserted'] == 0
+        assert result['rows'] == 7 and result['error_count'] == 6
+        assert sorted(line for line, _ in result['errors']) == [3, 4, 5, 6, 7, 8]
+        assert Attendance.query.count() == 1
+
+        result = import_csv('attendance', io.BytesIO(text.encode('utf-8')), batch_size=2, skip_invalid=True)
+        assert result['committed'] and result['inserted'] == 1 and result['error_count'] == 6
+        assert Attendance.query.filter_by(date=date(2024, 5, 1)).one().hours_worked == 8
+
+        # إعادة الملف نفسه: الصف السليم أصبح مسجلاً مسبقاً
+        result = import_csv('attendance', io.BytesIO(text.encode('utf-8')), skip_invalid=True)
+        assert result['inserted'] == 0 and result['error_count'] == 7
+        assert Attendance.query.count() == 2
+
+        for bad in (b'', b'\xff\xfe\x00'):
+            result = import_csv('workers', io.BytesIO(bad))
+            assert not result['committed'] and result['errors'][0][0] == 0
+    print("✅ الأخطاء والتكرار مُبلغ عنها")
+
+def test_import_keeps_ledger_consistent():
+    """استيراد العمال والنوبات يحدّث الدفتر كما يفعل الإدخال اليدوي"""
+    print("\nاختبار الدفتر بعد الاستيراد")
+    app = make_app()
+    with app.app_context():
+        db.session.add(WorkerLedger(worker_id=1))
+        db.session.commit()
+        result = import_csv('workers', io.BytesIO(
+            'الاسم,سعر الساعة ($),سعر الساعة (ل.ل)\nخليل,3,0\nرامي,,\n'.encode('utf-8')))
+        assert result['committed'] and result['inserted'] == 2
+        result = import_csv('shifts', io.BytesIO(
+            ('worker,date,shift_type,location,hours\n'
+             'سمير,2024-05-01,صباحي,جبل,4\n'
+             'خليل,2024-05-01,صباحي,سهل,5\n'
+             'سمير,2024-05-02,بعد ظهر,جبل,2\n').encode('utf-8')), batch_size=2)
+        assert result['committed'] and result['inserted'] == 3
+        assert rebuild_worker_ledger(fix=False) == []
+        balances = {ledger.worker_id: ledger.balance_usd for ledger in WorkerLedger.query}
+        assert balances == {1: 12, 2: 15, 3: 0}
+        assert [worker.total_hours for worker in Worker.query.order_by(Worker.id)] == [6, 5, 0]
+
+        # ملف مرفوض لا يغير الساعات ولا الدفتر
+        result = import_csv('shifts', io.BytesIO(
+            'worker,date,shift_type,location,hours\nسمير,2024-05-03,صباحي,جبل,4\nسمير,,صباحي,جبل,4\n'
+            .encode('utf-8')))
+        assert not result['committed']
+        assert WorkShift.query.count() == 3
+        assert rebuild_worker_ledger(fix=False) == []
+        assert db.session.get(WorkerLedger, 1).balance_usd == 12
+    print("✅ الدفتر متطابق بعد الاستيراد")
+
+if __name__ == '__main__':
+    try:
+        test_import_permissions()
+        test_import_errors_and_duplicates()
+        test_import_keeps_ledger_consistent()
+    except Exception as e:
+        print(f"\n❌ خطأ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+اختبار عدد استعلامات SQL في صفحات القوائم والتقارير
+Test SQL Query Budget of List and Report Pages
+"""
+
+import sys
+from datetime import date, timedelta
+from sqlalchemy import event
+from app import db, create_app
+from app.models import (User, Worker, WorkShift, ProductType, Production, Sales,
+                        FuelLog, Medicine, Fertilizer, Consumption, Attendance, Accounting)
+
+# صفحات القوائم والتقارير التي يجب ألا يزيد عدد استعلاماتها مع عدد الصفوف
+PAGES = [
+    '/',
+    '/workers/',
+    '/production/',
+    '/sales/',
+    '/fuel/',
+    '/medicines/',
+    '/consumption/',
+    '/attendance/',
+    '/accounting/',
+    '/accounting/report',
+    '/reports/',
+    '/reports/workers',
+    '/reports/production',
+    '/reports/sales',
+    '/reports/accounting',
+]
+
+ROWS = 30  # صفوف كافية لظهور N+1 لو لمس القالب علاقة كسولة في كل صف
+
+def seed_data():
+    """بيانات تجريبية مرتبطة ببعضها في كل جدول"""
+    admin = User(username='admin', email='admin@test.local', is_admin=True)
+    admin.set_password('admin')
+    db.session.add(admin)
+
+    product_types = [ProductType(name=f'منتج {i}', category='فواكه') for i in range(3)]
+    fuel = FuelLog(fuel_type='مازوت', liters=10000, date=date.today())
+    medicine = Medicine(name='دواء', quantity=10000, date=date.today())
+    fertilizer = Fertilizer(name='سماد', quantity=10000, date=date.today())
+    db.session.add_all(product_types + [fuel, medicine, fertilizer])
+    db.session.commit()
+
+    for i in range(ROWS):
+        day = date.today() - timedelta(days=i)
+        product_type = product_types[i % len(product_types)]
+        worker = Worker(name=f'عامل {i}', hourly_rate_usd=2, hourly_rate_lbp=100000)
+        db.session.add(worker)
+        db.session.flush()
+        db.session.add_all([
+            WorkShift(worker_id=worker.id, shift_type='صباحي', location='جبل', hours=5,
+                      date=day, product_type_id=product_type.id),
+            Attendance(worker_id=worker.id, date=day, status='حاضر', hours_worked=8),
+            Accounting(worker_id=worker.id, transaction_type='مصروف', category='سلفة',
+                       amount_usd=5, amount_lbp=50000, date=day),
+            Production(product_type_id=product_type.id, location='سهل', quantity=10, date=day),
+            Sales(product_type_id=product_type.id, quantity=5, total_usd=20, total_lbp=200000, date=day),
+            Consumption(consumption_type='وقود', fuel_id=fuel.id, quantity_consumed=1, date=day),
+            Consumption(consumption_type='دواء', medicine_id=medicine.id, quantity_consumed=1, date=day),
+            Consumption(consumption_type='سماد', fertilizer_id=fertilizer.id, quantity_consumed=1, date=day),
+        ])
+    db.session.commit()
+
+def test_query_budget():
+    """اختبار أن صفحات القوائم والتقارير ضمن حد الاستعلامات في إعدادات الاختبار"""
+    app = create_app('testing')
+    app.config['WTF_CSRF_ENABLED'] = False
+    default_limit = app.config['SQL_STATEMENT_LIMIT']
+    limits = app.config.get('SQL_STATEMENT_LIMITS') or {}
+    assert app.testing and default_limit, 'حارس الاستعلامات غير مفعل في إعدادات الاختبار'
+
+    print("=" * 50)
+    print("اختبار عدد استعلامات الصفحات")
+    print("Testing Query Budget")
+    print("=" * 50)
+
+    with app.app_context():
+        db.create_all()
+        seed_data()
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda *args: statements.append(1))
+
+    client = app.test_client()
+    response = client.post('/auth/login', data={'username': 'admin', 'password': 'admin'})
+    assert response.status_code == 302, 'فشل تسجيل الدخول'
+
+    for path in PAGES:
+        statements.clear()
+        # حارس الاستعلامات يرفع AssertionError من after_request إذا تجاوز الطلب الحد
+        response = client.get(path)
+        endpoint = app.url_map.bind('').match(path)[0]
+        limit = limits.get(endpoint, default_limit)
+        print(f"   {path}: {len(statements)} استعلام (الحد {limit})")
+        assert response.status_code == 200, f'{path} أعاد {response.status_code}'
+        assert len(statements) <= limit, f'{path} نفذ {len(statements)} استعلام (الحد {limit})'
+
+    print("\n✅ جميع الصفحات ضمن حد الاستعلامات")
+
+if __name__ == '__main__':
+    try:
+        test_query_budget()
+    except Exception as e:
+        print(f"\n❌ خطأ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
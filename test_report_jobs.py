@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+اختبار لقطات التقارير في الخلفية
+Test Background Report Snapshots
+"""
+
+import sys
+import json
+from datetime import datetime, timedelta
+from app import db, create_app
+from app import instrumentation, report_jobs
+from app.models import User, Report
+
+def make_app():
+    """تطبيق اختبار بمدير مسجل الدخول وتشغيل المهام في خيوط العملية (الوضع الافتراضي)"""
+    app = create_app('testing')
+    app.config.update(WTF_CSRF_ENABLED=False, REPORT_JOB_MODE='thread')
+    with app.app_context():
+        db.create_all()
+        admin = User(username='admin', email='admin@test.local', is_admin=True)
+        admin.set_password('x')
+        db.session.add(admin)
+        db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'x'})
+    return app, client
+
+def wait_for_jobs():
+    executor, report_jobs._executor = report_jobs._executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+def test_resume_jobs_after_restart():
+    """مهام بقيت في الانتظار أو عالقة بعد إعادة تشغيل العملية تُستأنف عند فتح صفحة التقارير"""
+    print("\nاختبار استئناف مهام التقارير بعد إعادة التشغيل")
+    app, client = make_app()
+    timeout = app.config['REPORT_JOB_TIMEOUT']
+    params = json.dumps({'url': '/reports/workers?granularity=month'})
+    with app.app_context():
+        admin = User.query.first()
+        now = datetime.utcnow()
+        # كأن العملية التي أرسلتها توقفت: لا خيط في هذه العملية يعرف عنها
+        jobs = [
+            Report(title='في الانتظار', report_type='workers', generated_by=admin.id, status='queued',
+                   params=params),
+            Report(title='عالقة', report_type='workers', generated_by=admin.id, status='running',
+                   params=params, started_at=now - timedelta(seconds=timeout + 60)),
+            Report(title='جارية', report_type='workers', generated_by=admin.id, status='running',
+                   params=params, started_at=now)
+        ]
+        db.session.add_all(jobs)
+        db.session.commit()
+        ids = [job.id for job in jobs]
+
+    assert client.get('/reports/').status_code == 200
+    wait_for_jobs()
+    with app.app_context():
+        statuses = [db.session.get(Report, report_id).status for report_id in ids]
+        assert statuses == ['done', 'done', 'running'], statuses
+        assert db.session.get(Report, ids[0]).content
+
+    status = client.get(f'/reports/snapshots/{ids[0]}/status').get_json()
+    assert status['status'] == 'done' and status['url']
+    print("✅ المهام المتروكة استؤنفت")
+
+def test_job_duration_metric():
+    """مدة توليد اللقطة في الخلفية تُسجل في farm_report_duration_seconds"""
+    if instrumentation.prometheus_client is None:
+        print("⚠️ prometheus_client غير مثبت، تم تخطي الاختبار")
+        return
+    print("\nاختبار تسجيل مدة توليد اللقطة")
+    app, client = make_app()
+    app.config['REPORT_JOB_MODE'] = 'inline'
+    instrumentation._get_metrics()
+    labels = {'report': 'report_jobs.production'}
+    registry = instrumentation.prometheus_client.REGISTRY
+    before = registry.get_sample_value('farm_report_duration_seconds_count', labels) or 0
+    client.post('/reports/snapshots/', data={'report_type': 'production'})
+    assert registry.get_sample_value('farm_report_duration_seconds_count', labels) == before + 1
+    print("✅ المدة مسجلة")
+
+if __name__ == '__main__':
+    try:
+        test_resume_jobs_after_restart()
+        test_job_duration_metric()
+    except Exception as e:
+        print(f"\n❌ خطأ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
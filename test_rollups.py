@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+اختبار جداول التجميع الزمني للإنتاج والمبيعات
+Test Production/Sales Rollups
+"""
+
+import sys
+from datetime import date
+from sqlalchemy import func, text
+from app import db, create_app
+from app.models import User, ProductType, Production, Sales, DailyRollup, MonthlyRollup, SyncTombstone
+from app.services import get_rollups, PRODUCTION, SALES
+
+DAYS = [date(2024, 1, 15), date(2024, 1, 31), date(2024, 2, 1), date(2024, 3, 10)]
+
+def make_app():
+    """تطبيق اختبار بمدير ونوعي منتج، مع تفعيل المفاتيح الأجنبية كما في Postgres"""
+    app = create_app('testing')
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.session.execute(text('PRAGMA foreign_keys=ON'))
+        db.create_all()
+        admin = User(username='admin', email='admin@test.local', is_admin=True)
+        admin.set_password('x')
+        db.session.add_all([admin, ProductType(name='تفاح'), ProductType(name='دراق')])
+        db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'x'})
+    return app, client
+
+def fresh_totals(kind, granularity):
+    """نفس الأرقام محسوبة مباشرة من السجلات بـ GROUP BY"""
+    model = Production if kind == PRODUCTION else Sales
+    location = model.location if kind == PRODUCTION else text("''")
+    revenue = (func.sum(model.total_usd), func.sum(model.total_lbp)) if kind == SALES else (text('0'), text('0'))
+    totals = {}
+    for day, product_type_id, place, quantity, usd, lbp, count in db.session.query(
+            model.date, model.product_type_id, location, func.sum(model.quantity),
+            *revenue, func.count(model.id)).group_by(model.date, model.product_type_id, location):
+        period = day.replace(day=1) if granularity == 'month' else day
+        key = (period, product_type_id, place or '-')
+        old = totals.get(key, (0, 0, 0, 0))
+        totals[key] = (old[0] + quantity, old[1] + (usd or 0), old[2] + (lbp or 0), old[3] + count)
+    return totals
+
+def rollup_totals(kind, granularity, start=None, end=None):
+    return {(row['period'], row['product_type_id'], row['location']):
+            (row['quantity'], row['revenue_usd'], row['revenue_lbp'], row['record_count'])
+            for row in get_rollups(kind, start, end, granularity)}
+
+def assert_rollups_match():
+    for kind in (PRODUCTION, SALES):
+        for granularity in ('day', 'month'):
+            assert rollup_totals(kind, granularity) == fresh_totals(kind, granularity), (kind, granularity)
+    # نطاق يبدأ وينتهي في منتصف الشهر: أشهر كاملة من الشهري والأطراف من اليومي
+    expected = {key: value for key, value in fresh_totals(PRODUCTION, 'day').items()
+                if date(2024, 1, 20) <= key[0] <= date(2024, 3, 5)}
+    partial = {}
+    for (day, product_type_id, place), value in expected.items():
+        key = (day.replace(day=1), product_type_id, place)
+        old = partial.get(key, (0, 0, 0, 0))
+        partial[key] = tuple(a + b for a, b in zip(old, value))
+    assert rollup_totals(PRODUCTION, 'month', date(2024, 1, 20), date(2024, 3, 5)) == partial
+
+def add_records(client):
+    for i, day in enumerate(DAYS):
+        for product_type_id in (1, 2):
+            client.post('/production/add', data={
+                'product_type_id': product_type_id, 'location': 'جبل' if i % 2 else 'سهل',
+                'quantity': 10 + i, 'date': day.isoformat()})
+            client.post('/sales/add', data={
+                'product_type_id': product_type_id, 'quantity': 3 + i, 'price_per_unit_usd': 2,
+                'price_per_unit_lbp': 1000, 'date': day.isoformat()})
+
+def test_rollups_match_fresh_aggregate():
+    """التجميع بعد الإضافة والحذف يساوي التجميع المباشر من السجلات"""
+    print("\nاختبار التجميع الزمني بعد الإضافة والحذف")
+    app, client = make_app()
+    add_records(client)
+    with app.app_context():
+        assert Production.query.count() == len(DAYS) * 2
+        assert_rollups_match()
+        production_id = Production.query.first().id
+        sale_ids = [sale.id for sale in Sales.query.filter_by(date=DAYS[1])]
+
+    client.post(f'/settings/admin/delete_production/{production_id}')
+    for sale_id in sale_ids:
+        client.post(f'/settings/admin/delete_sale/{sale_id}')
+    with app.app_context():
+        assert Production.query.count() == len(DAYS) * 2 - 1
+        assert Sales.query.filter_by(date=DAYS[1]).count() == 0
+        assert_rollups_match()
+    print("✅ التجميع مطابق للسجلات")
+
+def test_delete_product_type_drops_rollups():
+    """حذف نوع منتج يحذف صفوف تجميعه بدل خرق المفتاح الأجنبي أو ترك أرقام قديمة"""
+    print("\nاختبار حذف نوع منتج له صفوف تجميع")
+    app, client = make_app()
+    add_records(client)
+    response = client.delete('/settings/product_type/1')
+    assert response.status_code == 200, response.status_code
+    with app.app_context():
+        assert db.session.get(ProductType, 1) is None
+        assert Production.query.filter_by(product_type_id=1).count() == 0
+        assert SyncTombstone.query.filter_by(table_name='production').count() == len(DAYS)
+        assert SyncTombstone.query.filter_by(table_name='sales').count() == len(DAYS)
+        for model in (DailyRollup, MonthlyRollup):
+            assert model.query.filter_by(product_type_id=1).count() == 0
+            assert model.query.filter_by(product_type_id=2).count() > 0
+        assert_rollups_match()
+    print("✅ صفوف التجميع حُذفت مع نوع المنتج")
+
+if __name__ == '__main__':
+    try:
+        test_rollups_match_fresh_aggregate()
+        test_delete_product_type_drops_rollups()
+    except Exception as e:
+        print(f"\n❌ خطأ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
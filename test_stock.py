@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+اختبار المخزون الدائم (quantity_on_hand)
+Test Perpetual Inventory
+"""
+
+import os
+import sys
+import tempfile
+import threading
+from datetime import date
+import config
+from config import Config, TestingConfig
+from app import db, create_app
+from app.models import User, FuelLog, Medicine, Consumption
+from app.services import InsufficientStockError, check_stock_levels, get_stock_levels, FUEL, MEDICINE
+
+LOT_COLUMNS = {FUEL: 'fuel_id', MEDICINE: 'medicine_id'}
+
+class FileTestingConfig(TestingConfig):
+    """ملف SQLite حقيقي بإعدادات الإنتاج (WAL و busy_timeout) ليتسابق عدة اتصالات"""
+    SQLITE_PRAGMAS = Config.SQLITE_PRAGMAS
+
+def make_app(path=None):
+    if path is None:
+        app = create_app('testing')
+    else:
+        FileTestingConfig.SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+        config.config['testing_file'] = FileTestingConfig
+        app = create_app('testing_file')
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        admin = User(username='admin', email='admin@test.local', is_admin=True)
+        admin.set_password('x')
+        db.session.add_all([admin, FuelLog(fuel_type='مازوت', liters=100, date=date.today())])
+        db.session.commit()
+    return app
+
+def consume(lot_id, quantity, consumption_type=FUEL):
+    db.session.add(Consumption(consumption_type=consumption_type, quantity_consumed=quantity,
+                               date=date.today(), **{LOT_COLUMNS[consumption_type]: lot_id}))
+    db.session.commit()
+
+def test_insufficient_stock():
+    """استهلاك أكبر من المتبقي يُرفض دون حفظ أي شيء، والمتبقي تماماً يُقبل"""
+    print("\nاختبار رفض الاستهلاك الزائد")
+    app = make_app()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'x'})
+    form = {'consumption_type': FUEL, 'fuel_id': '1', 'date': date.today().isoformat()}
+
+    response = client.post('/consumption/add', data={**form, 'quantity_consumed': '101'})
+    assert response.location.endswith('/consumption/add')
+    with app.app_context():
+        assert Consumption.query.count() == 0
+        assert get_stock_levels(FUEL) == {1: 100}
+        try:
+            consume(1, 100.5)
+            assert False, 'InsufficientStockError expected'
+        except InsufficientStockError:
+            db.session.rollback()
+
+    response = client.post('/consumption/add', data={**form, 'quantity_consumed': '100'})
+    assert response.location.endswith('/consumption/')
+    with app.app_context():
+        assert get_stock_levels(FUEL) == {1: 0}
+        assert check_stock_levels() == []
+        # الحذف يعيد الكمية
+        db.session.delete(Consumption.query.one())
+        db.session.commit()
+        assert get_stock_levels(FUEL) == {1: 100}
+    print("✅ لا يمكن سحب أكثر من المتبقي")
+
+def test_lot_without_on_hand():
+    """دفعة قديمة بلا quantity_on_hand تُحسب من سجل الاستهلاك ولا تتجاوز المتبقي"""
+    print("\nاختبار دفعة بلا quantity_on_hand")
+    app = make_app()
+    with app.app_context():
+        db.session.add(Medicine(name='دواء', quantity=50, date=date.today()))
+        db.session.commit()
+        consume(1, 20, MEDICINE)
+        Medicine.query.update({Medicine.quantity_on_hand: None})
+        db.session.commit()
+
+        try:
+            consume(1, 31, MEDICINE)
+            assert False, 'InsufficientStockError expected'
+        except InsufficientStockError:
+            db.session.rollback()
+        consume(1, 30, MEDICINE)
+        assert get_stock_levels(MEDICINE) == {1: 0}
+        assert check_stock_levels() == []
+    print("✅ الدفعة القديمة محمية")
+
+def test_concurrent_decrements():
+    """عدة طلبات متزامنة على نفس الدفعة: لا يُسحب أكثر من الكمية ولا يضيع خصم"""
+    print("\nاختبار الخصم المتزامن")
+    workers, quantity = 8, 30
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(os.path.join(directory, 'stock.db'))
+        barrier = threading.Barrier(workers)
+        outcomes = []
+
+        def run():
+            with app.app_context():
+                barrier.wait()
+                try:
+                    consume(1, quantity)
+                    outcomes.append('ok')
+                except InsufficientStockError:
+                    db.session.rollback()
+                    outcomes.append('insufficient')
+                finally:
+                    db.session.remove()
+
+        threads = [threading.Thread(target=run) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with app.app_context():
+            assert sorted(outcomes) == ['insufficient'] * 5 + ['ok'] * 3, outcomes
+            assert Consumption.query.count() == 3
+            assert get_stock_levels(FUEL) == {1: 10}
+            assert check_stock_levels() == []
+            db.engine.dispose()
+    print("✅ الخصم المتزامن صحيح")
+
+if __name__ == '__main__':
+    try:
+        test_insufficient_stock()
+        test_lot_without_on_hand()
+        test_concurrent_decrements()
+    except Exception as e:
+        print(f"\n❌ خطأ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+اختبار المزامنة التفاضلية للأجهزة الميدانية
+Test Delta Sync for Field Devices
+"""
+
+import io
+import sys
+from datetime import date, datetime, timedelta
+from app import db, create_app
+from app.imports import ShiftImporter, import_csv
+from app.models import User, Worker, WorkShift, Attendance, SyncReceipt
+
+def make_app():
+    """تطبيق اختبار بمدير مسجل الدخول وعامل واحد"""
+    app = create_app('testing')
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        admin = User(username='admin', email='admin@test.local', is_admin=True)
+        admin.set_password('x')
+        db.session.add_all([admin, Worker(name='سمير', hourly_rate_usd=2, hourly_rate_lbp=1000)])
+        db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'x'})
+    return app, client
+
+def add_shift(updated_at, hours=5):
+    shift = WorkShift(worker_id=1, shift_type='صباحي', location='جبل', hours=hours, date=date.today())
+    db.session.add(shift)
+    db.session.flush()
+    shift.updated_at = updated_at
+    db.session.commit()
+    return shift.id
+
+def pull(client, token=''):
+    response = client.get(f'/api/v1/sync?resources=shifts&token={token}')
+    assert response.status_code == 200, response.status_code
+    data = response.get_json()
+    return [row['id'] for row in data['changes']['shifts']], data['token']
+
+def test_settle_window_boundary():
+    """صف أحدث من نافذة الاستقرار لا يُرسل بعد، ويُرسل مرة واحدة في السحب التالي"""
+    print("\nاختبار حدود نافذة الاستقرار")
+    app, client = make_app()
+    app.config['SYNC_SETTLE_SECONDS'] = 60
+    with app.app_context():
+        now = datetime.utcnow()
+        settled = add_shift(now - timedelta(seconds=120))
+        fresh = add_shift(now)
+
+    ids, token = pull(client)
+    assert ids == [settled]
+    # بعد مرور النافذة (هنا: نافذة صفرية) يصل الصف المتأخر دون تكرار السابق
+    app.config['SYNC_SETTLE_SECONDS'] = 0
+    ids, token = pull(client, token)
+    assert ids == [fresh]
+    assert pull(client, token)[0] == []
+    print("✅ لا صفوف مفقودة ولا مكررة عند حد النافذة")
+
+def test_import_rows_stamped_at_commit():
+    """صفوف الاستيراد تأخذ وقت الحفظ، فلا تفوت جهازاً زامن أثناء استيراد طويل"""
+    print("\nاختبار ختم وقت الحفظ على صفوف الاستيراد")
+    app, client = make_app()
+    app.config['SYNC_SETTLE_SECONDS'] = 0
+    _, token = pull(client)
+
+    # كأن الدفعة الأولى أُدخلت قبل ساعة من الحفظ، أي قبل آخر مزامنة للجهاز
+    parse = ShiftImporter.parse
+    flushed = datetime.utcnow() - timedelta(hours=1)
+    ShiftImporter.parse = lambda self, row: {**parse(self, row), 'updated_at': flushed}
+    try:
+        with app.app_context():
+            result = import_csv('shifts', io.BytesIO(
+                'worker,date,shift_type,location,hours\nسمير,2024-05-01,صباحي,جبل,4\n'.encode()))
+            assert result['committed'], result
+            imported = [shift.id for shift in WorkShift.query]
+    finally:
+        ShiftImporter.parse = parse
+
+    ids, _ = pull(client, token)
+    assert ids == imported
+    print("✅ صفوف الاستيراد تصل بعد الحفظ")
+
+def push(client, changes):
+    response = client.post('/api/v1/sync', json={'changes': changes})
+    assert response.status_code == 200, response.status_code
+    return [(result['status'], result.get('id')) for result in response.get_json()['results']]
+
+def test_push_is_idempotent():
+    """إعادة إرسال نفس الدفعة لا تكرر شيئاً ولا تضيف ساعات مرتين"""
+    print("\nاختبار تكرار الإرسال من الجهاز")
+    app, client = make_app()
+    shift = {'worker_id': 1, 'date': '2024-05-01', 'shift_type': 'صباحي', 'location': 'جبل', 'hours': 4}
+    batch = [
+        {'client_id': 'dev1-1', 'resource': 'shifts', 'data': shift},
+        {'client_id': 'dev1-2', 'resource': 'attendance', 'data': {'worker': 'سمير', 'date': '2024-05-01'}},
+        {'client_id': 'dev1-1', 'resource': 'shifts', 'data': shift},
+        {'client_id': 'dev1-3', 'resource': 'shifts', 'data': {**shift, 'hours': 30}},
+        {'client_id': '', 'resource': 'shifts', 'data': shift},
+        {'client_id': 'dev1-4', 'resource': 'sales', 'data': {}}
+    ]
+    results = push(client, batch)
+    assert [status for status, _ in results] == ['created', 'created', 'duplicate', 'rejected', 'rejected',
+                                                 'rejected']
+    assert results[2] == ('duplicate', results[0][1])
+
+    resent = push(client, batch)
+    assert resent[:3] == [('duplicate', results[0][1]), ('duplicate', results[1][1]), ('duplicate', results[0][1])]
+    # حضور لنفس العامل واليوم من جهاز آخر: تعارض مع السجل الموجود
+    other = push(client, [{'client_id': 'dev2-1', 'resource': 'attendance',
+                           'data': {'worker_id': 1, 'date': '2024-05-01', 'status': 'غائب'}}])
+    assert other == [('conflict', results[1][1])]
+
+    with app.app_context():
+        assert WorkShift.query.count() == 1 and Attendance.query.count() == 1
+        assert SyncReceipt.query.count() == 2
+        assert db.session.get(Worker, 1).total_hours == 4
+    print("✅ الإرسال المكرر بلا أثر")
+
+def test_pull_reports_deletions():
+    """الحذف العادي والحذف الجماعي يصلان كشواهد حذف مرة واحدة"""
+    print("\nاختبار شواهد الحذف في السحب")
+    app, client = make_app()
+    app.config['SYNC_SETTLE_SECONDS'] = 0
+    with app.app_context():
+        db.session.add(Worker(name='خليل', hourly_rate_usd=2, hourly_rate_lbp=1000))
+        db.session.commit()
+        first = add_shift(datetime.utcnow())
+        second = add_shift(datetime.utcnow())
+        db.session.add(WorkShift(worker_id=2, shift_type='صباحي', location='سهل', hours=3, date=date.today()))
+        db.session.commit()
+
+    def pull_all(token=''):
+        data = client.get(f'/api/v1/sync?resources=shifts,workers&token={token}').get_json()
+        return data['deleted'], data['token']
+
+    deleted, token = pull_all()
+    assert deleted == {}
+    with app.app_context():
+        db.session.delete(db.session.get(WorkShift, first))
+        db.session.commit()
+    client.post('/settings/admin/delete_worker/2')
+
+    deleted, token = pull_all(token)
+    assert deleted == {'shifts': [first, 3], 'workers': [2]}
+    assert pull_all(token)[0] == {}
+    ids, _ = pull(client)
+    assert ids == [second]
+    print("✅ المحذوفات تصل للأجهزة")
+
+if __name__ == '__main__':
+    try:
+        test_settle_window_boundary()
+        test_import_rows_stamped_at_commit()
+        test_push_is_idempotent()
+        test_pull_reports_deletions()
+    except Exception as e:
+        print(f"\n❌ خطأ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
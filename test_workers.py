@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+اختبار العمال ودفتر أرصدتهم
+Test Workers and Worker Ledger
+"""
+
+import sys
+from datetime import date
+from app import db, create_app
+from app.models import User, Worker, WorkerLedger, WorkShift, Accounting, ProductType
+from app.services import get_worker_balances, get_balance_totals, rebuild_worker_ledger
+
+def make_app():
+    """تطبيق اختبار بقاعدة في الذاكرة ومدير مسجل الدخول"""
+    app = create_app('testing')
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        admin = User(username='admin', email='admin@test.local', is_admin=True)
+        admin.set_password('x')
+        db.session.add(admin)
+        db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'x'})
+    return app, client
+
+def test_list_totals_cover_all_workers():
+    """صف الإجمالي في قائمة العمال يشمل كل العمال وليس الصفحة المعروضة فقط"""
+    print("\nاختبار إجماليات قائمة العمال مع الترقيم")
+    app, client = make_app()
+    with app.app_context():
+        for i in range(5):
+            worker = Worker(name=f'عامل {i}', hourly_rate_usd=2, hourly_rate_lbp=1000)
+            db.session.add_all([worker, WorkerLedger(worker=worker, total_hours=10, earnings_usd=20,
+                                                     earnings_lbp=10000, advances_usd=5, advances_lbp=0,
+                                                     balance_usd=15, balance_lbp=10000)])
+        # عامل قديم بلا صف في الدفتر يُحسب من التجميع المباشر
+        legacy = Worker(name='قديم', hourly_rate_usd=3, hourly_rate_lbp=0, total_hours=4)
+        db.session.add(legacy)
+        db.session.flush()
+        db.session.add(WorkShift(worker_id=legacy.id, shift_type='صباحي', location='جبل', hours=4,
+                                 date=date.today()))
+        db.session.add(Accounting(worker_id=legacy.id, transaction_type='مصروف', category='سلفة',
+                                  amount_usd=2, amount_lbp=0, date=date.today()))
+        db.session.commit()
+
+        _, expected = get_worker_balances()
+        assert get_balance_totals() == expected
+        assert expected['total_workers'] == 6
+        assert expected['total_all_balance_usd'] == 5 * 15 + (4 * 3 - 2)
+
+    page = client.get('/workers/?per_page=2').get_data(as_text=True)
+    assert 'الإجمالي لجميع العمال (6)' in page
+    assert '$85.00' in page
+    print("✅ الإجماليات لكل العمال")
+
+def test_ledger_follows_writes():
+    """الدفتر يطابق التجميع من المصدر بعد كل إضافة وتعديل وحذف"""
+    print("\nاختبار تطابق دفتر العمال مع المصدر")
+    app, client = make_app()
+
+    def assert_consistent(step, balances):
+        with app.app_context():
+            assert rebuild_worker_ledger(fix=False) == [], step
+            ledgers = WorkerLedger.query.order_by(WorkerLedger.worker_id)
+            assert [ledger.balance_usd for ledger in ledgers] == balances, step
+
+    for name in ('سمير', 'خليل'):
+        client.post('/workers/add', data={'name': name, 'hourly_rate_usd': '2', 'hourly_rate_lbp': '1000'})
+    assert_consistent('add worker', [0, 0])
+    client.post('/workers/1/add_shift', data={'shift_type': 'صباحي', 'location': 'جبل', 'hours': '6',
+                                               'date': '2024-05-01'})
+    assert_consistent('add shift', [12, 0])
+
+    advance = {'transaction_type': 'مصروف', 'category': 'سلفة', 'amount_usd': '5', 'amount_lbp': '0',
+               'date': '2024-05-02', 'worker_id': '1'}
+    client.post('/accounting/add', data=advance)
+    assert_consistent('add advance', [7, 0])
+    client.post('/accounting/1/edit', data={**advance, 'amount_usd': '3', 'worker_id': '2'})
+    assert_consistent('move advance', [12, -3])
+    client.post('/accounting/1/delete')
+    assert_consistent('delete advance', [12, 0])
+    client.post('/workers/1/edit', data={'name': 'سمير', 'hourly_rate_usd': '4', 'hourly_rate_lbp': '1000'})
+    assert_consistent('edit rate', [24, 0])
+    client.post('/settings/admin/delete_worker/1')
+    assert_consistent('delete worker', [0])
+
+    with app.app_context():
+        accounts, _ = get_worker_balances()
+        assert [account['worker'].name for account in accounts] == ['خليل']
+        assert WorkerLedger.query.count() == 1
+    print("✅ الدفتر متطابق بعد كل عملية")
+
+def add_crew(count=3):
+    """عمال بدفاتر فارغة كما تنشئهم صفحة الإضافة"""
+    workers = [Worker(name=f'عامل {i}', hourly_rate_usd=2, hourly_rate_lbp=1000, total_hours=0)
+               for i in range(count)]
+    db.session.add_all(workers + [WorkerLedger(worker=worker) for worker in workers])
+    db.session.add(ProductType(name='تفاح'))
+    db.session.commit()
+    return [worker.id for worker in workers]
+
+def test_batch_shifts():
+    """نوبة لفريق: صف لكل عامل، وتحديث الساعات والدفتر، وساعات خاصة لكل عامل"""
+    print("\nاختبار إدخال نوبة لفريق")
+    app, client = make_app()
+    with app.app_context():
+        ids = add_crew()
+    response = client.post('/workers/shifts/batch', data={
+        'date': '2024-05-01', 'shift_type': 'صباحي', 'location': 'جبل', 'product_type_id': '1',
+        'hours': '6', 'worker_ids': [str(i) for i in ids], f'hours-{ids[1]}': '3', f'hours-{ids[2]}': '0'})
+    assert response.status_code == 302
+    with app.app_context():
+        shifts = {shift.worker_id: shift.hours for shift in WorkShift.query}
+        assert shifts == {ids[0]: 6, ids[1]: 3}
+        assert db.session.get(Worker, ids[0]).total_hours == 6
+        assert db.session.get(Worker, ids[2]).total_hours == 0
+        accounts, _ = get_worker_balances([ids[0], ids[1]])
+        assert [account['balance_usd'] for account in accounts] == [12, 6]
+    print("✅ النوبات والساعات محدثة")
+
+def test_batch_shifts_rejects_invalid_fields():
+    """نوع نوبة أو موقع فارغ أو منتج غير موجود: رسالة خطأ دون حفظ أي نوبة"""
+    print("\nاختبار رفض حقول النوبة غير الصالحة")
+    app, client = make_app()
+    with app.app_context():
+        ids = add_crew()
+    valid = {'date': '2024-05-01', 'shift_type': 'صباحي', 'location': 'جبل', 'hours': '5',
+             'worker_ids': [str(i) for i in ids]}
+    for invalid in ({'shift_type': ''}, {'location': ''}, {'location': 'بحر'}, {'product_type_id': '99'},
+                    {'date': ''}):
+        response = client.post('/workers/shifts/batch', data={**valid, **invalid})
+        assert response.status_code == 302, invalid
+        assert response.location.endswith('/workers/shifts/batch'), invalid
+    with app.app_context():
+        assert WorkShift.query.count() == 0
+        assert sum(worker.total_hours for worker in Worker.query) == 0
+    print("✅ الحقول غير الصالحة مرفوضة")
+
+if __name__ == '__main__':
+    try:
+        test_list_totals_cover_all_workers()
+        test_ledger_follows_writes()
+        test_batch_shifts()
+        test_batch_shifts_rejects_invalid_fields()
+    except Exception as e:
+        print(f"\n❌ خطأ: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)